@@ -1,4 +1,50 @@
+"""
+Builds a context pack ("preprompt") of the project's text files for an AI model.
+
+The files under the given paths (default: the whole repository) are walked
+recursively, honouring every .gitignore on the way, and read in parallel. Binary
+files, lockfiles and the files in EXCLUDE_FILES are left out. Sections are written
+to the output file as they come in, in path order, so memory stays flat however
+large the tree is.
+
+Tokens are counted with tiktoken (pip install -r playground/requirements.txt); its
+encoding is downloaded once and cached, see TIKTOKEN_CACHE_DIR. Without tiktoken
+the script fails, unless --approximate is given: a regex tokenizer then splits
+text like cl100k_base's pre-tokenizer and counts long runs as several tokens,
+which tends to overcount rather than undercount. The output never exceeds
+--budget tokens: a file that doesn't fit is skipped and reported, and smaller
+files after it may still go in. The output file is replaced atomically, so a
+failed build leaves the previous pack in place.
+
+Files are cached in --cache-dir (PackCache): their content by hash and their token
+count by path, mtime and size, so a rebuild reads and tokenizes only the files
+that changed. Each run reports its token and cost difference to the previous pack
+written to the same output.
+
+With --question, the files are instead split into chunks of about CHUNK_LINES
+lines and indexed for BM25 search (RelevanceIndex, kept next to the cache); only
+the --top chunks (or whole files, with --files) ranking highest for the question
+go in, best first and still within the budget, so the pack grows with the
+question rather than with the repository.
+
+Usage: python3 playground/preprompt.py [PATH ...] [--budget N] [--output FILE]
+    [--question TEXT [--top N] [--files]] [--cache-dir DIR | --no-cache]
+    [--approximate]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import math
 import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 PRE_PROMPT = """
 These files represent a collection of documents from my project directory. They encompass various aspects of the
@@ -8,87 +54,896 @@ based on this prompt, the AI should reference and consider the content of these
 information. The goal is to have a more informed and context-aware interaction.
 """
 
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Files to exclude, by name
+EXCLUDE_FILES = {
+    "config.txt",
+    "output.txt",
+    "preprompt_output.txt",
+    "MANUAL.md",
+    "util.js",
+    ".env",
+    ".env.example",
+    ".gitignore",
+    ".npmignore",
+}
+# Directories never walked, ignored or not
+SKIP_DIRS = {".git", "node_modules"}
+LOCKFILES = {
+    "package-lock.json",
+    "pnpm-lock.yaml",
+    "yarn.lock",
+    "npm-shrinkwrap.json",
+    "bun.lockb",
+    "Cargo.lock",
+    "poetry.lock",
+    "Pipfile.lock",
+    "composer.lock",
+    "Gemfile.lock",
+    "go.sum",
+}
+# Bytes sniffed for a NUL byte to tell binary files apart
+BINARY_SNIFF_BYTES = 8192
+MAX_FILE_BYTES = 1024 * 1024
+
+DEFAULT_BUDGET = 30000  # tokens, leaves room for the answer in a 32k context
+DEFAULT_ENCODING = "cl100k_base"
+READ_WORKERS = 8
+CACHE_DIR = os.path.join(REPO_DIR, "playground", ".cache")
+# Cached files no build has seen for CACHE_MAX_AGE seconds are dropped, and the
+# least recently seen ones while the cached contents exceed CACHE_MAX_BYTES
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+COST_PER_1K_TOKENS = 0.06  # gpt4-32k, input
+# mkstemp creates files readable by the owner only
+FILE_MODE = 0o644
+
 
-def fetch_files_content(directory, exclude_files):
+# Atomic writes
+
+
+@contextlib.contextmanager
+def atomic_file(path, mode="wb"):
     """
-    Fetch the content of all files in the given directory excluding the ones in exclude_files list.
+    Opens a temporary file next to path, and renames it over path when the block
+    exits without an exception (the temporary file is removed otherwise), so an
+    interrupted build never leaves a partial file behind.
     """
-    contents = {}
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    encoding = None if "b" in mode else "utf-8"
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_atomic(path, content):
+    """Atomically writes content (bytes, or str written as UTF-8) to path."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    with atomic_file(path) as f:
+        f.write(content)
+
+
+# Gitignore
+
+
+def _translate(pattern):
+    """A gitignore glob as a regex source, matching a whole relative path."""
+    i, n, out = 0, len(pattern), []
+    while i < n:
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == n:
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            out.append(f"[{chars}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text, base):
+    """
+    The rules of a .gitignore in directory base (relative to the walk root, "" for
+    the root itself), as (base, regex, negate, dir_only) tuples.
+    """
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # a slash anywhere but at the end anchors the pattern to the file's directory
+        anchored = "/" in line
+        line = line.lstrip("/")
+        source = _translate(line)
+        if not anchored:
+            source = "(?:.*/)?" + source
+        rules.append((base, re.compile(source + r"\Z"), negate, dir_only))
+    return rules
+
+
+def is_ignored(rules, rel_path, is_dir):
+    """Whether rel_path is ignored by rules; like git, the last matching rule wins."""
+    ignored = False
+    for base, regex, negate, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if base:
+            if not rel_path.startswith(base + "/"):
+                continue
+            path = rel_path[len(base) + 1 :]
+        else:
+            path = rel_path
+        if regex.match(path):
+            ignored = not negate
+    return ignored
+
+
+def parent_rules(root, rel_dir):
+    """The rules of the .gitignore files in root and the directories above rel_dir."""
+    rules, base = [], ""
+    for part in rel_dir.split("/")[:-1] if rel_dir else []:
+        rules += _read_gitignore(root, base)
+        base = f"{base}/{part}" if base else part
+    if rel_dir:
+        rules += _read_gitignore(root, base)
+    return rules
 
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        if os.path.isfile(filepath) and filename not in exclude_files:
-            with open(filepath, "r", encoding="utf-8", errors="ignore") as file:
-                contents[filename] = file.read()
 
-    return contents
+def _read_gitignore(root, rel_dir):
+    try:
+        with open(
+            os.path.join(root, rel_dir, ".gitignore"), "r", encoding="utf-8"
+        ) as f:
+            return parse_gitignore(f.read(), rel_dir)
+    except OSError:
+        return []
 
 
-def create_ai_prompt(contents):
+def walk(root, rules=(), rel_dir=""):
     """
-    Create a prompt for an AI model listing the contents of the files.
+    Yields the paths, relative to root, of the files under root/rel_dir that aren't
+    gitignored, in sorted order. Ignored directories aren't descended into. rules are
+    those of the directories above rel_dir (parent_rules).
     """
-    prompt = PRE_PROMPT + "\nContext from files:\n\n"
+    directory = os.path.join(root, rel_dir)
+    rules = list(rules) + _read_gitignore(root, rel_dir)
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name not in SKIP_DIRS and not is_ignored(rules, rel_path, True):
+                yield from walk(root, rules, rel_path)
+        elif entry.is_file() and not is_ignored(rules, rel_path, False):
+            yield rel_path
 
-    for filename, content in contents.items():
-        prompt += f"--- {filename} ---\n"
-        prompt += content + "\n\n"
 
-    return prompt
+# Tokenizer
+
+# cl100k_base pre-tokenization; re has no \p{L}, so letters are [^\W\d_] and
+# (?:[^\s\w]|_) is anything but letters, digits and whitespace
+_PRETOKEN = re.compile(
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)"
+    r"|(?:[^\r\n\w]|_)?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?(?:[^\s\w]|_)+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+# Characters of a pre-token counted as one token by the regex tokenizer
+_REGEX_TOKEN_CHARS = 5
+
+
+def _count_regex(text):
+    tokens = 0
+    for match in _PRETOKEN.finditer(text):
+        piece = match.group().lstrip(" ")
+        tokens += -(-len(piece) // _REGEX_TOKEN_CHARS) if piece else 1
+    return tokens
+
+
+def load_tokenizer(encoding=DEFAULT_ENCODING, approximate=False):
+    """
+    Returns (name, count) where count(text) is the number of tokens in text. With
+    approximate, the regex tokenizer is used instead of tiktoken.
+    """
+    if approximate:
+        return "regex", _count_regex
+    try:
+        import tiktoken
+    except ImportError as e:
+        raise RuntimeError(
+            "tiktoken is not installed (pip install -r playground/requirements.txt); "
+            "pass --approximate to count tokens without it"
+        ) from e
+    try:
+        tokenizer = tiktoken.get_encoding(encoding)
+    except Exception as e:
+        # the encoding isn't cached and there's no network
+        raise RuntimeError(
+            f"Could not load the tiktoken encoding {encoding} ({e}); pass "
+            "--approximate to count tokens without it"
+        ) from e
+    return (
+        f"tiktoken {encoding}",
+        lambda text: len(tokenizer.encode(text, disallowed_special=())),
+    )
+
+
+# Cache
+
+
+class PackCache:
+    """
+    Persistent cache of the files of a pack, in cache_dir:
+
+    - objects/<sha256>: the content of a file, shared by identical files
+    - index.json: per path, the mtime, size and content hash it was read with and
+      its section's token count (or why it was left out), and per output file the
+      tokens and files of the last pack written there
+
+    A file whose mtime and size match its entry is served from the cache without
+    being read. A file that changed is read and hashed, and only tokenized if its
+    content changed too. Entries remember when a build last saw their file, so
+    packs of other paths don't evict each other; on save, entries not seen for
+    max_age seconds are dropped, then the least recently seen ones until the
+    contents fit in max_bytes, and finally the objects no entry refers to. Token
+    counts are only kept for one tokenizer.
+    """
+
+    VERSION = 2
+
+    def __init__(
+        self, cache_dir, tokenizer, max_age=CACHE_MAX_AGE, max_bytes=CACHE_MAX_BYTES
+    ):
+        self.cache_dir = cache_dir
+        self.tokenizer = tokenizer
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.files = {}
+        self.packs = {}
+        self.hits = 0
+        self.misses = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(cache_dir, "index.json"), "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == self.VERSION:
+            self.packs = index.get("packs", {})
+            if index.get("tokenizer") == tokenizer:
+                self.files = index.get("files", {})
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.cache_dir, "objects", content_hash)
+
+    def lookup(self, rel_path, stat):
+        """
+        The cached (content or None, tokens, reason, content hash) of an unchanged
+        file, None if it has to be read.
+        """
+        entry = self.files.get(rel_path)
+        with self._lock:
+            self._seen.add(rel_path)
+        if (
+            entry is None
+            or entry["mtime_ns"] != stat.st_mtime_ns
+            or entry["size"] != stat.st_size
+        ):
+            return None
+        content = None
+        if entry["reason"] is None:
+            try:
+                with open(self._object_path(entry["hash"]), "rb") as f:
+                    content = f.read().decode("utf-8")
+            except (OSError, UnicodeDecodeError):
+                return None
+        with self._lock:
+            self.hits += 1
+        return content, entry["tokens"], entry["reason"], entry["hash"]
+
+    def cached_tokens(self, rel_path, content_hash):
+        """The token count of rel_path if its content is still content_hash."""
+        entry = self.files.get(rel_path)
+        if entry is not None and entry["hash"] == content_hash and not entry["reason"]:
+            return entry["tokens"]
+        return None
+
+    def store(self, rel_path, stat, data, content_hash, tokens, reason=None):
+        """Records a file read from disk, data being its bytes."""
+        if reason is None and not os.path.exists(self._object_path(content_hash)):
+            write_atomic(self._object_path(content_hash), data)
+        with self._lock:
+            self.misses += 1
+            self.files[rel_path] = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "hash": content_hash,
+                "tokens": tokens,
+                "reason": reason,
+                "seen_at": time.time(),
+            }
+
+    def _prune(self):
+        """
+        Marks the entries this build saw as seen now and drops the expired and,
+        beyond max_bytes, the least recently seen others.
+        """
+        now = time.time()
+        for rel_path in self._seen:
+            if rel_path in self.files:
+                self.files[rel_path]["seen_at"] = now
+        kept = {}
+        object_bytes = 0
+        objects = set()
+        for rel_path, entry in sorted(
+            self.files.items(), key=lambda item: item[1]["seen_at"], reverse=True
+        ):
+            if now - entry["seen_at"] > self.max_age:
+                break
+            new_object = entry["reason"] is None and entry["hash"] not in objects
+            if (
+                new_object
+                and object_bytes + entry["size"] > self.max_bytes
+                and rel_path not in self._seen
+            ):
+                continue
+            if new_object:
+                objects.add(entry["hash"])
+                object_bytes += entry["size"]
+            kept[rel_path] = entry
+        self.files = kept
+
+    def save(self, output=None, report=None):
+        """
+        Writes the index, remembering report as the last pack written to output,
+        and prunes the entries (see the class docstring).
+        """
+        self._prune()
+        if output is not None:
+            self.packs[os.path.abspath(output)] = {
+                "tokens": report["tokens"],
+                "files": dict(report["included"]),
+            }
+        index = {
+            "version": self.VERSION,
+            "tokenizer": self.tokenizer,
+            "files": self.files,
+            "packs": self.packs,
+        }
+        write_atomic(
+            os.path.join(self.cache_dir, "index.json"),
+            json.dumps(index, separators=(",", ":")).encode("utf-8"),
+        )
+        referenced = {entry["hash"] for entry in self.files.values()}
+        objects_dir = os.path.join(self.cache_dir, "objects")
+        for name in os.listdir(objects_dir) if os.path.isdir(objects_dir) else []:
+            if name not in referenced:
+                os.remove(os.path.join(objects_dir, name))
+
+    def previous_pack(self, output):
+        """{"tokens", "files": {path: tokens}} of the last pack written to output."""
+        return self.packs.get(os.path.abspath(output))
+
+
+def pack_delta(previous, report):
+    """
+    How the pack in report differs from the previous one: the token difference and
+    the files added, removed and changed (whose token count changed).
+    """
+    files = dict(report["included"])
+    previous_files = previous["files"]
+    return {
+        "tokens": report["tokens"] - previous["tokens"],
+        "added": sorted(set(files) - set(previous_files)),
+        "removed": sorted(set(previous_files) - set(files)),
+        "changed": sorted(
+            path
+            for path in files.keys() & previous_files.keys()
+            if files[path] != previous_files[path]
+        ),
+    }
+
+
+# Relevance
+
+# Identifiers and their camelCase / snake_case parts
+_IDENTIFIER = re.compile(r"[A-Za-z][A-Za-z0-9]*(?:_[A-Za-z0-9]+)*")
+_WORD_PART = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from",
+    "how", "i", "if", "in", "is", "it", "of", "on", "or", "the", "this", "to",
+    "what", "when", "where", "which", "why", "with",
+    "async", "await", "const", "else", "export", "function", "import", "let",
+    "new", "return", "var",
+}  # fmt: skip
+# Lines per chunk; chunks end at a blank line once they're half this long
+CHUNK_LINES = 40
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_TOP = 20
+
+
+def terms(text):
+    """
+    The search terms of text: lowercased words, and identifiers both whole and split
+    into their camelCase / snake_case parts, without stopwords.
+    """
+    found = []
+    for identifier in _IDENTIFIER.findall(text):
+        parts = _WORD_PART.findall(identifier)
+        if len(parts) > 1:
+            found.append(identifier.lower().replace("_", ""))
+        found += (part.lower() for part in parts)
+    return [term for term in found if len(term) > 1 and term not in STOPWORDS]
+
+
+def chunk_lines(lines, chunk_lines=CHUNK_LINES):
+    """The (start, end) line numbers, 1-based and inclusive, of the chunks of lines."""
+    chunks = []
+    start = 1
+    for number, line in enumerate(lines, start=1):
+        length = number - start + 1
+        if length >= chunk_lines or (length >= chunk_lines // 2 and not line.strip()):
+            chunks.append((start, number))
+            start = number + 1
+    if start <= len(lines):
+        chunks.append((start, len(lines)))
+    return chunks
+
+
+class RelevanceIndex:
+    """
+    BM25 index of file chunks, kept in path (a JSON file) if given:
+
+    - files: per path, the content hash it was indexed at and its chunks as
+      [start, end, length in terms, {term: count}]
+    - chunks and postings: the inverted index over all chunks, [path, start, end,
+      length] and {term: [[chunk number, count], ...]}
+
+    Only files whose hash changed are re-chunked (update); the postings are rebuilt
+    from the files after any change. The path of a file counts as part of each of
+    its chunks, so "raffle" finds src/raffle.ts.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path
+        self.files = {}
+        self.chunks = []
+        self.postings = {}
+        self._dirty = False
+        self._seen = set()
+        if path is None:
+            return
+        try:
+            with open(path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == self.VERSION:
+            self.files = index["files"]
+            self.chunks = index["chunks"]
+            self.postings = index["postings"]
+
+    def update(self, rel_path, content_hash, content):
+        """Indexes a file, unless it's indexed at content_hash already."""
+        self._seen.add(rel_path)
+        entry = self.files.get(rel_path)
+        if entry is not None and entry["hash"] == content_hash:
+            return
+        path_terms = terms(rel_path)
+        lines = content.splitlines()
+        chunks = []
+        for start, end in chunk_lines(lines):
+            chunk_terms = path_terms + terms("\n".join(lines[start - 1 : end]))
+            counts = {}
+            for term in chunk_terms:
+                counts[term] = counts.get(term, 0) + 1
+            chunks.append([start, end, len(chunk_terms), counts])
+        self.files[rel_path] = {"hash": content_hash, "chunks": chunks}
+        self._dirty = True
+
+    def retain(self):
+        """Drops the files not updated since the index was loaded."""
+        removed = self.files.keys() - self._seen
+        for rel_path in removed:
+            del self.files[rel_path]
+        self._dirty = self._dirty or bool(removed)
+
+    def _build_postings(self):
+        self.chunks = []
+        self.postings = {}
+        for rel_path, entry in sorted(self.files.items()):
+            for start, end, length, counts in entry["chunks"]:
+                number = len(self.chunks)
+                self.chunks.append([rel_path, start, end, length])
+                for term, count in counts.items():
+                    self.postings.setdefault(term, []).append([number, count])
+        self._dirty = False
+
+    def save(self):
+        if self._dirty:
+            self._build_postings()
+        if self.path is None:
+            return
+        index = {
+            "version": self.VERSION,
+            "files": self.files,
+            "chunks": self.chunks,
+            "postings": self.postings,
+        }
+        write_atomic(
+            self.path, json.dumps(index, separators=(",", ":")).encode("utf-8")
+        )
+
+    def search(self, question):
+        """The chunks matching question as (score, path, start, end), best first."""
+        if self._dirty:
+            self._build_postings()
+        if not self.chunks:
+            return []
+        average_length = sum(chunk[3] for chunk in self.chunks) / len(self.chunks)
+        scores = {}
+        for term in set(terms(question)):
+            postings = self.postings.get(term, [])
+            idf = math.log(
+                1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for number, count in postings:
+                length = self.chunks[number][3]
+                scores[number] = scores.get(number, 0.0) + idf * count * (
+                    BM25_K1 + 1
+                ) / (
+                    count
+                    + BM25_K1 * (1 - BM25_B + BM25_B * length / max(average_length, 1))
+                )
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, *self.chunks[number][:3]) for number, score in ranked]
+
+
+def ranked_sections(index, question, root, granularity="chunk"):
+    """
+    Yields (label, section text) for the chunks, or with granularity "file" the
+    whole files, that match question, best first.
+    """
+    yielded = set()
+    for _, rel_path, start, end in index.search(question):
+        if granularity == "file":
+            if rel_path in yielded:
+                continue
+            yielded.add(rel_path)
+            label = rel_path
+        else:
+            label = f"{rel_path}:{start}-{end}"
+        try:
+            with open(os.path.join(root, rel_path), "r", encoding="utf-8") as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        if granularity != "file":
+            content = "\n".join(content.splitlines()[start - 1 : end])
+        yield label, section(label, content)
+
+
+# Builder
+
+
+def section(filename, content):
+    return f"--- {filename} ---\n{content}\n\n"
+
+
+def read_file(root, rel_path, count_tokens, max_bytes=MAX_FILE_BYTES, cache=None):
+    """
+    Reads one file, or takes it from cache. Returns (rel_path, content or None,
+    tokens of its section, reason, content hash), reason saying why a file was left
+    out.
+    """
+    name = os.path.basename(rel_path)
+    if name in EXCLUDE_FILES:
+        return rel_path, None, 0, "excluded", None
+    if name in LOCKFILES or name.endswith(".lock"):
+        return rel_path, None, 0, "lockfile", None
+    path = os.path.join(root, rel_path)
+    try:
+        stat = os.stat(path)
+        if stat.st_size > max_bytes:
+            return rel_path, None, 0, "too large", None
+        cached = cache.lookup(rel_path, stat) if cache is not None else None
+        if cached is not None:
+            return (rel_path, *cached)
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return rel_path, None, 0, f"unreadable ({e.strerror})", None
+    content_hash = hashlib.sha256(data).hexdigest()
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        content = None
+    else:
+        try:
+            content = data.decode("utf-8")
+        except UnicodeDecodeError:
+            content = None
+    if content is None:
+        if cache is not None:
+            cache.store(rel_path, stat, data, content_hash, 0, "binary")
+        return rel_path, None, 0, "binary", content_hash
+    tokens = cache.cached_tokens(rel_path, content_hash) if cache is not None else None
+    if tokens is None:
+        tokens = count_tokens(section(rel_path, content))
+    if cache is not None:
+        cache.store(rel_path, stat, data, content_hash, tokens)
+    return rel_path, content, tokens, None, content_hash
+
+
+def read_in_order(files, read, workers=READ_WORKERS):
+    """
+    Yields read(file) for every file, in order, reading up to workers files at a
+    time and holding at most a few results per worker in memory.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file in files:
+            pending.append(executor.submit(read, file))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def build(
+    paths,
+    output,
+    budget=DEFAULT_BUDGET,
+    workers=READ_WORKERS,
+    encoding=DEFAULT_ENCODING,
+    root=REPO_DIR,
+    cache_dir=CACHE_DIR,
+    question=None,
+    top=DEFAULT_TOP,
+    granularity="chunk",
+    approximate=False,
+):
+    """
+    Writes the context pack of the files under paths (relative to root) to output,
+    caching files in cache_dir unless it's None. With a question, only the top
+    chunks (or files, see ranked_sections) most relevant to it go in, ranked by a
+    RelevanceIndex kept in cache_dir. Returns a report: {"tokenizer", "tokens",
+    "included": [(path, tokens)], "skipped": [(path, reason)], "cache": {"hits",
+    "misses"} or None, "delta": pack_delta to the previous pack or None}.
+    """
+    start = time.perf_counter()
+    tokenizer_name, count_tokens = load_tokenizer(encoding, approximate)
+    cache = PackCache(cache_dir, tokenizer_name) if cache_dir is not None else None
+    if question is None:
+        header = PRE_PROMPT + "\nContext from files:\n\n"
+    else:
+        header = PRE_PROMPT + f"\nContext from the files relevant to: {question}\n\n"
+    report = {
+        "tokenizer": tokenizer_name,
+        "tokens": count_tokens(header),
+        "characters": len(header),
+        "included": [],
+        "skipped": [],
+    }
+    if report["tokens"] > budget:
+        raise ValueError(f"The budget of {budget} tokens doesn't fit the header")
+
+    def files():
+        for path in paths:
+            rel_path = os.path.relpath(os.path.join(root, path), root)
+            rel_path = "" if rel_path == "." else rel_path.replace(os.sep, "/")
+            if os.path.isdir(os.path.join(root, rel_path)):
+                yield from walk(root, parent_rules(root, rel_path), rel_path)
+            else:
+                yield rel_path
+
+    def add(f, label, text, tokens):
+        if report["tokens"] + tokens > budget:
+            report["skipped"].append((label, f"over budget ({tokens} tokens)"))
+            return False
+        f.write(text)
+        report["tokens"] += tokens
+        report["characters"] += len(text)
+        report["included"].append((label, tokens))
+        return True
+
+    results = read_in_order(
+        files(),
+        lambda rel_path: read_file(root, rel_path, count_tokens, MAX_FILE_BYTES, cache),
+        workers,
+    )
+    with atomic_file(output, "w") as f:
+        f.write(header)
+        if question is None:
+            for rel_path, content, tokens, reason, _ in results:
+                if reason is not None:
+                    report["skipped"].append((rel_path, reason))
+                else:
+                    add(f, rel_path, section(rel_path, content), tokens)
+        else:
+            index = RelevanceIndex(
+                os.path.join(cache_dir, "bm25.json") if cache_dir is not None else None
+            )
+            for rel_path, content, _, reason, content_hash in results:
+                if reason is not None:
+                    report["skipped"].append((rel_path, reason))
+                else:
+                    index.update(rel_path, content_hash, content)
+            index.retain()
+            index.save()
+            included = 0
+            for label, text in ranked_sections(index, question, root, granularity):
+                if included == top:
+                    break
+                included += add(f, label, text, count_tokens(text))
+
+    report["cache"] = report["delta"] = None
+    if cache is not None:
+        previous = cache.previous_pack(output)
+        if previous is not None:
+            report["delta"] = pack_delta(previous, report)
+        cache.save(output, report)
+        report["cache"] = {"hits": cache.hits, "misses": cache.misses}
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Builds a token-budgeted context pack of the project's files."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=["."],
+        help="Files and directories to include, relative to the repository root "
+        "(default: all of it).",
+    )
+    parser.add_argument("--output", default="preprompt_output.txt")
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=DEFAULT_BUDGET,
+        help=f"Maximum tokens of the output (default: {DEFAULT_BUDGET}).",
+    )
+    parser.add_argument(
+        "--question",
+        "-q",
+        help="Only include the chunks most relevant to this question.",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=DEFAULT_TOP,
+        help=f"With --question, the most chunks or files included (default: {DEFAULT_TOP}).",
+    )
+    parser.add_argument(
+        "--files",
+        action="store_true",
+        help="With --question, include whole files rather than chunks.",
+    )
+    parser.add_argument("--workers", type=int, default=READ_WORKERS)
+    parser.add_argument(
+        "--cache-dir",
+        default=CACHE_DIR,
+        help="Directory of the file cache (default: playground/.cache).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Read and tokenize every file, without reading or updating the cache.",
+    )
+    parser.add_argument(
+        "--encoding",
+        default=DEFAULT_ENCODING,
+        help=f"tiktoken encoding (default: {DEFAULT_ENCODING}).",
+    )
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="Count tokens with a regex tokenizer instead of tiktoken, which tends "
+        "to overcount.",
+    )
+    return parser.parse_args(argv)
 
 
 def main():
-    # Directory above the current script
-    parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-    # Files to exclude
-    exclude_files = [
-        "config.txt",
-        "output.txt",
-        "MANUAL.md",
-        "package-lock.json",
-        "util.js",
-        ".env",
-        ".env.example",
-        ".gitignore",
-        ".npmignore",
-    ]  # Add more filenames to this list as needed
-
-    # Fetch contents
-    contents = fetch_files_content(parent_directory, exclude_files)
-
-    # Create AI prompt
-    prompt = create_ai_prompt(contents)
-
-    # Output to a .txt file
-    with open("preprompt_output.txt", "w", encoding="utf-8") as output_file:
-        output_file.write(prompt)
+    args = parse_args()
+    try:
+        report = build(
+            args.paths,
+            args.output,
+            args.budget,
+            args.workers,
+            args.encoding,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            question=args.question,
+            top=args.top,
+            granularity="file" if args.files else "chunk",
+            approximate=args.approximate,
+        )
+    except RuntimeError as e:
+        sys.exit(f"Error: {e}")
 
     # Display processed files
     print("Processed files:")
-    for filename in contents.keys():
-        print(f"- {filename}")
+    for filename, tokens in report["included"]:
+        print(f"- {filename} ({tokens} tokens)")
 
     # Display ignored files
     print("\nIgnored files:")
-    for filename in exclude_files:
-        print(f"- {filename}")
-
-    # Display total characters and words
-    total_characters = sum(len(content) for content in contents.values())
-    total_words = sum(len(content.split()) for content in contents.values())
-    print(f"\nTotal characters: {total_characters}")
-    print(f"Total words: {total_words}")
+    for filename, reason in report["skipped"]:
+        print(f"- {filename}: {reason}")
 
-    # Display total tokens (assuming a token is a word or punctuation mark separated by spaces)
-    total_tokens = total_words * 1.33
-    print(f"Total tokens: {total_tokens:.0f}")
+    print(f"\nTotal characters: {report['characters']}")
+    print(f"Total tokens: {report['tokens']} of {args.budget} ({report['tokenizer']})")
 
     # Calculate the cost of the prompt
-    cost_per_1ktoken = 0.06
-    cost = total_tokens / 1000 * cost_per_1ktoken
+    cost = report["tokens"] / 1000 * COST_PER_1K_TOKENS
     print(f"Cost for gpt4-32k: ${cost:.2f}")
 
+    delta = report["delta"]
+    if delta is not None:
+        delta_cost = delta["tokens"] / 1000 * COST_PER_1K_TOKENS
+        print(
+            f"Since the last pack: {delta['tokens']:+d} tokens "
+            f"({'-' if delta_cost < 0 else '+'}${abs(delta_cost):.2f}), "
+            f"{len(delta['added'])} files added, {len(delta['removed'])} removed, "
+            f"{len(delta['changed'])} changed"
+        )
+        for label in ("added", "removed", "changed"):
+            for filename in delta[label]:
+                print(f"  {label}: {filename}")
+    if report["cache"] is not None:
+        print(
+            f"Cache: {report['cache']['hits']} files unchanged, "
+            f"{report['cache']['misses']} read"
+        )
+    print(f"Built in {report['seconds'] * 1000:.0f} ms")
+
 
 if __name__ == "__main__":
     main()
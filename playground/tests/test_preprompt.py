@@ -0,0 +1,140 @@
+import pytest
+
+import preprompt
+
+
+def ignored(gitignore, rel_path, is_dir=False, base=""):
+    return preprompt.is_ignored(
+        preprompt.parse_gitignore(gitignore, base), rel_path, is_dir
+    )
+
+
+def test_last_matching_rule_wins():
+    assert ignored("*.log\n!keep.log", "debug.log")
+    assert not ignored("*.log\n!keep.log", "keep.log")
+    # a negation before the rule it would undo has no effect
+    assert ignored("!keep.log\n*.log", "keep.log")
+    assert ignored("*.log\n!keep.log\nkeep.log", "logs/keep.log")
+
+
+def test_comments_and_blank_lines_are_not_rules():
+    assert not ignored("# *.log\n\n", "debug.log")
+    assert ignored("\\#notes", "#notes")
+
+
+@pytest.mark.parametrize(
+    "gitignore, rel_path, expected",
+    [
+        # a pattern without a slash matches at any depth
+        ("build", "build", True),
+        ("build", "src/build", True),
+        # a leading or inner slash anchors it to the .gitignore's directory
+        ("/build", "build", True),
+        ("/build", "src/build", False),
+        ("docs/*.md", "docs/a.md", True),
+        ("docs/*.md", "src/docs/a.md", False),
+        ("docs/*.md", "docs/api/a.md", False),
+        ("**/temp", "a/b/temp", True),
+        ("**/temp", "temp", True),
+        ("docs/**", "docs/api/a.md", True),
+        ("a/**/b", "a/x/y/b", True),
+        ("file?.txt", "file1.txt", True),
+        ("file?.txt", "file10.txt", False),
+        ("[!a]*.py", "b.py", True),
+        ("[!a]*.py", "a.py", False),
+    ],
+)
+def test_anchoring_and_globs(gitignore, rel_path, expected):
+    assert ignored(gitignore, rel_path) == expected
+
+
+def test_directory_rules_only_match_directories():
+    assert ignored("out/", "out", is_dir=True)
+    assert not ignored("out/", "out", is_dir=False)
+    assert ignored("out/", "src/out", is_dir=True)
+
+
+def test_rules_apply_under_their_own_directory_only():
+    assert ignored("*.txt", "sub/notes.txt", base="sub")
+    assert not ignored("*.txt", "notes.txt", base="sub")
+    assert not ignored("/notes.txt", "sub/deeper/notes.txt", base="sub")
+
+
+def write(root, files):
+    for rel_path, content in files.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def test_walk_honours_nested_gitignores(tmp_path):
+    write(
+        tmp_path,
+        {
+            ".gitignore": "*.log\ndist/\n",
+            "a.py": "",
+            "debug.log": "",
+            "dist/bundle.js": "",
+            "src/.gitignore": "!keep.log\n/generated.py\n",
+            "src/keep.log": "",
+            "src/generated.py": "",
+            "src/main.py": "",
+            "src/lib/generated.py": "",
+        },
+    )
+
+    assert list(preprompt.walk(str(tmp_path))) == [
+        ".gitignore",
+        "a.py",
+        "src/.gitignore",
+        "src/keep.log",
+        "src/lib/generated.py",
+        "src/main.py",
+    ]
+    # a walk from a subdirectory applies the .gitignore files above it
+    rules = preprompt.parent_rules(str(tmp_path), "src/lib")
+    assert preprompt.is_ignored(rules, "src/lib/debug.log", False)
+
+
+def test_budget_is_never_exceeded(tmp_path):
+    root = tmp_path / "repo"
+    _, count = preprompt.load_tokenizer(approximate=True)
+    small = "word " * 20
+    large = "word " * 400
+    write(root, {"a.txt": small, "b.txt": large, "c.txt": small})
+    header_tokens = count(preprompt.PRE_PROMPT + "\nContext from files:\n\n")
+    section_tokens = count(preprompt.section("a.txt", small))
+    # room for both small files, not for the large one between them
+    budget = header_tokens + 2 * section_tokens + 1
+    output = tmp_path / "pack.txt"
+
+    report = preprompt.build(
+        ["."],
+        str(output),
+        budget=budget,
+        root=str(root),
+        cache_dir=None,
+        approximate=True,
+    )
+
+    assert report["tokenizer"] == "regex"
+    assert [path for path, _ in report["included"]] == ["a.txt", "c.txt"]
+    assert [path for path, _ in report["skipped"]] == ["b.txt"]
+    assert report["skipped"][0][1].startswith("over budget")
+    assert report["tokens"] <= budget
+    assert "--- b.txt ---" not in output.read_text()
+
+
+def test_budget_smaller_than_the_header_fails(tmp_path):
+    output = tmp_path / "pack.txt"
+
+    with pytest.raises(ValueError, match="doesn't fit the header"):
+        preprompt.build(
+            ["."],
+            str(output),
+            budget=10,
+            root=str(tmp_path),
+            cache_dir=None,
+            approximate=True,
+        )
+    assert not output.exists()
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the data refresh scripts. Run from src/data, e.g.
+python3 -m benchmarks.token_join
+python3 -m benchmarks.refresh  (end to end, against benchmarks/mock_upstream.py)
+"""
@@ -0,0 +1,363 @@
+"""
+Upstream fixtures for benchmarks/mock_upstream.py.
+
+The fixtures stand in for everything the refresh scripts download: ethereum-lists
+chain and icon files, the coingecko asset platforms, coin list and per-platform
+token lists, the moralis top tokens and the uniswap token list. They are built
+from the data files in src/data, so the responses look like what upstream served
+when those files were generated, and can be saved to and loaded from a directory
+to pin a snapshot.
+
+build_fixtures(..., chains=N) with N above the number of chains in
+contracts.json adds synthetic chains cloned from the real ones, to measure the
+scripts at scales they don't run at yet.
+
+Each chain gets a few rpcs with a role that the mock rpc nodes act out (see RPC_ROLES);
+chain files refer to them as "mock-rpc://<host>/<chainId>/<role>", which the mock
+server rewrites to its own address.
+"""
+
+import hashlib
+import json
+import os
+import random
+
+# upstreams the mock server stands in for, with the production host whose rate
+# limit budget they get (see pipeline/rate_limit.py)
+UPSTREAMS = {
+    "github": "raw.githubusercontent.com",
+    "coingecko": "api.coingecko.com",
+    "coingecko-tokens": "tokens.coingecko.com",
+    "moralis": "deep-index.moralis.io",
+    "uniswap": "gateway.ipfs.io",
+}
+
+# live: answers, slow: answers late, lagging: is behind on blocks,
+# wrong: serves another chain, dead: drops the connection
+RPC_ROLES = ("live", "slow", "lagging", "wrong", "dead")
+RPC_SCHEME = "mock-rpc://"
+
+SYNTHETIC_CHAIN_ID_BASE = 7_000_000_000
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+# tokens per platform list served for chains without top tokens
+PLATFORM_LIST_SIZE = 300
+TOP_TOKENS_SIZE = 100
+# every so many tokens of a chain, the token's contract disagrees with the listed
+# decimals, for token verification to find
+MISREPORTED_EVERY = 25
+
+
+def _address(*parts):
+    return "0x" + hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def _platform_id(chain_id):
+    return f"mock-chain-{chain_id}"
+
+
+def _json(data):
+    return json.dumps(data).encode()
+
+
+class Fixtures:
+    """
+    The responses of every upstream, as {upstream: {path: body}}, plus the
+    contracts.json the scripts are run against and the token metadata the mock
+    rpc nodes answer calls with.
+    """
+
+    def __init__(self, routes, contracts, tokens=None):
+        self.routes = routes
+        self.contracts = contracts
+        self.tokens = tokens or {}
+
+    def get(self, upstream, path):
+        return self.routes.get(upstream, {}).get(path)
+
+    @property
+    def chain_ids(self):
+        return list(self.contracts)
+
+    def save(self, fixtures_dir):
+        for upstream, routes in self.routes.items():
+            for path, body in routes.items():
+                file_path = os.path.join(fixtures_dir, upstream, path.lstrip("/"))
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, "wb") as f:
+                    f.write(body)
+        with open(os.path.join(fixtures_dir, "contracts.json"), "w") as f:
+            json.dump(self.contracts, f, indent="\t")
+        with open(os.path.join(fixtures_dir, "rpc_tokens.json"), "w") as f:
+            json.dump(self.tokens, f, indent="\t")
+
+    @classmethod
+    def load(cls, fixtures_dir):
+        routes = {}
+        for upstream in UPSTREAMS:
+            root = os.path.join(fixtures_dir, upstream)
+            for dir_path, _, file_names in os.walk(root):
+                for file_name in file_names:
+                    file_path = os.path.join(dir_path, file_name)
+                    path = "/" + os.path.relpath(file_path, root).replace(os.sep, "/")
+                    with open(file_path, "rb") as f:
+                        routes.setdefault(upstream, {})[path] = f.read()
+        with open(os.path.join(fixtures_dir, "contracts.json")) as f:
+            contracts = json.load(f)
+        try:
+            with open(os.path.join(fixtures_dir, "rpc_tokens.json")) as f:
+                tokens = json.load(f)
+        except FileNotFoundError:
+            tokens = {}
+        return cls(routes, contracts, tokens)
+
+
+def _load_data(data_dir):
+    def load(name):
+        with open(os.path.join(data_dir, name)) as f:
+            return json.load(f)
+
+    return (
+        load("contracts.json"),
+        load("chainDetails.json"),
+        {entry["chainId"]: entry for entry in load("tokenDetails.json")},
+    )
+
+
+def _scaled_chains(contracts, chain_details, token_details, size):
+    """
+    [(chain_id, contract entry, chain details, tokens)] for size chains: the real
+    ones first, then synthetic clones of them.
+    """
+    real = [
+        (
+            chain_id,
+            contracts[chain_id],
+            chain_details[chain_id],
+            token_details.get(chain_id, {}).get("tokens", []),
+        )
+        for chain_id in contracts
+        if chain_id in chain_details
+    ]
+    chains = real[:size]
+    for i in range(max(0, size - len(real))):
+        _, contract, details, tokens = real[i % len(real)]
+        chain_id = str(SYNTHETIC_CHAIN_ID_BASE + i)
+        details = {
+            **details,
+            "name": f"{details['name']} Clone {i}",
+            "shortName": f"{details.get('shortName', 'chain')}-clone-{i}",
+            "chainId": chain_id,
+            "networkId": int(chain_id),
+        }
+        tokens = [
+            {
+                **token,
+                "address": (
+                    token["address"]
+                    if token["address"] == ZERO_ADDRESS
+                    else _address(chain_id, token["address"])
+                ),
+            }
+            for token in tokens
+        ]
+        chains.append(
+            (chain_id, {**contract, "name": f"mock-chain-{i}"}, details, tokens)
+        )
+    return chains
+
+
+def build_fixtures(data_dir, chains=None, filler_coins=15_000, seed=0, rpc_hosts=4):
+    """
+    Fixtures for the chains in data_dir (or chains of them, padded with synthetic
+    ones). filler_coins unrelated coins are added to the coingecko coin list to
+    give it a realistic size.
+
+    Every tenth chain has no coingecko platform and every fiftieth synthetic chain
+    has no ethereum-lists file. A third of the chains have an ethereum-lists icon,
+    a third a cryptocurrency-icons svg and the rest none. The mock rpc nodes know
+    every token of every chain, a few of them with other decimals than listed
+    (MISREPORTED_EVERY).
+    """
+    rng = random.Random(seed)
+    contracts, chain_details, token_details = _load_data(data_dir)
+    if chains is None:
+        chains = len(contracts)
+    scaled = _scaled_chains(contracts, chain_details, token_details, chains)
+
+    github, coingecko, coingecko_tokens, moralis, uniswap = (
+        {} for _ in range(len(UPSTREAMS))
+    )
+    platforms = []
+    coins = {}
+    rpc_tokens = {}
+    for i, (chain_id, _, details, tokens) in enumerate(scaled):
+        icon_name = details.get("shortName", chain_id).lower().replace(" ", "-")
+        rpc_roles = ["live", "live", "slow", "dead"]
+        if i % 5 == 4:
+            rpc_roles += ["lagging", "wrong"]
+        chain_file = {
+            key: value
+            for key, value in details.items()
+            if key not in ("mainnet", "icon", "rpc")
+        }
+        chain_file.update(
+            {
+                "chainId": int(chain_id),
+                "icon": icon_name,
+                "rpc": [
+                    f"{RPC_SCHEME}{(i + j) % rpc_hosts}/{chain_id}/{role}"
+                    for j, role in enumerate(rpc_roles)
+                ],
+            }
+        )
+        for key in ("faucets", "explorers"):
+            chain_file.setdefault(key, [])
+        chain_file.setdefault("infoURL", "")
+        synthetic = int(chain_id) >= SYNTHETIC_CHAIN_ID_BASE
+        if not (synthetic and i % 50 == 49):
+            github[f"/chains/eip155-{chain_id}.json"] = _json(chain_file)
+
+        if i % 3 == 0:
+            github[f"/icons/{icon_name}.json"] = _json(
+                [
+                    {
+                        "url": f"ipfs://Qm{hashlib.sha1(icon_name.encode()).hexdigest()}",
+                        "width": 512,
+                        "height": 512,
+                        "format": "svg",
+                    }
+                ]
+            )
+        elif i % 3 == 1:
+            github[f"/crypto/{icon_name}.svg"] = (
+                b'<svg xmlns="http://www.w3.org/2000/svg" width="32" height="32"/>'
+            )
+
+        # what the chain's contracts return, see MISREPORTED_EVERY
+        rpc_tokens[chain_id] = {
+            token["address"].lower(): {
+                "decimals": int(token["decimals"])
+                + (1 if n % MISREPORTED_EVERY == MISREPORTED_EVERY - 1 else 0),
+                "symbol": token["symbol"],
+                "name": token["name"],
+            }
+            for n, token in enumerate(tokens)
+            if token["address"] != ZERO_ADDRESS
+        }
+
+        if i % 10 == 9:
+            continue
+        platform_id = _platform_id(chain_id)
+        platforms.append(
+            {
+                "id": platform_id,
+                "chain_identifier": int(chain_id),
+                "name": details["name"],
+                "shortname": "",
+            }
+        )
+        erc20s = [token for token in tokens if token["address"] != ZERO_ADDRESS]
+        for token in erc20s:
+            coin = coins.setdefault(
+                token["symbol"].lower(),
+                {
+                    "id": f"mock-{token['symbol'].lower()}",
+                    "symbol": token["symbol"].lower(),
+                    "name": token["name"],
+                    "platforms": {},
+                    "token": token,
+                },
+            )
+            coin["platforms"].setdefault(platform_id, token["address"])
+
+        platform_tokens = [{"chainId": int(chain_id), **token} for token in erc20s] + [
+            {
+                "chainId": int(chain_id),
+                "address": _address(chain_id, "filler", n),
+                "name": f"Filler Token {n}",
+                "symbol": f"FIL{n}",
+                "decimals": 18,
+                "logoURI": "",
+            }
+            for n in range(PLATFORM_LIST_SIZE - len(erc20s))
+        ]
+        coingecko_tokens[f"/{platform_id}/all.json"] = _json(
+            {"name": f"CoinGecko {details['name']}", "tokens": platform_tokens}
+        )
+        for token in platform_tokens[len(erc20s) :]:
+            rpc_tokens[chain_id][token["address"]] = {
+                field: token[field] for field in ("decimals", "symbol", "name")
+            }
+
+    # unrelated platforms and coins, as in the real lists
+    platforms.append(
+        {"id": "mock-no-chain", "chain_identifier": None, "name": "", "shortname": ""}
+    )
+    platform_ids = [platform["id"] for platform in platforms]
+    coin_list = [
+        {key: value for key, value in coin.items() if key != "token"}
+        for coin in coins.values()
+    ]
+    for n in range(filler_coins):
+        coin_list.append(
+            {
+                "id": f"mock-filler-{n}",
+                "symbol": f"f{n}",
+                "name": f"Filler {n}",
+                "platforms": {
+                    platform_id: _address("coin", n, platform_id)
+                    for platform_id in rng.sample(
+                        platform_ids, min(len(platform_ids), rng.randint(0, 3))
+                    )
+                },
+            }
+        )
+    rng.shuffle(coin_list)
+    coingecko["/api/v3/asset_platforms"] = _json(platforms)
+    coingecko["/api/v3/coins/list"] = _json(coin_list)
+
+    # moralis ranks ethereum tokens, so the top list is the coins deployed on chain 1
+    # (or on the first chain with a platform when chain 1 isn't benchmarked)
+    top_platform = _platform_id("1") if "1" in contracts else platforms[0]["id"]
+    top_coins = sorted(
+        (coin for coin in coins.values() if top_platform in coin["platforms"]),
+        key=lambda coin: -len(coin["platforms"]),
+    )[:TOP_TOKENS_SIZE]
+    moralis["/api/v2.2/market-data/erc20s/top-tokens"] = _json(
+        [
+            {
+                "contract_address": coin["platforms"][top_platform],
+                "token_name": coin["token"]["name"],
+                "token_symbol": coin["token"]["symbol"],
+                "token_decimals": str(coin["token"]["decimals"]),
+                "token_logo": coin["token"].get("logoURI", ""),
+            }
+            for coin in top_coins
+        ]
+    )
+    uniswap["/ipns/tokens.uniswap.org"] = _json(
+        {
+            "name": "Uniswap Labs Default",
+            "tokens": [
+                {
+                    "chainId": int(platform_id[len("mock-chain-") :]),
+                    "address": address,
+                    "name": coin["token"]["name"],
+                    "symbol": coin["token"]["symbol"],
+                    "decimals": coin["token"]["decimals"],
+                    "logoURI": coin["token"].get("logoURI", ""),
+                }
+                for coin in top_coins
+                for platform_id, address in coin["platforms"].items()
+            ],
+        }
+    )
+
+    routes = dict(
+        zip(UPSTREAMS, (github, coingecko, coingecko_tokens, moralis, uniswap))
+    )
+    return Fixtures(
+        routes,
+        {chain_id: contract for chain_id, contract, _, _ in scaled},
+        rpc_tokens,
+    )
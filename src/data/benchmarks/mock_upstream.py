@@ -0,0 +1,411 @@
+"""
+Offline stand-in for every upstream of the refresh scripts, serving
+benchmarks/fixtures.py fixtures from local http servers: one per upstream host,
+so per-host rate limits and connection pools behave as in production, plus a few
+JSON-RPC nodes.
+
+Failures are simulated the way upstream produces them: every response is delayed
+by latency (plus jitter), missing fixtures are 404s, every throttle_every-th
+request to a host is a 429 with a Retry-After header, and the rpcs of each chain
+include slow, lagging, wrong-chain and dead nodes (see fixtures.RPC_ROLES). Single
+upstreams can be made slow (--slow moralis=5000) or down (--down uniswap, every
+request is a 503).
+Responses carry an ETag, so conditional requests get 304s.
+
+The github host also serves the chain files and icons as one GitHub-style tarball
+(ARCHIVE_PATH) and the crypto icons as a tree listing (TREE_PATH), for the
+snapshot mode of fillChainDetails.py.
+
+Usage, from src/data:
+    python3 -m benchmarks.mock_upstream [--chains N] [--fixtures DIR]
+prints the environment variables that point the scripts at the mock and serves
+until interrupted. --save-fixtures DIR writes the fixtures to DIR instead.
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import random
+import tarfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from benchmarks.fixtures import RPC_SCHEME, UPSTREAMS, Fixtures, build_fixtures
+from pipeline.rate_limit import DEFAULT_RATE, HOST_RATES
+
+LATENCY = 0.02
+JITTER = 0.01
+SLOW_RPC_LATENCY = 0.3
+RETRY_AFTER = 0.2
+LAGGING_BLOCKS = 1000
+RPC_HOSTS = 4
+MOCK_API_KEY = "mock"
+# github paths of the snapshot archive and of the crypto icons tree listing
+ARCHIVE_PATH = "/archive/chains.tar.gz"
+TREE_PATH = "/trees/crypto"
+
+# ERC-20 getters answered by the rpc nodes, by function selector
+ERC20_SELECTORS = {
+    "0x313ce567": "decimals",
+    "0x95d89b41": "symbol",
+    "0x06fdde03": "name",
+}
+
+
+def block_number(chain_id):
+    return 19_000_000 + int(chain_id) % 1_000_000
+
+
+def _encode_word(value):
+    return value.to_bytes(32, "big").hex()
+
+
+def encode_abi_result(value):
+    """ABI-encodes a uint or string return value."""
+    if isinstance(value, int):
+        return "0x" + _encode_word(value)
+    data = value.encode()
+    padded = data + b"\0" * (-len(data) % 32)
+    return "0x" + _encode_word(32) + _encode_word(len(data)) + padded.hex()
+
+
+class MockUpstream:
+    """
+    Serves fixtures until stopped. stats counts requests, responses by status and
+    bytes sent, per upstream ("rpc" for all rpc nodes).
+    """
+
+    def __init__(
+        self,
+        fixtures,
+        latency=LATENCY,
+        jitter=JITTER,
+        throttle_every=0,
+        retry_after=RETRY_AFTER,
+        rpc_hosts=RPC_HOSTS,
+        host="127.0.0.1",
+        slow=None,
+        down=(),
+    ):
+        self.fixtures = fixtures
+        self.latency = latency
+        # upstream: extra delay of its responses, in seconds
+        self.slow = slow or {}
+        self.down = set(down)
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.rpc_hosts = rpc_hosts
+        self.host = host
+        self.servers = {}
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        names = list(UPSTREAMS) + [f"rpc-{i}" for i in range(self.rpc_hosts)]
+        for name in names:
+            server = ThreadingHTTPServer((self.host, 0), _handler(self, name))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers[name] = server
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+        self.servers = {}
+
+    def base_url(self, name):
+        host, port = self.servers[name].server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rpc_url(self, url):
+        """Rewrites a fixture rpc url to the mock node serving it."""
+        host, path = url[len(RPC_SCHEME) :].split("/", 1)
+        return f"{self.base_url(f'rpc-{int(host) % self.rpc_hosts}')}/{path}"
+
+    def env(self):
+        """Environment variables pointing the refresh scripts at the mock."""
+        github = self.base_url("github")
+        return {
+            "PEANUT_DATA_CHAINS_URL": f"{github}/chains",
+            "PEANUT_DATA_ICONS_URL": f"{github}/icons",
+            "PEANUT_DATA_CRYPTO_ICONS_URL": f"{github}/crypto",
+            "PEANUT_DATA_TRUST_WALLET_ICONS_URL": f"{github}/trustwallet/",
+            "PEANUT_DATA_ETHEREUM_LISTS_ARCHIVE_URL": f"{github}{ARCHIVE_PATH}",
+            "PEANUT_DATA_CRYPTO_ICONS_TREE_URL": f"{github}{TREE_PATH}",
+            "PEANUT_DATA_ASSET_PLATFORMS_URL": f"{self.base_url('coingecko')}/api/v3/asset_platforms",
+            "PEANUT_DATA_TOP_TOKENS_URL": f"{self.base_url('coingecko')}/api/v3/coins/list?include_platform=true",
+            "PEANUT_DATA_TOKENS_URL_TEMPLATE": f"{self.base_url('coingecko-tokens')}/{{}}/all.json",
+            "PEANUT_DATA_UNISWAP_URL": f"{self.base_url('uniswap')}/ipns/tokens.uniswap.org",
+            "PEANUT_DATA_UNISWAP_MIRROR_URLS": f"{self.base_url('uniswap')}/ipns/tokens.uniswap.org",
+            "PEANUT_DATA_TOP_LIST_MORALIS_URL": f"{self.base_url('moralis')}/api/v2.2/market-data/erc20s/top-tokens",
+            "MORALIS_API_KEY": MOCK_API_KEY,
+            # give each mock host the budget of the host it stands in for
+            "PEANUT_DATA_RATE_LIMITS": ",".join(
+                f"{urlparse(self.base_url(name)).netloc}={rate}:{burst}"
+                for name, (rate, burst) in (
+                    (name, HOST_RATES.get(production_host, DEFAULT_RATE))
+                    for name, production_host in UPSTREAMS.items()
+                )
+            ),
+        }
+
+    def count(self, upstream, status, size):
+        with self._lock:
+            self.stats[(upstream, "requests")] += 1
+            self.stats[(upstream, status)] += 1
+            self.stats[(upstream, "bytes")] += size
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = Counter()
+
+    def throttled(self, upstream):
+        if not self.throttle_every:
+            return False
+        with self._lock:
+            self.stats[(upstream, "seen")] += 1
+            return self.stats[(upstream, "seen")] % self.throttle_every == 0
+
+    def delay(self, extra=0.0):
+        time.sleep(self.latency + random.uniform(0, self.jitter) + extra)
+
+    def chain_file(self, body):
+        details = json.loads(body)
+        details["rpc"] = [
+            self.rpc_url(rpc) if rpc.startswith(RPC_SCHEME) else rpc
+            for rpc in details.get("rpc", [])
+        ]
+        return json.dumps(details).encode()
+
+    def archive(self):
+        """The chain files and icons as a tar.gz laid out like ethereum-lists."""
+        buffer = io.BytesIO()
+        # mtime=0 keeps the archive, and so its ETag, the same between requests
+        with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as compressed:
+            with tarfile.open(fileobj=compressed, mode="w") as archive:
+                for path, body in sorted(self.fixtures.routes["github"].items()):
+                    if path.startswith("/chains/"):
+                        body = self.chain_file(body)
+                    elif not path.startswith("/icons/"):
+                        continue
+                    member = tarfile.TarInfo(f"chains-master/_data{path}")
+                    member.size = len(body)
+                    archive.addfile(member, io.BytesIO(body))
+        return buffer.getvalue()
+
+    def tree(self):
+        """The crypto icons as a GitHub tree listing of the cryptocurrency-icons repo."""
+        entries = [
+            {"path": f"svg/color/{path[len('/crypto/'):]}", "type": "blob"}
+            for path in sorted(self.fixtures.routes["github"])
+            if path.startswith("/crypto/")
+        ]
+        return json.dumps({"tree": entries, "truncated": False}).encode()
+
+    def rpc_result(self, chain_id, role, call):
+        method = call.get("method")
+        if method == "eth_chainId":
+            return hex(int(chain_id) + (1 if role == "wrong" else 0))
+        if method == "eth_blockNumber":
+            lag = LAGGING_BLOCKS if role == "lagging" else 0
+            return hex(block_number(chain_id) - lag)
+        if method == "eth_getCode":
+            address = call["params"][0].lower()
+            known = address in self.fixtures.tokens.get(chain_id, {})
+            return "0x6080" if known else "0x"
+        if method == "eth_call":
+            tx = call["params"][0]
+            token = self.fixtures.tokens.get(chain_id, {}).get(tx["to"].lower())
+            getter = ERC20_SELECTORS.get(tx.get("data", tx.get("input", ""))[:10])
+            if token is None or getter is None:
+                return "0x"
+            return encode_abi_result(token[getter])
+        raise LookupError(method)
+
+
+def _handler(upstream, name):
+    kind = "rpc" if name.startswith("rpc-") else name
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def respond(self, status, body=b"", headers=None, head=False):
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+            upstream.count(kind, status, 0 if head else len(body))
+
+        def serve_fixture(self, head=False):
+            upstream.delay(upstream.slow.get(kind, 0.0))
+            if kind in upstream.down:
+                return self.respond(503, head=head)
+            if upstream.throttled(kind):
+                return self.respond(
+                    429, headers={"Retry-After": str(upstream.retry_after)}, head=head
+                )
+            if kind == "moralis" and self.headers.get("x-api-key") != MOCK_API_KEY:
+                return self.respond(401, b'{"message": "Token is invalid"}', head=head)
+
+            path = urlparse(self.path).path
+            body = upstream.fixtures.get(kind, path)
+            if kind == "github" and path == ARCHIVE_PATH:
+                body = upstream.archive()
+            elif kind == "github" and path == TREE_PATH:
+                body = upstream.tree()
+            if body is None:
+                return self.respond(404, b"404: Not Found", head=head)
+            if kind == "github" and path.startswith("/chains/"):
+                body = upstream.chain_file(body)
+
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                return self.respond(304, headers={"ETag": etag}, head=head)
+            content_type = (
+                "image/svg+xml" if path.endswith(".svg") else "application/json"
+            )
+            self.respond(
+                200, body, {"ETag": etag, "Content-Type": content_type}, head=head
+            )
+
+        def do_GET(self):
+            self.serve_fixture()
+
+        def do_HEAD(self):
+            self.serve_fixture(head=True)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if kind != "rpc":
+                return self.respond(405)
+            try:
+                chain_id, role = urlparse(self.path).path.strip("/").split("/")
+            except ValueError:
+                return self.respond(404)
+            if role == "dead":
+                # drop the connection without an answer
+                upstream.count(kind, "dropped", 0)
+                self.close_connection = True
+                return
+            upstream.delay(SLOW_RPC_LATENCY if role == "slow" else 0.0)
+
+            payload = json.loads(body)
+            calls = payload if isinstance(payload, list) else [payload]
+            answers = []
+            for call in calls:
+                answer = {"jsonrpc": "2.0", "id": call.get("id")}
+                try:
+                    answer["result"] = upstream.rpc_result(chain_id, role, call)
+                except LookupError:
+                    answer["error"] = {"code": -32601, "message": "Method not found"}
+                answers.append(answer)
+            result = answers if isinstance(payload, list) else answers[0]
+            self.respond(
+                200,
+                json.dumps(result).encode(),
+                {"Content-Type": "application/json"},
+            )
+
+    return Handler
+
+
+def add_arguments(parser):
+    """Fixture and failure simulation options, shared with benchmarks.refresh."""
+    parser.add_argument(
+        "--fixtures", help="Serve fixtures saved with --save-fixtures from this dir."
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=LATENCY * 1000,
+        help=f"Delay of every response (default: {LATENCY * 1000:g}).",
+    )
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="Answer every Nth request to a host with a 429 (default: never).",
+    )
+    parser.add_argument(
+        "--slow",
+        action="append",
+        default=[],
+        metavar="UPSTREAM=MS",
+        help="Delay the responses of an upstream by MS more (repeatable).",
+    )
+    parser.add_argument(
+        "--down",
+        action="append",
+        default=[],
+        metavar="UPSTREAM",
+        help="Answer every request to an upstream with a 503 (repeatable).",
+    )
+
+
+def options(args):
+    """The MockUpstream keyword arguments of the add_arguments options."""
+    slow = {}
+    for option in args.slow:
+        name, _, ms = option.partition("=")
+        slow[name] = float(ms) / 1000
+    return {
+        "latency": args.latency_ms / 1000,
+        "throttle_every": args.throttle_every,
+        "slow": slow,
+        "down": args.down,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument(
+        "--chains",
+        type=int,
+        help="Number of chains, padded with synthetic ones (default: contracts.json).",
+    )
+    parser.add_argument("--save-fixtures", help="Write the fixtures to this dir.")
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        fixtures = Fixtures.load(args.fixtures)
+    else:
+        fixtures = build_fixtures(".", chains=args.chains)
+    if args.save_fixtures:
+        fixtures.save(args.save_fixtures)
+        print(f"Saved fixtures for {len(fixtures.chain_ids)} chains.")
+        return
+
+    with MockUpstream(fixtures, **options(args)) as upstream:
+        for key, value in upstream.env().items():
+            print(f"export {key}='{value}'")
+        print(f"# serving {len(fixtures.chain_ids)} chains, ctrl-c to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
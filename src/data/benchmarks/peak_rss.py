@@ -0,0 +1,41 @@
+"""
+Runs a script as __main__ and writes its peak resident memory, in MB, to a file
+when it exits: python3 -m benchmarks.peak_rss OUT_FILE script.py [args...]
+
+The peak is read from VmHWM, which starts afresh with the new process image. The
+ru_maxrss of a child process would instead carry over the memory of its parent at
+fork time, i.e. the benchmark harness with its fixtures.
+"""
+
+import atexit
+import resource
+import runpy
+import sys
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # no procfs (e.g. macos, where ru_maxrss is in bytes)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+
+
+def main():
+    out_path, script = sys.argv[1], sys.argv[2]
+    sys.argv = sys.argv[2:]
+
+    def report():
+        with open(out_path, "w") as f:
+            f.write(f"{peak_rss_mb():.1f}\n")
+
+    atexit.register(report)
+    runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
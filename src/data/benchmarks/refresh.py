@@ -0,0 +1,211 @@
+"""
+End-to-end benchmark of the refresh scripts against benchmarks/mock_upstream.py,
+fully offline.
+
+For every chain count, fillChainDetails.py and then fillTokenDetails.py are run in
+a scratch directory holding only a contracts.json for that many chains (real
+chains first, synthetic ones above the size of contracts.json): once cold, with
+an empty http cache, and once warm, with --incremental against the cache and
+refresh state the cold run left. Each run reports its wall time, the requests
+it made per upstream, the peak memory of the script and the time spent in each
+of its stages.
+
+With --snapshot, fillChainDetails.py reads ethereum-lists from the mock's archive
+instead of file by file.
+
+Usage: python3 -m benchmarks.refresh [--chains 27,200] [--latency-ms 20]
+    [--throttle-every N] [--snapshot] [--json report.json] [--keep]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import mock_upstream
+from benchmarks.fixtures import Fixtures, build_fixtures
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# script: name of its metrics report (see pipeline/metrics.py)
+SCRIPTS = {"fillChainDetails.py": "chains", "fillTokenDetails.py": "tokens"}
+# copied into the scratch directory, the scripts read them if present
+DATA_FILES = ("tokenDetailsManual.json",)
+
+
+def run_script(script, work_dir, env, log, extra_args=()):
+    """Runs script in work_dir. Returns (exit code, wall seconds, peak rss MB)."""
+    peak_path = os.path.join(work_dir, ".peak_rss")
+    start = time.perf_counter()
+    code = subprocess.call(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.peak_rss",
+            peak_path,
+            os.path.join(DATA_DIR, script),
+            "--incremental",
+            *extra_args,
+        ],
+        cwd=work_dir,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    wall = time.perf_counter() - start
+    try:
+        with open(peak_path) as f:
+            peak = float(f.read())
+    except (OSError, ValueError):
+        peak = float("nan")
+    return code, wall, peak
+
+
+def read_stages(metrics_dir, name):
+    """{stage: seconds} from the metrics report the script wrote, if any."""
+    try:
+        with open(os.path.join(metrics_dir, f"{name}.json")) as f:
+            stages = json.load(f)["stages"]
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {stage: record["seconds"] for stage, record in stages.items()}
+
+
+def benchmark(fixtures, args, work_dir):
+    with mock_upstream.MockUpstream(
+        fixtures, **mock_upstream.options(args)
+    ) as upstream:
+        env = {
+            **os.environ,
+            **upstream.env(),
+            "PYTHONPATH": DATA_DIR,
+            "PEANUT_DATA_CACHE_DIR": os.path.join(work_dir, ".cache", "http"),
+            "PEANUT_DATA_METRICS_DIR": os.path.join(work_dir, ".cache", "metrics"),
+        }
+        env.pop("PEANUT_DATA_OFFLINE", None)
+        env.pop("PEANUT_DATA_STATE_PATH", None)
+        with open(os.path.join(work_dir, "contracts.json"), "w") as f:
+            json.dump(fixtures.contracts, f, indent="\t")
+        for name in DATA_FILES:
+            if os.path.exists(os.path.join(DATA_DIR, name)):
+                shutil.copy(os.path.join(DATA_DIR, name), work_dir)
+
+        results = []
+        with open(os.path.join(work_dir, "benchmark.log"), "w") as log:
+            for phase in ("cold", "warm"):
+                for script, metrics_name in SCRIPTS.items():
+                    upstream.reset_stats()
+                    log.write(f"### {script} ({phase})\n")
+                    log.flush()
+                    extra_args = (
+                        ["--snapshot"]
+                        if args.snapshot and script == "fillChainDetails.py"
+                        else []
+                    )
+                    code, wall, peak = run_script(
+                        script, work_dir, env, log, extra_args
+                    )
+                    stats = upstream.stats
+                    upstreams = sorted({name for name, _ in stats if name})
+                    results.append(
+                        {
+                            "chains": len(fixtures.chain_ids),
+                            "script": script,
+                            "phase": phase,
+                            "exit_code": code,
+                            "wall_seconds": round(wall, 3),
+                            "peak_rss_mb": round(peak, 1),
+                            "requests": {
+                                name: stats[(name, "requests")] for name in upstreams
+                            },
+                            "not_modified": sum(
+                                stats[(name, 304)] for name in upstreams
+                            ),
+                            "throttled": sum(stats[(name, 429)] for name in upstreams),
+                            "bytes": sum(stats[(name, "bytes")] for name in upstreams),
+                            "stages": read_stages(
+                                env["PEANUT_DATA_METRICS_DIR"], metrics_name
+                            ),
+                        }
+                    )
+        return results
+
+
+def print_report(results):
+    print(
+        f"{'chains':>6}  {'script':<20} {'phase':<5} {'wall s':>8} {'peak MB':>8} "
+        f"{'requests':>8} {'304':>5} {'429':>5} {'MB in':>7}  per upstream"
+    )
+    for row in results:
+        per_upstream = ", ".join(
+            f"{name} {count}" for name, count in row["requests"].items()
+        )
+        failed = "" if row["exit_code"] == 0 else f"  (exit {row['exit_code']})"
+        print(
+            f"{row['chains']:>6}  {row['script']:<20} {row['phase']:<5} "
+            f"{row['wall_seconds']:>8.2f} {row['peak_rss_mb']:>8.1f} "
+            f"{sum(row['requests'].values()):>8} {row['not_modified']:>5} "
+            f"{row['throttled']:>5} {row['bytes'] / 1e6:>7.2f}  {per_upstream}{failed}"
+        )
+        if row["stages"]:
+            print(
+                " " * 8
+                + "stages: "
+                + ", ".join(
+                    f"{stage} {secs:.2f}s" for stage, secs in row["stages"].items()
+                )
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    mock_upstream.add_arguments(parser)
+    parser.add_argument(
+        "--chains",
+        default="27,200",
+        help="Comma separated chain counts to benchmark, ignored with --fixtures "
+        "(default: 27,200).",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Run fillChainDetails.py in snapshot mode.",
+    )
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the scratch directories."
+    )
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        scales = [Fixtures.load(args.fixtures)]
+    else:
+        scales = (
+            build_fixtures(DATA_DIR, chains=int(count))
+            for count in args.chains.split(",")
+        )
+
+    results = []
+    for fixtures in scales:
+        work_dir = tempfile.mkdtemp(prefix=f"peanut-refresh-{len(fixtures.chain_ids)}-")
+        print(f"Benchmarking {len(fixtures.chain_ids)} chains in {work_dir}...")
+        try:
+            results += benchmark(fixtures, args, work_dir)
+        finally:
+            if not args.keep:
+                shutil.rmtree(work_dir)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent="\t")
+    if any(row["exit_code"] for row in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmarks the join of the moralis top token list against the full coingecko
+token list (pipeline.tokens.get_top_tokens_with_contracts) on synthetic data.
+
+The previous nested-loop join is kept here as a reference: it is checked against the
+indexed join for equal output and timed on the sizes where it finishes in
+reasonable time.
+
+Usage: python3 -m benchmarks.token_join [--full-size N] [--top-sizes N,N,...]
+"""
+
+import argparse
+import random
+import time
+
+from pipeline.tokens import build_contract_index, get_top_tokens_with_contracts
+
+PLATFORMS = [
+    "ethereum",
+    "polygon-pos",
+    "arbitrum-one",
+    "optimistic-ethereum",
+    "base",
+    "binance-smart-chain",
+    "avalanche",
+    "xdai",
+]
+# The nested loop is O(top x full); skip it above this many top x full pairs
+NAIVE_MAX_PAIRS = 50_000_000
+
+
+def random_address(rng):
+    return "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40))
+
+
+def make_full_list(size, rng):
+    full_list = []
+    for i in range(size):
+        platforms = {
+            platform: random_address(rng)
+            for platform in rng.sample(PLATFORMS, rng.randint(0, 4))
+        }
+        full_list.append(
+            {
+                "id": f"token-{i}",
+                "symbol": f"TK{i}",
+                "name": f"Token {i}",
+                "platforms": platforms,
+            }
+        )
+    return full_list
+
+
+def make_top_tokens(full_list, size, rng):
+    """Top tokens drawn from the full list, with checksum-like mixed case."""
+    candidates = [token for token in full_list if token["platforms"]]
+    top_tokens = []
+    for token in rng.sample(candidates, min(size, len(candidates))):
+        address = rng.choice(list(token["platforms"].values()))
+        top_tokens.append(
+            {
+                "contract_address": address[:2] + address[2:].upper(),
+                "token_symbol": token["symbol"],
+                "token_name": token["name"],
+                "token_decimals": "18",
+                "token_logo": "",
+            }
+        )
+    return top_tokens
+
+
+def naive_join(top_tokens, full_list):
+    """The nested loop join, made case-insensitive so the outputs are comparable."""
+    top_tokens_by_chain = []
+    for top_token in top_tokens:
+        for full_list_token in full_list:
+            if (
+                top_token["contract_address"] != ""
+                and top_token["token_symbol"].lower()
+                == full_list_token["symbol"].lower()
+                and top_token["contract_address"].lower()
+                in [
+                    address.lower()
+                    for address in full_list_token["platforms"].values()
+                    if address
+                ]
+            ):
+                token_info = top_token.copy()
+                token_info["platforms"] = full_list_token["platforms"]
+                top_tokens_by_chain.append(token_info)
+    return top_tokens_by_chain
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--full-size", type=int, default=15_000)
+    parser.add_argument("--top-sizes", default="100,1000,5000,10000")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    full_list = make_full_list(args.full_size, rng)
+
+    index, index_time = timed(build_contract_index, full_list)
+    print(
+        f"Full list: {len(full_list)} tokens, index built in {index_time * 1000:.1f} ms"
+    )
+    print(f"{'top tokens':>10} {'matches':>8} {'indexed ms':>11} {'nested ms':>10}")
+
+    for top_size in (int(size) for size in args.top_sizes.split(",")):
+        top_tokens = make_top_tokens(full_list, top_size, rng)
+        result, join_time = timed(get_top_tokens_with_contracts, top_tokens, index)
+
+        naive_column = "skipped"
+        if len(top_tokens) * len(full_list) <= NAIVE_MAX_PAIRS:
+            naive_result, naive_time = timed(naive_join, top_tokens, full_list)
+            assert naive_result == result, "indexed join differs from nested loop"
+            naive_column = f"{naive_time * 1000:.1f}"
+
+        print(
+            f"{len(top_tokens):>10} {len(result):>8} {join_time * 1000:>11.2f} {naive_column:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
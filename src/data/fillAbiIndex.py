@@ -0,0 +1,51 @@
+"""
+fillAbiIndex: writes abiIndex.json, mapping every function and error selector and
+every event topic0 of the ABIs in src/data to its signature and the contract
+versions declaring it, so calldata and logs can be decoded with one lookup instead
+of hashing every ABI. Collisions between different signatures are listed in the
+index and reported (see pipeline/abi_index.py).
+
+Run from src/data (or pass --data-dir) after adding or changing an ABI.
+"""
+
+import argparse
+import sys
+
+from pipeline import abi_index, writer
+from pipeline.paths import DataPaths
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Populates abiIndex.json with the selectors and event topics of every ABI."
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=".",
+        help="Directory of the ABIs and abiIndex.json (default: the current directory).",
+    )
+    parser.add_argument(
+        "--fail-on-collision",
+        action="store_true",
+        help="Exit with 1 if a selector or topic has more than one decoding.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    args = args or parse_args()
+    paths = DataPaths(args.data_dir)
+
+    index = abi_index.build_abi_index(paths.data_dir)
+    report = writer.write_json_artifact(
+        paths.abi_index, index, build_dir=paths.build_dir
+    )
+    writer.print_size_report(report)
+    abi_index.print_collisions(index)
+    print(abi_index.summary(index))
+    if args.fail_on_collision and index["collisions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+fillAssets: downloads the chain icons and token logos referenced by
+chainDetails.json and tokenDetails.json into assets/, named by content hash, and
+writes assetsManifest.json, mapping every source url to its local path. Only urls
+that aren't in the manifest yet are downloaded (see pipeline/assets.py). Both are
+published to the host behind --base-url rather than committed.
+
+Run from src/data (or pass --data-dir) after fillChainDetails.py and
+fillTokenDetails.py.
+"""
+
+import argparse
+import json
+
+from pipeline import assets, http_client, metrics, rate_limit, writer
+from pipeline.paths import DataPaths
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Populates assets/ and assetsManifest.json with local copies of every icon and logo."
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=".",
+        help="Directory of chainDetails.json, tokenDetails.json and the assets "
+        "(default: the current directory).",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=assets.DEFAULT_BASE_URL,
+        help="Prefix of the local paths in the manifest, e.g. the url the assets "
+        f"are served from (default: {assets.DEFAULT_BASE_URL}).",
+    )
+    parser.add_argument("--workers", type=int, default=assets.ASSET_WORKERS)
+    metrics.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    args = args or parse_args()
+    paths = DataPaths(args.data_dir)
+
+    with open(paths.chain_details, "r") as f:
+        chain_details = json.load(f)
+    with open(paths.token_details, "r") as f:
+        token_details = json.load(f)
+
+    manifest, stats = assets.update_assets(
+        chain_details,
+        token_details,
+        paths,
+        base_url=args.base_url,
+        workers=args.workers,
+    )
+    with metrics.span("write"):
+        report = writer.write_json_artifact(
+            paths.assets_manifest, manifest, build_dir=paths.build_dir
+        )
+    writer.print_size_report(report)
+
+    print(assets.summary(stats))
+    print(rate_limit.summary())
+    print(http_client.summary())
+    print(metrics.summary())
+    metrics.write_report("assets", args.metrics_dir, args.openmetrics)
+
+
+if __name__ == "__main__":
+    main()
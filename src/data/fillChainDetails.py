@@ -1,140 +1,74 @@
-import requests
-import json
-import os
-import time
+"""
+fillChainDetails: populates chainDetails.json with the details of every chain in
+contracts.json, from ethereum-lists, with live rpcs ranked by latency and freshness
+and an icon for new chains. The refresh itself lives in pipeline/chains.py; this
+script adds the prompts, the incremental mode and the run report.
 
+With --snapshot, ethereum-lists is read once, as an archive or a local checkout,
+and chain files and icons are resolved locally instead of file by file.
 
-# Existing constants
-CONTRACTS_URL = (
-    # "https://raw.githubusercontent.com/peanutprotocol/peanut-contracts/xchain/contracts.json"
-    "contracts.json"
-)
+Run from src/data (or pass --data-dir), see --help.
+"""
 
+import argparse
+import time
 
-CHAIN_DETAILS_PATH = "chainDetails.json"
-CHAINS_URL = (
-    "https://raw.githubusercontent.com/ethereum-lists/chains/master/_data/chains"
+from pipeline import (
+    chains,
+    http_cache,
+    http_client,
+    metrics,
+    rate_limit,
+    refresh_state,
+    writer,
 )
-ICONS_URL = "https://raw.githubusercontent.com/ethereum-lists/chains/master/_data/icons"
-
-# New URLs for additional icon sources
-CRYPTO_ICONS_URL = "https://raw.githubusercontent.com/spothq/cryptocurrency-icons/master/svg/color"  # append /{icon_name}.svg
-# TRUST_WALLET_ICONS_URL = "https://raw.githubusercontent.com/trustwallet/assets/master/blockchains"
-TRUST_WALLET_ICONS_URL = "https://raw.githubusercontent.com/trustwallet/assets/8ee07e9d791bec6c3ada3cfac73ddfdc4f4a40b7/blockchains/"
-
-# Generic default icon URL (replace with a valid URL of your default icon)
-DEFAULT_ICON_URL = "https://raw.githubusercontent.com/spothq/cryptocurrency-icons/master/svg/color/generic.svg"
-
-
-def check_rpc(rpc):
-    print(f"Checking RPC {rpc}...")
-    if rpc.startswith("wss://"):
-        return False
-    if "infura" in rpc.lower():
-        return True
-    try:
-        response = requests.post(
-            rpc,
-            json={"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 1},
-            timeout=5,
-        )
-        if response.status_code == 200:
-            return True
-        else:
-            return False
-    except Exception as e:
-        print("Error: ", e)
-        return False
-
-
-def get_contracts():
-    if CONTRACTS_URL.startswith("https://"):
-        response = requests.get(CONTRACTS_URL)
-        if response.status_code == 200:
-            return response.json()
-    else:
-        try:
-            with open(CONTRACTS_URL, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading contracts from file: {e}")
-    return None
-
-
-def get_chain_ids(contracts):
-    chain_ids = list(contracts.keys())
-    # filter out all the chain ids that don't have a contract version of 3 or higher
-    return [chain_id for chain_id in chain_ids]
-
-
-def get_chain_details(chain_id: int):
-    chain_file = f"eip155-{chain_id}.json"
-    response = requests.get(os.path.join(CHAINS_URL, chain_file))
-    if response.status_code != 200:
-        return None
-
-    details = response.json()
-
-    # check each rpc for liveliness and remove if dead
-    rpcs = details.get("rpc", [])
-    live_rpcs = [rpc for rpc in rpcs if check_rpc(rpc)]
-    details["rpc"] = live_rpcs
-    details["chainId"] = str(details["chainId"])
-
-    # display a warning if no live rpcs found
-    if len(live_rpcs) == 0:
-        print(f"Warning: No live providers found for chain id {chain_id}")
-
-    return details
-
-
-def get_chain_icon(possible_chain_names, existing_chain_details):
-    # Check if the icon already exists in the existing chain details
-    existing_icon = existing_chain_details.get("icon")
-    if existing_icon:
-        print(f"Icon already exists for {possible_chain_names[0]}...")
-        return existing_icon
-
-    for name in possible_chain_names:
-        print(f"Trying to get icon info for {name}...")
-        # First attempt: Existing ICONS_URL
-        icon_file = f"{name}.json"
-        response = requests.get(os.path.join(ICONS_URL, icon_file))
-        if response.status_code == 200:
-            icon_info = response.json()[0]
-            print(
-                "Got icon info from ICONS_URL: ",
-                icon_info["url"].replace("ipfs://", "https://ipfs.io/ipfs/"),
-            )
-            return {
-                "url": icon_info["url"].replace("ipfs://", "https://ipfs.io/ipfs/"),
-                "format": icon_info["format"],
-            }
-
-        # Second attempt: Crypto Icons
-        icon_file = f"{name}.svg"
-        response = requests.get(os.path.join(CRYPTO_ICONS_URL, icon_file))
-        if response.status_code == 200:
-            print("Got icon info from CRYPTO_ICONS_URL: ", response.url)
-            return {"url": response.url, "format": "svg"}
-
-        # Third attempt: TrustWallet Assets
-        icon_file = f"{name}/info/logo.png"
-        response = requests.get(os.path.join(TRUST_WALLET_ICONS_URL, icon_file))
-        if response.status_code == 200:
-            print("Got icon info from TRUST_WALLET_ICONS_URL: ", response.url)
-            return {"url": response.url, "format": "png"}
-
-    # If none of the above succeed, return a default icon
-    print(
-        "Failed to get icon info. Returning default icon. Failed for names: ",
-        possible_chain_names,
+from pipeline.clients import Clients, default_clients
+from pipeline.paths import DataPaths
+from pipeline.refresh_state import RefreshState, content_hash
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Populates chainDetails.json with the details of every chain in contracts.json."
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=".",
+        help="Directory of contracts.json and chainDetails.json (default: the "
+        "current directory).",
+    )
+    parser.add_argument(
+        "--snapshot",
+        nargs="?",
+        const=chains.ETHEREUM_LISTS_ARCHIVE_URL,
+        metavar="SOURCE",
+        help="Read ethereum-lists from one snapshot instead of file by file: a local "
+        "checkout, a .tar.gz archive or its url (default: the master archive).",
     )
-    return {"url": DEFAULT_ICON_URL, "format": "png"}
+    refresh_state.add_arguments(parser)
+    metrics.add_arguments(parser)
+    parser.add_argument(
+        "--remove-missing",
+        choices=refresh_state.REMOVE_POLICIES,
+        help="What to do with chains that are no longer in contracts.json "
+        "(default: ask, or keep with --incremental).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    args = args or parse_args()
+    paths = DataPaths(args.data_dir)
+    state = RefreshState(args.state_path)
+    remove_policy = args.remove_missing or ("keep" if args.incremental else "ask")
 
+    clients = default_clients()
+    if args.snapshot:
+        with metrics.span("snapshot"):
+            clients = Clients(snapshot=chains.load_snapshot(args.snapshot))
 
-def main():
-    contracts = get_contracts()
+    with metrics.span("contracts"):
+        contracts = chains.get_contracts(paths, clients)
     if not contracts:
         print("Failed to get contracts.")
         return
@@ -146,90 +80,119 @@ def main():
     ]
     print(f"Found {len(TESTNETS)} testnets.")
 
-    chain_ids = get_chain_ids(contracts)
+    chain_ids = chains.get_chain_ids(contracts)
     print(
         f"Found {len(chain_ids)} chain ids with a v3 / v4 & B4 chain id. Fetching details..."
     )
 
     # Load existing chain details if the file exists
-    if os.path.exists(CHAIN_DETAILS_PATH):
-        with open(CHAIN_DETAILS_PATH, "r") as file:
-            chain_details = json.load(file)
-    else:
-        chain_details = {}
+    chain_details = chains.load_chain_details(paths)
 
-    # New code: Prompt to remove chain details not in contracts.json
+    # Remove (or prompt to remove) chain details not in contracts.json
     existing_chain_ids = list(chain_details.keys())
     for chain_id in existing_chain_ids:
         if chain_id not in contracts:
-            user_input = input(
-                f"Chain id {chain_id} is not in contracts.json anymore. Remove from chainDetails.json? (y/n) "
-            )
-            if user_input.lower() == "y":
+            if remove_policy == "ask":
+                user_input = input(
+                    f"Chain id {chain_id} is not in contracts.json anymore. Remove from chainDetails.json? (y/n) "
+                )
+                remove = user_input.lower() == "y"
+            else:
+                remove = remove_policy == "remove"
+            if remove:
                 del chain_details[chain_id]
+                state.remove("chains", chain_id)
                 print(f"Removed chain id {chain_id} from chainDetails.json.")
             else:
                 print(f"Kept chain id {chain_id} in chainDetails.json.")
 
-    for chain_id in chain_ids:
-        # Only fetch details if chain_id is not already in chainDetails.json
-        if chain_id in chain_details:
-            user_input = input(
-                f"Chain id {chain_id} already exists in chainDetails.json. Overwrite? (y/n) "
+    fetched_details = {}
+    # content hash of each fetched chain's ethereum-lists file, for the refresh state
+    chain_file_hashes = {}
+    with metrics.span("chain_fetch"):
+        for chain_id in chain_ids:
+            chain_file = None
+            # Only fetch details if chain_id is not already in chainDetails.json
+            if chain_id in chain_details:
+                if args.incremental:
+                    # revalidate the cached file, it is fetched only once per run
+                    chain_file = chains.fetch_chain_file(chain_id, clients, ttl=0)
+                    if chain_file is None or not chains.chain_needs_refresh(
+                        chain_id, state, args.max_age, clients, chain_file
+                    ):
+                        print(f"Chain id {chain_id} is up to date, skipping.")
+                        continue
+                else:
+                    user_input = input(
+                        f"Chain id {chain_id} already exists in chainDetails.json. Overwrite? (y/n) "
+                    )
+                    if user_input.lower() != "y":
+                        continue
+            print(f"Fetching details for chain id {chain_id}...")
+
+            if chain_file is None:
+                chain_file = chains.fetch_chain_file(chain_id, clients)
+            details = chains.fetch_chain(
+                chain_id,
+                contracts[str(chain_id)],
+                check_rpcs=False,
+                clients=clients,
+                chain_file=chain_file,
             )
-            if user_input.lower() != "y":
+            if details:
+                fetched_details[chain_id] = details
+                chain_file_hashes[chain_id] = content_hash(chain_file)
+
+    # check the rpcs of all fetched chains in one concurrent sweep
+    print(f"Checking RPCs for {len(fetched_details)} chains...")
+    with metrics.span("rpc_probe"):
+        live_rpcs = chains.probe_rpcs(
+            {
+                chain_id: details.get("rpc", [])
+                for chain_id, details in fetched_details.items()
+            },
+            clients=clients,
+        )
+
+    rpc_checked_at = time.time()
+
+    new_chains = {}
+    with metrics.span("merge"):
+        for chain_id, details in fetched_details.items():
+            chains.set_live_rpcs(chain_id, details, live_rpcs[chain_id])
+            state.update(
+                "chains",
+                chain_id,
+                fetched_at=rpc_checked_at,
+                rpc_checked_at=rpc_checked_at,
+                content_hash=chain_file_hashes[chain_id],
+            )
+
+            if chain_id in chain_details:
+                chain_details[chain_id] = chains.finish_chain(
+                    chain_id, details, chain_details[chain_id], clients
+                )
                 continue
-        print(f"Fetching details for chain id {chain_id}...")
 
-        # wait 1 second between requests to avoid rate limiting
-        time.sleep(1)
+            # Implicit else: create a new entry in chain_details, with an icon
+            new_chains[chain_id] = details
 
-        details = get_chain_details(chain_id)
-        details["mainnet"] = (
-            contracts[str(chain_id)].get("mainnet", "false").lower() == "true"
-        )
+    # resolve the icons of all new chains concurrently
+    with metrics.span("icons"):
+        chain_details.update(chains.finish_new_chains(new_chains, clients=clients))
 
-        if not details:
-            continue
-
-        if chain_id in chain_details:
-            # Add newly fetched fields that don't yet exist
-            # in the current entry in chain_details
-            new_details = {**details, **chain_details[chain_id]}
-
-            # and update a few specific fields
-            new_details["rpc"] = details["rpc"]
-            new_details["faucets"] = details["faucets"]
-            new_details["explorers"] = details["explorers"]
-            new_details["infoURL"] = details["infoURL"]
-
-            chain_details[chain_id] = new_details
-            continue
-
-        # Implicit else: create a new entry in chain_details
-        # get icon
-        possible_chain_names = []
-        if details.get("icon"):
-            possible_chain_names.append(details["icon"])
-        if details.get("short_name"):
-            possible_chain_names.append(details["short_name"])
-        if details.get("shortName"):
-            possible_chain_names.append(details["shortName"])
-        if details.get("name"):
-            possible_chain_names.append(details["name"])
-        if details.get("chain"):
-            possible_chain_names.append(details["chain"])
-        possible_chain_names.extend([name.lower() for name in possible_chain_names])
-        icon = get_chain_icon(possible_chain_names, chain_details.get(chain_id, {}))
-        details["icon"] = icon
-
-        chain_details[chain_id] = details
-
-    with open(CHAIN_DETAILS_PATH, "w") as file:
-        json.dump(chain_details, file, indent="\t")
+    with metrics.span("write"):
+        report = chains.write_chain_details(chain_details, paths)
+        state.save()
+    writer.print_size_report(report)
 
     print("Done. Processed", len(chain_details), "chain ids: ", chain_details.keys())
+    print(http_cache.summary())
+    print(rate_limit.summary())
+    print(http_client.summary())
+    print(metrics.summary())
+    metrics.write_report("chains", args.metrics_dir, args.openmetrics)
 
 
-# Call the function to start the process
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Shared building blocks for the data refresh scripts (fillChainDetails.py,
+fillTokenDetails.py).
+
+The refresh itself is importable without side effects: pipeline.chains and
+pipeline.tokens expose async refresh_chain / refresh_tokens, which take the data
+directory as a pipeline.paths.DataPaths and the http clients as a
+pipeline.clients.Clients.
+"""
@@ -0,0 +1,160 @@
+"""
+Selector and event topic index of the ABIs in src/data.
+
+Every function and custom error of the Peanut vault (peanutAbiV*.json), batcher
+(peanutBatcherV*.json) and router (peanutRouterAbiV*.json) ABIs, and of the
+ERC-20/721/1155 ABIs, is keyed by its 4 byte selector, and every event by its
+topic0. Each key maps to the decodings found for it: the canonical signature, a
+human-readable fragment (ethers' format, with parameter names and indexed flags)
+and the contracts declaring it, by their contracts.json version key ("v4.2",
+"Bv4.2", "Rv4.2"; the ERC ABIs are keyed "erc20", "erc721" and "erc1155").
+
+The same signature in several versions is one decoding. A key with more than one
+decoding is a collision: two different functions or errors sharing a selector, or
+events with the same signature but different indexed parameters (ERC-20 and
+ERC-721 Transfer), which need different decoding. Collisions are listed in the
+index and reported, since a decoder has to disambiguate them by contract.
+"""
+
+import json
+import os
+import re
+
+from pipeline import keccak
+
+# (file name pattern, contract kind, version key template)
+ABI_FILES = (
+    (re.compile(r"peanutAbiV([\d.]+)\.json"), "vault", "v{}"),
+    (re.compile(r"peanutBatcherV([\d.]+)\.json"), "batcher", "Bv{}"),
+    (re.compile(r"peanutRouterAbiV([\d.]+)\.json"), "router", "Rv{}"),
+    (re.compile(r"erc(\d+)abi\.json"), "erc{}", "erc{}"),
+)
+INDEXED_TYPES = ("function", "error", "event")
+
+
+def find_abis(data_dir):
+    """
+    The ABI files in data_dir as [(version key, kind, file name)], by kind and then
+    version.
+    """
+    abis = []
+    for name in os.listdir(data_dir):
+        for order, (pattern, kind, key) in enumerate(ABI_FILES):
+            match = pattern.fullmatch(name)
+            if match:
+                version = match.group(1)
+                numbers = tuple(int(part) for part in version.split("."))
+                abis.append(
+                    (
+                        (order, numbers),
+                        key.format(version),
+                        kind.format(version),
+                        name,
+                    )
+                )
+    return [(key, kind, name) for _, key, kind, name in sorted(abis)]
+
+
+def _param(param, event=False):
+    abi_type = param["type"]
+    if abi_type.startswith("tuple"):
+        components = ", ".join(_param(c) for c in param["components"])
+        abi_type = f"tuple({components}){abi_type[len('tuple'):]}"
+    if event and param.get("indexed"):
+        abi_type += " indexed"
+    return f"{abi_type} {param['name']}" if param.get("name") else abi_type
+
+
+def fragment(entry):
+    """The human-readable ABI fragment of a function, error or event entry."""
+    event = entry["type"] == "event"
+    params = ", ".join(_param(param, event) for param in entry.get("inputs", []))
+    text = f"{entry['type']} {entry['name']}({params})"
+    if entry["type"] == "function":
+        if entry.get("stateMutability", "nonpayable") != "nonpayable":
+            text += f" {entry['stateMutability']}"
+        if entry.get("outputs"):
+            text += f" returns ({', '.join(_param(p) for p in entry['outputs'])})"
+    return text
+
+
+def _decoding(entry):
+    """What tells two decodings of a key apart: events differ by indexed params."""
+    signature = keccak.signature(entry)
+    if entry["type"] == "event":
+        indexed = tuple(bool(p.get("indexed")) for p in entry.get("inputs", []))
+        return entry["type"], signature, indexed
+    return entry["type"], signature
+
+
+def build_abi_index(data_dir):
+    """
+    The index of the ABIs in data_dir: {"contracts": {version key: {"kind",
+    "abi"}}, "selectors": {selector: [decoding]}, "topics": {topic0: [decoding]},
+    "collisions": [selector or topic0]}, a decoding being {"type", "signature",
+    "fragment", "contracts": [version key]}.
+    """
+    contracts = {}
+    # key: {decoding: entry}
+    selectors = {}
+    topics = {}
+    for version_key, kind, name in find_abis(data_dir):
+        contracts[version_key] = {"kind": kind, "abi": name}
+        with open(os.path.join(data_dir, name), "r") as f:
+            abi = json.load(f)
+        for entry in abi:
+            if entry.get("type") not in INDEXED_TYPES or entry.get("anonymous"):
+                continue
+            signature = keccak.signature(entry)
+            if entry["type"] == "event":
+                table, key = topics, keccak.topic(signature)
+            else:
+                table, key = selectors, keccak.selector(signature)
+            decodings = table.setdefault(key, {})
+            decoding = decodings.setdefault(
+                _decoding(entry),
+                {
+                    "type": entry["type"],
+                    "signature": signature,
+                    "fragment": fragment(entry),
+                    "contracts": [],
+                },
+            )
+            if version_key not in decoding["contracts"]:
+                decoding["contracts"].append(version_key)
+
+    index = {
+        "contracts": contracts,
+        "selectors": {key: list(d.values()) for key, d in selectors.items()},
+        "topics": {key: list(d.values()) for key, d in topics.items()},
+    }
+    index["collisions"] = sorted(
+        key
+        for table in ("selectors", "topics")
+        for key, decodings in index[table].items()
+        if len(decodings) > 1
+    )
+    return index
+
+
+def lookup(index, key):
+    """The decodings of a selector or topic0 (0x prefixed hex, any case)."""
+    key = key.lower()
+    table = index["selectors"] if len(key) == 10 else index["topics"]
+    return table.get(key, [])
+
+
+def print_collisions(index):
+    for key in index["collisions"]:
+        decodings = lookup(index, key)
+        print(f"Collision on {key}:")
+        for decoding in decodings:
+            print(f"  {decoding['fragment']} in {', '.join(decoding['contracts'])}")
+
+
+def summary(index):
+    return (
+        f"ABI index: {len(index['contracts'])} ABIs, "
+        f"{len(index['selectors'])} selectors, {len(index['topics'])} event topics, "
+        f"{len(index['collisions'])} collisions"
+    )
@@ -0,0 +1,404 @@
+"""
+Local copies of the chain icons (icon.url in chainDetails.json) and token logos
+(logoURI in tokenDetails.json), so SDK consumers load them from our own hosting
+instead of ipfs.io, raw.githubusercontent.com and market data CDNs.
+
+Every referenced url is downloaded once (ipfs:// and ipfs.io urls through
+IPFS_GATEWAY, data: urls decoded in place) and checked by its content, not its
+extension or content type: PNG, JPEG, GIF, WebP, ICO and SVG are accepted, SVGs
+only without scripts or event handlers. Raster images larger than MAX_DIMENSION
+are scaled down to PNG with Pillow (in requirements.txt); an environment without
+it keeps them as they are and counts them as oversized in the summary.
+
+Files are named by their content hash (<sha256[:16]>.<format>) in the assets
+directory, so the same logo behind several urls is stored once. The manifest
+(assetsManifest.json) maps every source url to its hashed path under base_url,
+plus the format, dimensions and size of every file:
+
+    {"base_url": "assets/", "urls": {source url: path},
+     "assets": {file name: {"format", "width", "height", "bytes"}}}
+
+Updates are incremental: urls already in the manifest whose file is still there
+are not downloaded again, and files no url references anymore are removed. Urls
+that failed for good (a 404 or 410, or content that isn't a valid image) are
+retried after RETRY_TTL (see pipeline.negative_cache); other failures (5xx,
+throttling, timeouts) on the next run.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_to_bytes
+
+import requests
+
+from pipeline import metrics, negative_cache, writer
+from pipeline.clients import default_clients
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IPFS_GATEWAY = os.environ.get("PEANUT_DATA_IPFS_GATEWAY", "https://ipfs.io/ipfs/")
+ASSET_WORKERS = 8
+ASSET_TIMEOUT = 30
+MAX_ASSET_BYTES = 2 * 1024 * 1024
+# Longest side of the stored raster images, in pixels
+MAX_DIMENSION = 256
+RETRY_TTL = 7 * 24 * 60 * 60
+DEFAULT_BASE_URL = "assets/"
+# Markup that makes an SVG active content rather than an image
+SVG_ACTIVE_CONTENT = re.compile(
+    rb"<script|<foreignObject|javascript:|\son[a-z]+\s*=", re.IGNORECASE
+)
+
+
+class AssetError(Exception):
+    """An asset that can't be stored: gone upstream, or not a valid image."""
+
+
+class TransientAssetError(AssetError):
+    """A download that may succeed later, e.g. a 5xx, a 429 or a timeout."""
+
+
+def referenced_urls(chain_details, token_details):
+    """The icon and logo urls of chain_details and token_details, once each."""
+    urls = []
+    for chain in chain_details.values():
+        icon = chain.get("icon") or {}
+        urls.append(icon.get("url"))
+    for entry in token_details:
+        for token in entry["tokens"]:
+            urls.append(token.get("logoURI"))
+    return list(dict.fromkeys(url for url in urls if url))
+
+
+def download_url(url):
+    """The url to download url from: ipfs content goes through IPFS_GATEWAY."""
+    for prefix in ("ipfs://", "https://ipfs.io/ipfs/"):
+        if url.startswith(prefix):
+            return IPFS_GATEWAY + url[len(prefix) :]
+    return url
+
+
+def _decode_data_url(url):
+    header, _, data = url.partition(",")
+    if header.endswith(";base64"):
+        try:
+            return base64.b64decode(data, validate=True)
+        except ValueError as e:
+            raise AssetError("invalid base64 data url") from e
+    return unquote_to_bytes(data)
+
+
+def fetch(url, clients=None, timeout=ASSET_TIMEOUT):
+    """
+    The content of url, read up to MAX_ASSET_BYTES. Raises AssetError, or
+    TransientAssetError unless the url is gone (404, 410).
+    """
+    if url.startswith("data:"):
+        return _decode_data_url(url)
+    if not url.startswith(("https://", "http://", "ipfs://")):
+        raise AssetError("unsupported url scheme")
+    clients = clients or default_clients()
+    try:
+        response = clients.scheduler.request(
+            "GET", download_url(url), timeout=timeout, stream=True
+        )
+    except requests.RequestException as e:
+        raise TransientAssetError(f"request failed ({e.__class__.__name__})") from e
+    with response:
+        if response.status_code in (404, 410):
+            raise AssetError(f"HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise TransientAssetError(f"HTTP {response.status_code}")
+        content = bytearray()
+        try:
+            for chunk in response.iter_content(64 * 1024):
+                content.extend(chunk)
+                if len(content) > MAX_ASSET_BYTES:
+                    raise AssetError(f"larger than {MAX_ASSET_BYTES} bytes")
+        except requests.RequestException as e:
+            raise TransientAssetError(
+                f"download failed ({e.__class__.__name__})"
+            ) from e
+    metrics.record_bytes(url, len(content))
+    return bytes(content)
+
+
+def sniff_format(content):
+    """The image format of content from its leading bytes, or None."""
+    if content.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if content.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if content.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "webp"
+    if content[:4] == b"\0\0\1\0":
+        return "ico"
+    head = content[:1024].lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if head.startswith((b"<svg", b"<?xml", b"<!--", b"<!doctype svg")) and (
+        b"<svg" in content[:4096].lower()
+    ):
+        return "svg"
+    return None
+
+
+def _jpeg_size(content):
+    offset = 2
+    while offset + 9 < len(content):
+        if content[offset] != 0xFF:
+            return None
+        marker = content[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        (length,) = struct.unpack(">H", content[offset + 2 : offset + 4])
+        # start of frame markers, except DHT, JPG and DAC which share the range
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", content[offset + 5 : offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def _webp_size(content):
+    chunk = content[12:16]
+    if chunk == b"VP8X" and len(content) >= 30:
+        width = int.from_bytes(content[24:27], "little") + 1
+        height = int.from_bytes(content[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8L" and len(content) >= 25:
+        bits = int.from_bytes(content[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 " and len(content) >= 30:
+        width, height = struct.unpack("<HH", content[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    return None
+
+
+def _svg_size(content):
+    match = re.search(rb"<svg\b[^>]*>", content, re.IGNORECASE)
+    if not match:
+        return None
+    tag = match.group(0)
+    view_box = re.search(rb'viewBox\s*=\s*["\']([^"\']+)["\']', tag)
+    if view_box:
+        values = re.split(rb"[\s,]+", view_box.group(1).strip())
+        try:
+            width, height = (float(value) for value in values[2:4])
+        except ValueError:
+            return None
+        return round(width), round(height)
+    sizes = [
+        re.search(rb"\b" + name + rb'\s*=\s*["\']([\d.]+)(px)?["\']', tag)
+        for name in (b"width", b"height")
+    ]
+    if all(sizes):
+        return tuple(round(float(size.group(1))) for size in sizes)
+    return None
+
+
+def image_size(content, image_format):
+    """(width, height) read from the header of an image, or None."""
+    try:
+        if image_format == "png" and content[12:16] == b"IHDR":
+            return struct.unpack(">II", content[16:24])
+        if image_format == "gif":
+            return struct.unpack("<HH", content[6:10])
+        if image_format == "jpg":
+            return _jpeg_size(content)
+        if image_format == "webp":
+            return _webp_size(content)
+        if image_format == "ico":
+            # 0 stands for 256 in the first directory entry
+            return content[6] or 256, content[7] or 256
+        if image_format == "svg":
+            return _svg_size(content)
+    except (struct.error, IndexError):
+        return None
+    return None
+
+
+def _resize(content):
+    """content scaled down to fit MAX_DIMENSION, as PNG. Raises AssetError."""
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.thumbnail((MAX_DIMENSION, MAX_DIMENSION))
+            if image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA")
+            output = io.BytesIO()
+            image.save(output, format="PNG", optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise AssetError(f"undecodable image ({e})") from e
+    return output.getvalue()
+
+
+def normalize(content):
+    """
+    Validates content as an image and bounds its size. Returns (content, format,
+    (width, height) or None, oversized). Raises AssetError for anything else.
+    """
+    image_format = sniff_format(content)
+    if image_format is None:
+        raise AssetError("not an image")
+    if image_format == "svg":
+        if SVG_ACTIVE_CONTENT.search(content):
+            raise AssetError("svg with active content")
+        return content, image_format, image_size(content, image_format), False
+
+    size = image_size(content, image_format)
+    if size is None:
+        raise AssetError(f"unreadable {image_format} header")
+    if max(size) <= MAX_DIMENSION:
+        return content, image_format, size, False
+    if Image is None:
+        return content, image_format, size, True
+    content = _resize(content)
+    return content, "png", image_size(content, "png"), False
+
+
+def file_name(content, image_format):
+    return f"{hashlib.sha256(content).hexdigest()[:16]}.{image_format}"
+
+
+def store_asset(url, assets_dir, clients=None):
+    """
+    Downloads, validates and normalizes url into assets_dir. Returns (file name,
+    info, oversized); the file is only written if its hash isn't stored yet.
+    """
+    content, image_format, size, oversized = normalize(fetch(url, clients))
+    name = file_name(content, image_format)
+    path = os.path.join(assets_dir, name)
+    if not os.path.exists(path):
+        writer.write_atomic(path, content)
+    width, height = size or (None, None)
+    info = {
+        "format": image_format,
+        "width": width,
+        "height": height,
+        "bytes": len(content),
+    }
+    return name, info, oversized
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"base_url": DEFAULT_BASE_URL, "urls": {}, "assets": {}}
+
+
+def stored_names(manifest):
+    """{source url: file name} of a manifest, whatever its base_url."""
+    base_url = manifest.get("base_url", "")
+    return {
+        url: path[len(base_url) :] for url, path in manifest.get("urls", {}).items()
+    }
+
+
+def update_assets(
+    chain_details,
+    token_details,
+    paths,
+    clients=None,
+    base_url=DEFAULT_BASE_URL,
+    workers=ASSET_WORKERS,
+    misses=None,
+):
+    """
+    Brings the asset bundle in paths.assets_dir up to date with the urls of
+    chain_details and token_details. Returns (manifest, stats); the caller writes
+    the manifest to paths.assets_manifest.
+    """
+    misses = misses or negative_cache.NegativeCache(
+        negative_cache.default_path("asset"), ttl=RETRY_TTL
+    )
+    previous = load_manifest(paths.assets_manifest)
+    known = stored_names(previous)
+    urls = referenced_urls(chain_details, token_details)
+
+    names = {}
+    assets = {}
+    pending = []
+    stats = {
+        "urls": len(urls),
+        "reused": 0,
+        "downloaded": 0,
+        "failed": 0,
+        "skipped": 0,
+        "oversized": 0,
+        "removed": 0,
+    }
+    for url in urls:
+        name = known.get(url)
+        if name in previous.get("assets", {}) and os.path.exists(
+            os.path.join(paths.assets_dir, name)
+        ):
+            names[url] = name
+            assets[name] = previous["assets"][name]
+            stats["reused"] += 1
+        elif url in misses:
+            stats["skipped"] += 1
+        else:
+            pending.append(url)
+
+    def download(url):
+        try:
+            return url, store_asset(url, paths.assets_dir, clients), None
+        except AssetError as e:
+            return url, None, e
+
+    with metrics.span("assets"):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for url, stored, error in executor.map(download, pending):
+                if error:
+                    print(f"Skipping asset {url[:100]}: {error}")
+                    if not isinstance(error, TransientAssetError):
+                        misses.add(url)
+                    stats["failed"] += 1
+                    continue
+                name, info, oversized = stored
+                names[url] = name
+                assets[name] = info
+                stats["downloaded"] += 1
+                stats["oversized"] += oversized
+    misses.save()
+
+    if os.path.isdir(paths.assets_dir):
+        for name in os.listdir(paths.assets_dir):
+            if name not in assets and re.fullmatch(r"[0-9a-f]{16}\.\w+", name):
+                os.remove(os.path.join(paths.assets_dir, name))
+                stats["removed"] += 1
+
+    stats["files"] = len(assets)
+    manifest = {
+        "base_url": base_url,
+        "urls": {url: base_url + name for url, name in names.items()},
+        "assets": assets,
+    }
+    return manifest, stats
+
+
+def summary(stats):
+    text = (
+        f"Assets: {stats['files']} files for {stats['urls']} urls, "
+        f"{stats['downloaded']} downloaded, {stats['reused']} unchanged, "
+        f"{stats['failed']} failed, {stats['skipped']} skipped (failed recently), "
+        f"{stats['removed']} removed"
+    )
+    if stats["oversized"]:
+        text += (
+            f", {stats['oversized']} larger than {MAX_DIMENSION}px kept as is "
+            "(install Pillow to scale them down)"
+        )
+    return text
@@ -0,0 +1,670 @@
+"""
+Chain details refresh: fetches a chain's ethereum-lists file, ranks its live rpcs
+and resolves its icon, as used by fillChainDetails.py.
+
+Everything takes an optional pipeline.clients.Clients (default: the shared one)
+and pipeline.paths.DataPaths (default: src/data), so the refresh can be embedded:
+
+    details = await chains.refresh_chain("10", paths=DataPaths(my_dir))
+
+refresh_chain fetches and probes in a worker thread; several can run at once, the
+writes of chainDetails.json are serialized.
+"""
+
+import asyncio
+import io
+import json
+import math
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import zip_longest
+from urllib.parse import urlparse
+
+from pipeline import lookup_index, negative_cache, shards, writer
+from pipeline.clients import default_clients
+from pipeline.negative_cache import NegativeCache
+from pipeline.paths import DataPaths
+from pipeline.refresh_state import content_hash
+from pipeline.snapshot import ChunkReader, Snapshot
+
+# contracts.json is read from the data dir, unless this is set to a url
+CONTRACTS_URL = os.environ.get(
+    "PEANUT_DATA_CONTRACTS_URL",
+    # "https://raw.githubusercontent.com/peanutprotocol/peanut-contracts/xchain/contracts.json"
+)
+
+# Upstream base urls can be pointed elsewhere (e.g. benchmarks/mock_upstream.py)
+# with PEANUT_DATA_<NAME> environment variables
+CHAINS_URL = os.environ.get(
+    "PEANUT_DATA_CHAINS_URL",
+    "https://raw.githubusercontent.com/ethereum-lists/chains/master/_data/chains",
+)
+ICONS_URL = os.environ.get(
+    "PEANUT_DATA_ICONS_URL",
+    "https://raw.githubusercontent.com/ethereum-lists/chains/master/_data/icons",
+)
+
+# New URLs for additional icon sources
+CRYPTO_ICONS_URL = os.environ.get(
+    "PEANUT_DATA_CRYPTO_ICONS_URL",
+    "https://raw.githubusercontent.com/spothq/cryptocurrency-icons/master/svg/color",
+)  # append /{icon_name}.svg
+# TRUST_WALLET_ICONS_URL = "https://raw.githubusercontent.com/trustwallet/assets/master/blockchains"
+TRUST_WALLET_ICONS_URL = os.environ.get(
+    "PEANUT_DATA_TRUST_WALLET_ICONS_URL",
+    "https://raw.githubusercontent.com/trustwallet/assets/8ee07e9d791bec6c3ada3cfac73ddfdc4f4a40b7/blockchains/",
+)
+
+# Snapshot mode: ethereum-lists (chain files and icons) from one archive, or a local
+# checkout, and the names of the crypto icons from a GitHub tree listing. Pin a
+# snapshot by pointing the archive url at a commit instead of master. The tree
+# listing is left unpinned on purpose: it has to list the same ref (master) that
+# CRYPTO_ICONS_URL serves the icons from, or it names icons the urls don't have.
+ETHEREUM_LISTS_ARCHIVE_URL = os.environ.get(
+    "PEANUT_DATA_ETHEREUM_LISTS_ARCHIVE_URL",
+    "https://codeload.github.com/ethereum-lists/chains/tar.gz/refs/heads/master",
+)
+CRYPTO_ICONS_TREE_URL = os.environ.get(
+    "PEANUT_DATA_CRYPTO_ICONS_TREE_URL",
+    "https://api.github.com/repos/spothq/cryptocurrency-icons/git/trees/master?recursive=1",
+)
+CRYPTO_ICONS_TREE_PREFIX = "svg/color/"
+
+# Generic default icon URL (replace with a valid URL of your default icon)
+DEFAULT_ICON_URL = "https://raw.githubusercontent.com/spothq/cryptocurrency-icons/master/svg/color/generic.svg"
+
+# How long fetched upstream files are served from the http cache, in seconds
+CHAIN_FILE_TTL = 24 * 60 * 60
+ICON_TTL = 7 * 24 * 60 * 60
+
+# Icon resolution: chains resolved at once, concurrent HEAD probes per chain, and
+# where known misses are remembered
+ICON_CHAIN_WORKERS = 8
+ICON_PROBE_WORKERS = 16
+ICON_PROBE_TIMEOUT = 10
+ICON_MISSES_PATH = negative_cache.default_path("icon")
+
+# RPC probing limits: total probes in flight, and probes in flight per host
+MAX_CONCURRENT_PROBES = 32
+MAX_PROBES_PER_HOST = 4
+
+# RPC scoring: latency samples per rpc, timeout per request, and how many blocks
+# an rpc may trail the chain's median head before it is ranked as stale
+RPC_PROBE_SAMPLES = 3
+RPC_PROBE_TIMEOUT = 5
+MAX_BLOCK_LAG = 10
+
+# Used to probe Infura rpcs, which are stored with a ${INFURA_API_KEY} placeholder
+INFURA_API_KEY = os.environ.get("INFURA_API_KEY")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list, q in [0, 100]."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def rpc_batch_request(rpc, clients=None):
+    """
+    Sends eth_chainId and eth_blockNumber as a single JSON-RPC batch. Falls back to
+    two single calls for endpoints that don't support batches.
+
+    Returns (chain_id, block_number) as ints.
+    """
+    clients = clients or default_clients()
+    calls = [
+        {"jsonrpc": "2.0", "method": "eth_chainId", "params": [], "id": 1},
+        {"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 2},
+    ]
+    response = clients.client.post(rpc, json=calls, timeout=RPC_PROBE_TIMEOUT)
+    results = response.json() if response.status_code == 200 else None
+    if not isinstance(results, list):
+        results = []
+        for call in calls:
+            response = clients.client.post(rpc, json=call, timeout=RPC_PROBE_TIMEOUT)
+            response.raise_for_status()
+            results.append(response.json())
+
+    by_id = {result.get("id"): result.get("result") for result in results}
+    return int(by_id[1], 16), int(by_id[2], 16)
+
+
+def score_rpc(rpc, chain_id, samples=RPC_PROBE_SAMPLES, clients=None):
+    """
+    Probes an rpc a few times and returns its score: latency percentiles (in
+    seconds) and the latest block number it reported. Returns None if the rpc is
+    dead or serves a different chain.
+    """
+    print(f"Checking RPC {rpc}...")
+    if rpc.startswith("wss://"):
+        return None
+
+    url = rpc
+    if "${INFURA_API_KEY}" in rpc:
+        if not INFURA_API_KEY:
+            # can't be probed without a key, keep it unranked
+            return {"rpc": rpc, "p50": None, "p90": None, "block": None}
+        url = rpc.replace("${INFURA_API_KEY}", INFURA_API_KEY)
+
+    latencies = []
+    block = None
+    for _ in range(samples):
+        try:
+            started = time.perf_counter()
+            rpc_chain_id, block = rpc_batch_request(url, clients)
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            print("Error: ", e)
+            return None
+        if rpc_chain_id != int(chain_id):
+            print(
+                f"Warning: RPC {rpc} serves chain id {rpc_chain_id}, expected {chain_id}"
+            )
+            return None
+
+    return {
+        "rpc": rpc,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "block": block,
+    }
+
+
+def rank_rpcs(scores):
+    """
+    Orders the scores of one chain fastest-and-freshest first. Block lag is measured
+    against the median head of all live rpcs; rpcs lagging more than MAX_BLOCK_LAG
+    go after the fresh ones. Unranked rpcs (no latency measured) go last.
+    """
+    blocks = [score["block"] for score in scores if score["block"] is not None]
+    head = statistics.median_low(blocks) if blocks else 0
+    for score in scores:
+        if score["block"] is not None:
+            score["lag"] = max(0, head - score["block"])
+
+    ranked = sorted(
+        (score for score in scores if score["p50"] is not None),
+        key=lambda score: (
+            score["lag"] > MAX_BLOCK_LAG,
+            score["p50"],
+            score["p90"],
+            score["lag"],
+        ),
+    )
+    unranked = [score for score in scores if score["p50"] is None]
+    return ranked + unranked
+
+
+def probe_rpcs(
+    rpcs_by_chain,
+    max_workers=MAX_CONCURRENT_PROBES,
+    max_per_host=MAX_PROBES_PER_HOST,
+    clients=None,
+):
+    """
+    Scores every rpc of every chain concurrently. At most max_workers probes run at
+    once and at most max_per_host of them hit the same host, so the sweep takes
+    about as long as the slowest single probe.
+
+    Returns a dict mapping each chain id to its live rpcs, best first.
+    """
+    probes = list(
+        dict.fromkeys(
+            (chain_id, rpc) for chain_id, rpcs in rpcs_by_chain.items() for rpc in rpcs
+        )
+    )
+    host_limits = {
+        urlparse(rpc).netloc: threading.BoundedSemaphore(max_per_host)
+        for _, rpc in probes
+    }
+
+    def probe(chain_and_rpc):
+        chain_id, rpc = chain_and_rpc
+        with host_limits[urlparse(rpc).netloc]:
+            return score_rpc(rpc, chain_id, clients=clients)
+
+    # interleave hosts so that workers rarely block on the same per-host limit
+    by_host = {}
+    for chain_id, rpc in probes:
+        by_host.setdefault(urlparse(rpc).netloc, []).append((chain_id, rpc))
+    ordered = [
+        item
+        for batch in zip_longest(*by_host.values())
+        for item in batch
+        if item is not None
+    ]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        scores = dict(zip(ordered, executor.map(probe, ordered)))
+
+    live_rpcs = {}
+    for chain_id, rpcs in rpcs_by_chain.items():
+        chain_scores = [
+            scores[(chain_id, rpc)]
+            for rpc in dict.fromkeys(rpcs)
+            if scores[(chain_id, rpc)] is not None
+        ]
+        live_rpcs[chain_id] = [score["rpc"] for score in rank_rpcs(chain_scores)]
+    return live_rpcs
+
+
+def set_live_rpcs(chain_id, details, live_rpcs):
+    details["rpc"] = live_rpcs
+
+    # display a warning if no live rpcs found
+    if len(live_rpcs) == 0:
+        print(f"Warning: No live providers found for chain id {chain_id}")
+
+
+def get_contracts(paths=None, clients=None):
+    """contracts.json from CONTRACTS_URL if it is set, else from paths."""
+    paths = paths or DataPaths()
+    clients = clients or default_clients()
+    if CONTRACTS_URL:
+        response = clients.cache.get(CONTRACTS_URL, ttl=0)
+        if response.status_code == 200:
+            return response.json()
+    else:
+        try:
+            with open(paths.contracts, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading contracts from file: {e}")
+    return None
+
+
+def get_chain_ids(contracts):
+    chain_ids = list(contracts.keys())
+    # filter out all the chain ids that don't have a contract version of 3 or higher
+    return [chain_id for chain_id in chain_ids]
+
+
+def load_snapshot(source=None, clients=None):
+    """
+    A Snapshot of ethereum-lists from source: a local checkout, a .tar.gz file or the
+    url of one (default ETHEREUM_LISTS_ARCHIVE_URL), plus the crypto icon names
+    listed at CRYPTO_ICONS_TREE_URL, if that can be read. The listing is of master,
+    unpinned, like the icons themselves: a pinned archive doesn't pin it.
+    """
+    clients = clients or default_clients()
+    source = source or ETHEREUM_LISTS_ARCHIVE_URL
+    # the archive directories holding the files under CHAINS_URL and ICONS_URL
+    prefixes = {"_data/chains/": CHAINS_URL, "_data/icons/": ICONS_URL}
+    snapshot = Snapshot()
+    if os.path.isdir(source):
+        snapshot.load_checkout(source, prefixes)
+    elif os.path.isfile(source):
+        with open(source, "rb") as f:
+            snapshot.load_archive(f, prefixes)
+    else:
+        with clients.cache.stream(source, ttl=CHAIN_FILE_TTL) as response:
+            if response.status_code != 200:
+                raise Exception(
+                    f"Snapshot {source} fetch failed with HTTP {response.status_code}."
+                )
+            snapshot.load_archive(
+                io.BufferedReader(ChunkReader(response.iter_content())), prefixes
+            )
+
+    if CRYPTO_ICONS_TREE_URL:
+        response = clients.cache.get(CRYPTO_ICONS_TREE_URL, ttl=ICON_TTL)
+        if response.status_code != 200 or not snapshot.load_listing(
+            response.json(), CRYPTO_ICONS_TREE_PREFIX, CRYPTO_ICONS_URL
+        ):
+            print("Could not list the crypto icons, they will be probed instead.")
+    print(snapshot.summary())
+    return snapshot
+
+
+def fetch_upstream_file(url, ttl, clients=None, misses=None):
+    """
+    The content of an upstream file, from the clients' snapshot if it covers url,
+    or None if the file doesn't exist or couldn't be fetched. Only a definitive
+    miss (not in the snapshot, or a 404) is added to the misses negative cache.
+    """
+    clients = clients or default_clients()
+    if clients.snapshot is not None and clients.snapshot.covers(url):
+        content = clients.snapshot.read(url)
+        if content is None and misses is not None:
+            misses.add(url)
+        return content
+    response = clients.cache.get(url, ttl=ttl)
+    if response.status_code == 404 and misses is not None:
+        misses.add(url)
+    return response.content if response.status_code == 200 else None
+
+
+def fetch_chain_file(chain_id, clients=None, ttl=CHAIN_FILE_TTL):
+    """
+    The chain's ethereum-lists file, or None. With ttl=0 a cached copy is
+    revalidated upstream (a conditional request with its ETag).
+    """
+    chain_file = f"eip155-{chain_id}.json"
+    return fetch_upstream_file(os.path.join(CHAINS_URL, chain_file), ttl, clients)
+
+
+def chain_needs_refresh(chain_id, state, max_age, clients=None, chain_file=None):
+    """
+    In incremental mode, an existing chain is refreshed if its ethereum-lists file
+    changed since the last refresh, or if its data or rpc check is older than
+    max_age hours. chain_file is the file if the caller already revalidated it;
+    otherwise it is revalidated here, since the cached copy may be up to
+    CHAIN_FILE_TTL old.
+    """
+    if chain_file is None:
+        chain_file = fetch_chain_file(chain_id, clients, ttl=0)
+    if chain_file is None:
+        return False
+    record = state.get("chains", chain_id)
+    return (
+        content_hash(chain_file) != record.get("content_hash")
+        or state.is_stale("chains", chain_id, "fetched_at", max_age)
+        or state.is_stale("chains", chain_id, "rpc_checked_at", max_age)
+    )
+
+
+def get_chain_details(chain_id: int, check_rpcs=True, clients=None, chain_file=None):
+    """
+    Fetches the chain details from ethereum-lists, or parses chain_file if the
+    caller already fetched it. With check_rpcs=False the rpc list is left
+    unchecked, so that the caller can probe all chains at once.
+    """
+    if chain_file is None:
+        chain_file = fetch_chain_file(chain_id, clients)
+    if chain_file is None:
+        return None
+
+    details = json.loads(chain_file)
+    details["chainId"] = str(details["chainId"])
+
+    # check each rpc for liveliness and remove if dead
+    if check_rpcs:
+        live_rpcs = probe_rpcs({chain_id: details.get("rpc", [])}, clients=clients)[
+            chain_id
+        ]
+        set_live_rpcs(chain_id, details, live_rpcs)
+
+    return details
+
+
+def icon_candidates(possible_chain_names):
+    """
+    (source, url, format) for every name and icon source, in priority order: each
+    name is tried against ICONS_URL, CRYPTO_ICONS_URL and TRUST_WALLET_ICONS_URL
+    before the next name. ICONS_URL files are json, their format is read later.
+    """
+    sources = [
+        ("ICONS_URL", ICONS_URL, "{}.json", None),
+        ("CRYPTO_ICONS_URL", CRYPTO_ICONS_URL, "{}.svg", "svg"),
+        ("TRUST_WALLET_ICONS_URL", TRUST_WALLET_ICONS_URL, "{}/info/logo.png", "png"),
+    ]
+    return [
+        (source, os.path.join(base_url, template.format(name)), icon_format)
+        for name in dict.fromkeys(possible_chain_names)
+        for source, base_url, template, icon_format in sources
+    ]
+
+
+def probe_icon(url, clients=None):
+    """
+    HEAD request for an icon candidate. Returns True on hit, False on 404. A probe
+    isn't retried: find_icon passes over a failed one (without caching it as a
+    miss) and falls back to the next candidate.
+    """
+    clients = clients or default_clients()
+    response = clients.scheduler.request(
+        "HEAD", url, max_retries=0, timeout=ICON_PROBE_TIMEOUT, allow_redirects=True
+    )
+    if response.status_code == 404:
+        return False
+    response.raise_for_status()
+    return True
+
+
+def find_icon(candidates, misses, clients=None):
+    """
+    Probes all candidates concurrently and returns the index of the highest
+    priority hit, or None. Probes behind a confirmed hit are cancelled; 404s are
+    added to the misses negative cache, and candidates already in it are skipped.
+    Candidates the clients' snapshot knows about aren't probed at all.
+    """
+    snapshot = (clients or default_clients()).snapshot
+    found = []
+    for _, url, _ in candidates:
+        known = snapshot.exists(url) if snapshot is not None else None
+        if known is None and url in misses:
+            known = False
+        found.append(known)
+    # nothing behind a known hit needs probing
+    last = next((i for i, hit in enumerate(found) if hit), len(found))
+
+    def best():
+        # the first candidate that isn't a miss, if it's confirmed
+        for i, hit in enumerate(found):
+            if hit is not False:
+                return i if hit else None, hit is None
+        return None, False
+
+    with ThreadPoolExecutor(max_workers=ICON_PROBE_WORKERS) as executor:
+        futures = {
+            executor.submit(probe_icon, url, clients): i
+            for i, (_, url, _) in enumerate(candidates[:last])
+            if found[i] is None
+        }
+        pending = set(futures)
+        while True:
+            winner, undecided = best()
+            if not undecided or not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    found[i] = future.result()
+                except Exception as e:
+                    print(f"Error probing icon {candidates[i][1]}: {e}")
+                    found[i] = False
+                    continue
+                if not found[i]:
+                    misses.add(candidates[i][1])
+        for future in pending:
+            future.cancel()
+
+    return winner
+
+
+def get_chain_icon(
+    possible_chain_names, existing_chain_details, clients=None, misses=None
+):
+    """
+    The icon of a chain, looked up by its names. misses is the negative cache of
+    icon urls shared by concurrent lookups; without one, the lookup loads and saves
+    its own.
+    """
+    # Check if the icon already exists in the existing chain details
+    existing_icon = existing_chain_details.get("icon")
+    if existing_icon:
+        print(f"Icon already exists for {possible_chain_names[0]}...")
+        return existing_icon
+
+    clients = clients or default_clients()
+    print(f"Trying to get icon info for {possible_chain_names}...")
+    own_misses = misses is None
+    if own_misses:
+        misses = NegativeCache(ICON_MISSES_PATH)
+    candidates = icon_candidates(possible_chain_names)
+    try:
+        while True:
+            winner = find_icon(candidates, misses, clients)
+            if winner is None:
+                break
+            source, url, icon_format = candidates[winner]
+
+            if source != "ICONS_URL":
+                print(f"Got icon info from {source}: ", url)
+                return {"url": url, "format": icon_format}
+
+            # ethereum-lists icons are json files describing the actual image
+            icon_file = fetch_upstream_file(url, ICON_TTL, clients, misses)
+            if icon_file is not None:
+                icon_info = json.loads(icon_file)[0]
+                print(
+                    "Got icon info from ICONS_URL: ",
+                    icon_info["url"].replace("ipfs://", "https://ipfs.io/ipfs/"),
+                )
+                return {
+                    "url": icon_info["url"].replace("ipfs://", "https://ipfs.io/ipfs/"),
+                    "format": icon_info["format"],
+                }
+            # try the next candidate; a 404 is in misses, other errors are retried
+            # on the next run
+            candidates = candidates[:winner] + candidates[winner + 1 :]
+    finally:
+        if own_misses:
+            misses.save()
+
+    # If none of the above succeed, return a default icon
+    print(
+        "Failed to get icon info. Returning default icon. Failed for names: ",
+        possible_chain_names,
+    )
+    return {"url": DEFAULT_ICON_URL, "format": "png"}
+
+
+def icon_names(details):
+    """The names a chain's icon is looked up by, in priority order."""
+    possible_chain_names = []
+    if details.get("icon"):
+        possible_chain_names.append(details["icon"])
+    if details.get("short_name"):
+        possible_chain_names.append(details["short_name"])
+    if details.get("shortName"):
+        possible_chain_names.append(details["shortName"])
+    if details.get("name"):
+        possible_chain_names.append(details["name"])
+    if details.get("chain"):
+        possible_chain_names.append(details["chain"])
+    possible_chain_names.extend([name.lower() for name in possible_chain_names])
+    return possible_chain_names
+
+
+def fetch_chain(chain_id, contract, check_rpcs=True, clients=None, chain_file=None):
+    """
+    get_chain_details plus the mainnet flag from the chain's contracts.json entry.
+    Returns None if ethereum-lists has no file for the chain.
+    """
+    details = get_chain_details(
+        chain_id, check_rpcs=check_rpcs, clients=clients, chain_file=chain_file
+    )
+    if not details:
+        return None
+    details["mainnet"] = contract.get("mainnet", "false").lower() == "true"
+    return details
+
+
+def finish_chain(chain_id, details, existing=None, clients=None, misses=None):
+    """
+    The chainDetails entry for freshly fetched details: an existing entry keeps its
+    fields but takes the new rpcs, faucets, explorers and infoURL; a new one gets
+    an icon.
+    """
+    if existing:
+        # Add newly fetched fields that don't yet exist
+        # in the current entry in chain_details
+        new_details = {**details, **existing}
+
+        # and update a few specific fields
+        new_details["rpc"] = details["rpc"]
+        new_details["faucets"] = details["faucets"]
+        new_details["explorers"] = details["explorers"]
+        new_details["infoURL"] = details["infoURL"]
+        return new_details
+
+    details["icon"] = get_chain_icon(icon_names(details), {}, clients, misses)
+    return details
+
+
+def finish_new_chains(details_by_chain, clients=None, max_workers=ICON_CHAIN_WORKERS):
+    """
+    finish_chain for chains that aren't in chainDetails.json yet, resolving their
+    icons concurrently: at most max_workers chains at once, each probing its icon
+    candidates with up to ICON_PROBE_WORKERS requests. Returns {chainId: entry} in
+    the order of details_by_chain.
+    """
+    misses = NegativeCache(ICON_MISSES_PATH)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            entries = executor.map(
+                lambda item: finish_chain(*item, clients=clients, misses=misses),
+                details_by_chain.items(),
+            )
+            return dict(zip(details_by_chain, entries))
+    finally:
+        misses.save()
+
+
+def build_chain(chain_id, contract, existing=None, clients=None):
+    """fetch_chain and finish_chain for a single chain, or None."""
+    details = fetch_chain(chain_id, contract, clients=clients)
+    if details is None:
+        return None
+    return finish_chain(chain_id, details, existing, clients)
+
+
+def load_chain_details(paths=None):
+    paths = paths or DataPaths()
+    if not os.path.exists(paths.chain_details):
+        return {}
+    with open(paths.chain_details, "r") as f:
+        return json.load(f)
+
+
+def write_chain_details(chain_details, paths=None):
+    """
+    Writes chainDetails.json and its build variants, then the shards and the lookup
+    index.
+    """
+    paths = paths or DataPaths()
+    report = writer.write_json_artifact(
+        paths.chain_details, chain_details, build_dir=paths.build_dir
+    )
+    shards.write_shards_from_files(
+        paths.chain_details, paths.token_details, paths.contracts, paths.shards_dir
+    )
+    lookup_index.write_lookup_index_from_files(paths)
+    return report
+
+
+_save_lock = threading.Lock()
+
+
+def save_chains(entries, paths=None):
+    """Stores {chainId: entry} in chainDetails.json, keeping the other chains."""
+    with _save_lock:
+        chain_details = load_chain_details(paths)
+        chain_details.update(entries)
+        return write_chain_details(chain_details, paths)
+
+
+async def refresh_chain(chain_id, paths=None, clients=None, save=True):
+    """
+    Refreshes one chain of contracts.json: fetches its details, probes its rpcs and
+    merges them into its existing entry (or resolves an icon for a new one). Saves
+    the entry to chainDetails.json unless save is False, and returns it, or None if
+    ethereum-lists has no file for the chain.
+    """
+    chain_id = str(chain_id)
+    contracts = await asyncio.to_thread(get_contracts, paths, clients)
+    if not contracts or chain_id not in contracts:
+        raise KeyError(f"Chain id {chain_id} is not in contracts.json")
+    existing = (await asyncio.to_thread(load_chain_details, paths)).get(chain_id)
+    entry = await asyncio.to_thread(
+        build_chain, chain_id, contracts[chain_id], existing, clients
+    )
+    if entry is not None and save:
+        await asyncio.to_thread(save_chains, {chain_id: entry}, paths)
+    return entry
@@ -0,0 +1,44 @@
+"""
+The http stack a refresh runs on: an http_cache.HttpCache in front of a
+rate_limit.RequestScheduler in front of an http_client.HttpClient.
+
+Clients() is the shared default stack of the scripts. Services embedding the
+refresh can pass their own, e.g. Clients(client=HttpClient(timeout=5)) or a
+cache in another directory, to every pipeline.chains / pipeline.tokens call.
+
+A Clients can also carry a pipeline.snapshot.Snapshot: urls it covers are read
+from the snapshot rather than requested (see chains.load_snapshot).
+"""
+
+from pipeline import http_cache, http_client, rate_limit
+
+
+class Clients:
+    def __init__(self, cache=None, scheduler=None, client=None, snapshot=None):
+        """Any part left out is the default one, or built on the parts given."""
+        self.client = client or http_client.default_client()
+        if scheduler is None:
+            scheduler = (
+                rate_limit.default_scheduler()
+                if client is None
+                else rate_limit.RequestScheduler(send=self.client.request)
+            )
+        self.scheduler = scheduler
+        if cache is None:
+            cache = (
+                http_cache.default_cache()
+                if scheduler is rate_limit.default_scheduler()
+                else http_cache.HttpCache(scheduler=scheduler)
+            )
+        self.cache = cache
+        self.snapshot = snapshot
+
+
+_default_clients = None
+
+
+def default_clients():
+    global _default_clients
+    if _default_clients is None:
+        _default_clients = Clients()
+    return _default_clients
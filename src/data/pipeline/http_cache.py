@@ -0,0 +1,329 @@
+"""
+On-disk HTTP cache for the data refresh scripts.
+
+Every GET goes through HttpCache.get, which stores the response body and its
+validators (ETag / Last-Modified) under CACHE_DIR. A cached response younger than
+its ttl is served without touching the network. An older one is revalidated with a
+conditional request, so an unchanged upstream only costs a 304. Requests that do go
+out are scheduled by pipeline.rate_limit.
+
+Large bodies can be read incrementally with HttpCache.stream instead.
+
+Offline mode (PEANUT_DATA_OFFLINE=1) serves only from cache, whatever the age of the
+entry. A miss in offline mode returns a 504, like an HTTP only-if-cached request.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from pipeline import metrics, rate_limit, writer
+
+CACHE_DIR = os.environ.get(
+    "PEANUT_DATA_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache", "http"),
+)
+OFFLINE = os.environ.get("PEANUT_DATA_OFFLINE", "").lower() in ("1", "true", "yes")
+
+# Default time to live of a cached response, in seconds
+DEFAULT_TTL = 60 * 60
+# Misses are cached too, so that known 404s aren't requested on every run
+CACHEABLE_STATUS_CODES = (200, 404)
+REQUEST_TIMEOUT = 30
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class CachedResponse:
+    """The subset of requests.Response used by the refresh scripts."""
+
+    def __init__(self, url, status_code, content=b"", headers=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class StreamedResponse:
+    """A response whose body is read chunk by chunk, see HttpCache.stream."""
+
+    def __init__(self, url, status_code, chunks=(), headers=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.from_cache = from_cache
+        self._chunks = chunks
+
+    def iter_content(self):
+        return iter(self._chunks)
+
+    def close(self):
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+
+
+class HttpCache:
+    def __init__(
+        self,
+        cache_dir=CACHE_DIR,
+        offline=OFFLINE,
+        default_ttl=DEFAULT_TTL,
+        scheduler=None,
+    ):
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.default_ttl = default_ttl
+        # the rate_limit.RequestScheduler requests are sent through
+        self.scheduler = scheduler or rate_limit.default_scheduler()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "bytes_fetched": 0}
+        # gets and streams run on the fetch threads of both refresh scripts
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def count(self, stat, amount=1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".json", base + ".body"
+
+    def _load_meta(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.exists(body_path) else None
+
+    def _read_body(self, url):
+        with open(self._paths(url)[1], "rb") as f:
+            return f.read()
+
+    def _read_body_chunks(self, url):
+        with open(self._paths(url)[1], "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _store(self, url, meta, body):
+        meta_path, body_path = self._paths(url)
+        # body first, so that a metadata file never points at a missing body
+        if body is not None:
+            writer.write_atomic(body_path, body)
+        writer.write_atomic(meta_path, json.dumps(meta))
+
+    def _is_fresh(self, meta, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        return self.offline or time.time() - meta["fetched_at"] < ttl
+
+    def _conditional_headers(self, meta, headers):
+        request_headers = dict(headers or {})
+        if meta is not None and meta["status_code"] == 200:
+            if meta.get("etag"):
+                request_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                request_headers["If-Modified-Since"] = meta["last_modified"]
+        return request_headers
+
+    def _request(self, url, meta, headers, stream=False):
+        """
+        Sends the (conditional) request. Returns None instead of raising when the
+        request fails but a stale copy can be served.
+        """
+        try:
+            return self.scheduler.request(
+                "GET",
+                url,
+                headers=self._conditional_headers(meta, headers),
+                timeout=REQUEST_TIMEOUT,
+                stream=stream,
+            )
+        except requests.RequestException as e:
+            if meta is None:
+                raise
+            print(f"Error revalidating {url}, serving the stale copy: {e}")
+            return None
+
+    def _revalidated(self, url, meta):
+        self.count("revalidated")
+        metrics.record_lookup("http", "revalidated")
+        meta["fetched_at"] = time.time()
+        self._store(url, meta, None)
+
+    def _meta_from_response(self, response):
+        return {
+            "url": response.url,
+            "status_code": response.status_code,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+            "fetched_at": time.time(),
+        }
+
+    def _cached_headers(self, meta):
+        headers = {}
+        if meta.get("content_type"):
+            headers["Content-Type"] = meta["content_type"]
+        return headers
+
+    def get(self, url, ttl=None, headers=None):
+        """
+        Returns a CachedResponse for url. ttl (seconds) overrides default_ttl for
+        this request; headers are sent upstream but are not part of the cache key.
+        """
+        meta = self._load_meta(url)
+
+        if meta is not None and self._is_fresh(meta, ttl):
+            self.count("hits")
+            metrics.record_lookup("http", "hit")
+            return self._response(url, meta)
+
+        if self.offline:
+            print(f"Offline mode: {url} is not cached.")
+            return CachedResponse(url, 504)
+
+        response = self._request(url, meta, headers)
+        if response is None:
+            self.count("hits")
+            metrics.record_lookup("http", "hit")
+            return self._response(url, meta)
+
+        if response.status_code == 304 and meta is not None:
+            self._revalidated(url, meta)
+            return self._response(url, meta)
+
+        self.count("misses")
+        metrics.record_lookup("http", "miss")
+        self.count("bytes_fetched", len(response.content))
+        if response.status_code in CACHEABLE_STATUS_CODES:
+            self._store(url, self._meta_from_response(response), response.content)
+
+        return CachedResponse(
+            response.url, response.status_code, response.content, response.headers
+        )
+
+    def _response(self, url, meta):
+        return CachedResponse(
+            meta["url"],
+            meta["status_code"],
+            self._read_body(url),
+            self._cached_headers(meta),
+            from_cache=True,
+        )
+
+    @contextlib.contextmanager
+    def stream(self, url, ttl=None, headers=None):
+        """
+        Like get, but yields a StreamedResponse whose body is read in chunks from
+        the cache file or the network. A body read from the network is cached only
+        if it was read to the end, since a consumer may stop early.
+        """
+        meta = self._load_meta(url)
+        response = None
+
+        if meta is not None and self._is_fresh(meta, ttl):
+            self.count("hits")
+            metrics.record_lookup("http", "hit")
+            streamed = self._streamed_response(url, meta)
+        elif self.offline:
+            print(f"Offline mode: {url} is not cached.")
+            streamed = StreamedResponse(url, 504)
+        else:
+            response = self._request(url, meta, headers, stream=True)
+            if response is None:
+                self.count("hits")
+                metrics.record_lookup("http", "hit")
+                streamed = self._streamed_response(url, meta)
+            elif response.status_code == 304 and meta is not None:
+                self._revalidated(url, meta)
+                streamed = self._streamed_response(url, meta)
+            else:
+                self.count("misses")
+                metrics.record_lookup("http", "miss")
+                streamed = StreamedResponse(
+                    response.url,
+                    response.status_code,
+                    self._tee(url, response),
+                    response.headers,
+                )
+
+        try:
+            yield streamed
+        finally:
+            streamed.close()
+            if response is not None:
+                response.close()
+
+    def _streamed_response(self, url, meta):
+        return StreamedResponse(
+            meta["url"],
+            meta["status_code"],
+            self._read_body_chunks(url),
+            self._cached_headers(meta),
+            from_cache=True,
+        )
+
+    def _tee(self, url, response):
+        """Yields the body chunks of response, writing them to the cache as well."""
+
+        def chunks():
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                self.count("bytes_fetched", len(chunk))
+                metrics.record_bytes(url, len(chunk))
+                yield chunk
+
+        if response.status_code not in CACHEABLE_STATUS_CODES:
+            yield from chunks()
+            return
+        meta_path, body_path = self._paths(url)
+        # the body is only cached if it was read to the end
+        with writer.atomic_file(body_path) as f:
+            for chunk in chunks():
+                f.write(chunk)
+                yield chunk
+        writer.write_atomic(meta_path, json.dumps(self._meta_from_response(response)))
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = HttpCache()
+    return _default_cache
+
+
+def get(url, ttl=None, headers=None):
+    """GET through the shared default cache."""
+    return default_cache().get(url, ttl=ttl, headers=headers)
+
+
+def stream(url, ttl=None, headers=None):
+    """Streamed GET through the shared default cache, see HttpCache.stream."""
+    return default_cache().stream(url, ttl=ttl, headers=headers)
+
+
+def summary():
+    stats = default_cache().stats
+    return (
+        f"HTTP cache: {stats['hits']} hits, {stats['revalidated']} revalidated, "
+        f"{stats['misses']} fetched ({stats['bytes_fetched']} bytes)"
+    )
@@ -0,0 +1,146 @@
+"""
+Pooled, keep-alive HTTP client shared by the data refresh scripts.
+
+All requests go through one requests.Session whose adapter keeps a connection pool
+per host, so the many requests to the same few hosts (raw.githubusercontent.com,
+coingecko, the rpcs of a chain) reuse connections instead of paying a TCP + TLS
+handshake each time. The a* methods run the same pooled requests from asyncio code.
+Every request is recorded in pipeline.metrics.
+
+Pool sizes and the default timeout can be set with PEANUT_DATA_POOL_HOSTS,
+PEANUT_DATA_POOL_SIZE and PEANUT_DATA_HTTP_TIMEOUT.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pipeline import metrics
+
+# Number of per-host pools kept, and connections kept per host
+POOL_HOSTS = int(os.environ.get("PEANUT_DATA_POOL_HOSTS", 64))
+POOL_SIZE = int(os.environ.get("PEANUT_DATA_POOL_SIZE", 16))
+# Default (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = float(os.environ.get("PEANUT_DATA_HTTP_TIMEOUT", 30))
+
+
+class HttpClient:
+    def __init__(
+        self, pool_hosts=POOL_HOSTS, pool_size=POOL_SIZE, timeout=DEFAULT_TIMEOUT
+    ):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_hosts, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        # counts of pools evicted from the pool manager, so they aren't lost
+        self._evicted = {}
+        self._lock = threading.Lock()
+        self.adapter.poolmanager.pools.dispose_func = self._on_pool_evicted
+
+    def _on_pool_evicted(self, pool):
+        with self._lock:
+            self._add_counts(self._evicted, pool)
+        pool.close()
+
+    @staticmethod
+    def _add_counts(counts, pool):
+        host = f"{pool.host}:{pool.port}" if pool.port else pool.host
+        requests_count, connections = counts.get(host, (0, 0))
+        counts[host] = (
+            requests_count + pool.num_requests,
+            connections + pool.num_connections,
+        )
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.record_request(url, None, time.perf_counter() - start)
+            raise
+        # a streamed body isn't read yet, its reader records the bytes
+        size = 0 if kwargs.get("stream") else len(response.content)
+        metrics.record_request(
+            url, response.status_code, response.elapsed.total_seconds(), size
+        )
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    async def arequest(self, method, url, **kwargs):
+        return await asyncio.to_thread(self.request, method, url, **kwargs)
+
+    async def aget(self, url, **kwargs):
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url, **kwargs):
+        return await self.arequest("POST", url, **kwargs)
+
+    def connection_stats(self):
+        """
+        Requests sent and connections opened, per host and in total. Every request
+        beyond the connections opened for its host reused a kept-alive connection.
+        """
+        pools = self.adapter.poolmanager.pools
+        with self._lock:
+            counts = dict(self._evicted)
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    self._add_counts(counts, pool)
+
+        hosts = {
+            host: {
+                "requests": requests_count,
+                "connections": connections,
+                "reused": max(0, requests_count - connections),
+            }
+            for host, (requests_count, connections) in sorted(counts.items())
+        }
+        total = {
+            field: sum(host[field] for host in hosts.values())
+            for field in ("requests", "connections", "reused")
+        }
+        return {"hosts": hosts, "total": total}
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = HttpClient()
+
+
+def default_client():
+    return _default_client
+
+
+def request(method, url, **kwargs):
+    """Request through the shared default client."""
+    return _default_client.request(method, url, **kwargs)
+
+
+def post(url, **kwargs):
+    return _default_client.post(url, **kwargs)
+
+
+def summary():
+    total = default_client().connection_stats()["total"]
+    return (
+        f"Connections: {total['connections']} opened for {total['requests']} "
+        f"requests ({total['reused']} reused)"
+    )
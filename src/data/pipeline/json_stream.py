@@ -0,0 +1,127 @@
+"""
+Incremental parsing of large JSON documents.
+
+iter_json_array yields the items of one array in a JSON document delivered as an
+iterable of byte chunks (e.g. a streamed HTTP body), without ever holding the whole
+document in memory. The consumer can stop at any time, and no more of the body is
+read than needed for the items it took.
+"""
+
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+class _Reader:
+    """A text buffer over byte chunks, with a read position."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Reads one more chunk into the buffer. Returns False at end of input."""
+        if self.eof:
+            return False
+        # drop consumed text so the buffer stays about one item + one chunk long
+        self.buffer = self.buffer[self.pos :]
+        self.pos = 0
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self._utf8.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Returns the next non-whitespace character, or "" at end of input."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value, reading more input as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number cut at the end of the buffer decodes as a prefix of itself
+            if (
+                isinstance(value, (int, float))
+                and not self.eof
+                and (end == len(self.buffer) or self.buffer[end] in _NUMBER_CHARS)
+                and self.fill()
+            ):
+                continue
+            self.pos = end
+            return value
+
+
+def _find_array(reader, path):
+    """Advances the reader to just after the "[" of the array at path."""
+    for key in path:
+        reader.expect("{")
+        while True:
+            if reader.peek() == "}":
+                raise ValueError(f"Key {key!r} not found")
+            found_key = reader.value()
+            reader.expect(":")
+            if found_key == key:
+                break
+            reader.value()
+            if reader.peek() == ",":
+                reader.pos += 1
+    reader.expect("[")
+
+
+def iter_json_array(chunks, path=()):
+    """
+    Yields the items of the JSON array at path, a sequence of object keys leading
+    from the document root to the array; () means the root is the array.
+
+    Raises ValueError if the document doesn't have an array at path.
+    """
+    reader = _Reader(chunks)
+    _find_array(reader, path)
+
+    if reader.peek() != "]":
+        while True:
+            yield reader.value()
+            separator = reader.peek()
+            if separator == "]":
+                break
+            if separator != ",":
+                raise ValueError(
+                    f"Expected ',' or ']' at offset {reader.pos}, found {separator!r}"
+                )
+            reader.pos += 1
+
+    if not path:
+        # a root array is the whole document: read it to the end, which lets a
+        # streamed download complete (and be cached)
+        reader.pos += 1
+        trailing = reader.peek()
+        if trailing:
+            raise ValueError(f"Unexpected {trailing!r} after the array")
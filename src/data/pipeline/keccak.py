@@ -0,0 +1,131 @@
+"""
+Keccak-256 (the pre-standard SHA-3 that Ethereum uses, not hashlib.sha3_256) and
+the ABI helpers built on it: canonical signatures, function selectors and event
+topics.
+
+pycryptodome is used when installed; otherwise a pure Python implementation,
+fast enough for hashing ABI signatures, takes over.
+"""
+
+try:
+    from Crypto.Hash import keccak as _pycryptodome_keccak
+except ImportError:
+    _pycryptodome_keccak = None
+
+_RATE = 136  # bytes, for a 256 bit output
+_ROUND_CONSTANTS = (
+    0x0000000000000001,
+    0x0000000000008082,
+    0x800000000000808A,
+    0x8000000080008000,
+    0x000000000000808B,
+    0x0000000080000001,
+    0x8000000080008081,
+    0x8000000000008009,
+    0x000000000000008A,
+    0x0000000000000088,
+    0x0000000080008009,
+    0x000000008000000A,
+    0x000000008000808B,
+    0x800000000000008B,
+    0x8000000000008089,
+    0x8000000000008003,
+    0x8000000000008002,
+    0x8000000000000080,
+    0x000000000000800A,
+    0x800000008000000A,
+    0x8000000080008081,
+    0x8000000000008080,
+    0x0000000080000001,
+    0x8000000080008008,
+)
+# rotation offsets, indexed by x + 5 * y
+_ROTATIONS = (
+    0, 1, 62, 28, 27,
+    36, 44, 6, 55, 20,
+    3, 10, 43, 25, 39,
+    41, 45, 15, 21, 8,
+    18, 2, 61, 56, 14,
+)  # fmt: skip
+_MASK = (1 << 64) - 1
+
+
+def _rotate(value, shift):
+    return ((value << shift) | (value >> (64 - shift))) & _MASK if shift else value
+
+
+def _keccak_f(state):
+    """The keccak-f[1600] permutation of 25 lanes, indexed by x + 5 * y."""
+    for round_constant in _ROUND_CONSTANTS:
+        # theta
+        columns = [
+            state[x] ^ state[x + 5] ^ state[x + 10] ^ state[x + 15] ^ state[x + 20]
+            for x in range(5)
+        ]
+        for x in range(5):
+            d = columns[(x - 1) % 5] ^ _rotate(columns[(x + 1) % 5], 1)
+            for y in range(0, 25, 5):
+                state[x + y] ^= d
+        # rho and pi
+        moved = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                moved[y + 5 * ((2 * x + 3 * y) % 5)] = _rotate(
+                    state[x + 5 * y], _ROTATIONS[x + 5 * y]
+                )
+        # chi
+        for y in range(0, 25, 5):
+            row = moved[y : y + 5]
+            for x in range(5):
+                state[x + y] = row[x] ^ (~row[(x + 1) % 5] & row[(x + 2) % 5])
+        # iota
+        state[0] ^= round_constant
+
+
+def _keccak256_python(data):
+    padded = bytearray(data)
+    padded.append(0x01)
+    padded.extend(b"\0" * (-len(padded) % _RATE))
+    padded[-1] |= 0x80
+
+    state = [0] * 25
+    for offset in range(0, len(padded), _RATE):
+        block = padded[offset : offset + _RATE]
+        for i in range(_RATE // 8):
+            state[i] ^= int.from_bytes(block[8 * i : 8 * i + 8], "little")
+        _keccak_f(state)
+    return b"".join(lane.to_bytes(8, "little") for lane in state[:4])
+
+
+def keccak256(data):
+    """The keccak-256 digest of data (bytes or str)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if _pycryptodome_keccak is not None:
+        return _pycryptodome_keccak.new(data=data, digest_bits=256).digest()
+    return _keccak256_python(data)
+
+
+def canonical_type(param):
+    """The canonical type of an ABI parameter, with tuples spelled out."""
+    abi_type = param["type"]
+    if abi_type.startswith("tuple"):
+        components = ",".join(canonical_type(c) for c in param["components"])
+        return f"({components}){abi_type[len('tuple'):]}"
+    return abi_type
+
+
+def signature(entry):
+    """The canonical signature of an ABI function, event or error entry."""
+    inputs = ",".join(canonical_type(param) for param in entry.get("inputs", []))
+    return f"{entry['name']}({inputs})"
+
+
+def selector(signature_text):
+    """The 4 byte function selector of a signature, as 0x prefixed hex."""
+    return "0x" + keccak256(signature_text)[:4].hex()
+
+
+def topic(signature_text):
+    """The topic0 of an event signature, as 0x prefixed hex."""
+    return "0x" + keccak256(signature_text).hex()
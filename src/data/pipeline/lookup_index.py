@@ -0,0 +1,178 @@
+"""
+Reverse lookup indexes of contracts.json, tokenDetails.json, chainDetails.json and
+chainMap.json, so a contract address, a token or a chain alias is resolved with
+one dict lookup instead of a scan of the data files:
+
+- contracts: lowercase Peanut contract address -> {chainId: version key} (e.g.
+  "v4.2", "Bv4.3", "Rv4.2"). The same address is deployed on several chains, so
+  an address maps to every chain it is on.
+- tokens: chainId -> lowercase token address -> the token's decimals, name,
+  symbol and logoURI.
+- aliases: lowercase chain alias (chainMap.json keys, chainDetails.json
+  shortNames and contracts.json names) -> chainId.
+
+Keys that would resolve to more than one value are duplicates, listed in the
+index as {"index", "key", "values"} and reported when it is written:
+
+- a contract address under several version keys of the same chain (the first
+  one in contracts.json is indexed)
+- a token address listed twice on a chain (the first one is indexed, as the
+  SDK's chainDetails.tokens.find() resolves it)
+- an alias of several chains (the first one is indexed)
+
+The index is rebuilt with the shards at the end of both refresh scripts, or with
+python3 -m pipeline.lookup_index [--data-dir DIR] [--fail-on-duplicate] (from
+src/data), which exits with 1 if there are duplicates.
+"""
+
+import argparse
+import json
+import re
+import sys
+
+from pipeline import writer
+from pipeline.paths import DataPaths
+from pipeline.token_store import normalise_address
+
+ADDRESS = re.compile(r"0x[0-9a-fA-F]{40}")
+TOKEN_FIELDS = ("decimals", "name", "symbol", "logoURI")
+
+
+def _load_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def contract_index(contracts, duplicates):
+    index = {}
+    for chain_id, contract in contracts.items():
+        for version, address in contract.items():
+            if not isinstance(address, str) or not ADDRESS.fullmatch(address):
+                continue
+            chains = index.setdefault(normalise_address(address), {})
+            if chain_id in chains:
+                duplicates.append(
+                    {
+                        "index": "contracts",
+                        "key": f"{chain_id}:{normalise_address(address)}",
+                        "values": [chains[chain_id], version],
+                    }
+                )
+                continue
+            chains[chain_id] = version
+    return index
+
+
+def token_index(token_details, duplicates):
+    index = {}
+    for entry in token_details:
+        tokens = index.setdefault(entry["chainId"], {})
+        for token in entry["tokens"]:
+            address = normalise_address(token["address"])
+            fields = {key: token[key] for key in TOKEN_FIELDS if key in token}
+            if address in tokens:
+                if tokens[address] != fields:
+                    duplicates.append(
+                        {
+                            "index": "tokens",
+                            "key": f"{entry['chainId']}:{address}",
+                            "values": [tokens[address], fields],
+                        }
+                    )
+                continue
+            tokens[address] = fields
+    return index
+
+
+def alias_index(chain_map, chain_details, contracts, duplicates):
+    aliases = [(alias, str(chain_id)) for alias, chain_id in chain_map.items()]
+    aliases += [
+        (chain["shortName"], chain_id)
+        for chain_id, chain in chain_details.items()
+        if chain.get("shortName")
+    ]
+    aliases += [
+        (contract["name"], chain_id)
+        for chain_id, contract in contracts.items()
+        if contract.get("name")
+    ]
+
+    index = {}
+    for alias, chain_id in aliases:
+        alias = alias.lower()
+        if alias not in index:
+            index[alias] = chain_id
+        elif index[alias] != chain_id:
+            duplicates.append(
+                {"index": "aliases", "key": alias, "values": [index[alias], chain_id]}
+            )
+    return index
+
+
+def build_lookup_index(contracts, chain_details, token_details, chain_map):
+    """The index of the data files (see the module docstring)."""
+    duplicates = []
+    return {
+        "contracts": contract_index(contracts, duplicates),
+        "tokens": token_index(token_details, duplicates),
+        "aliases": alias_index(chain_map, chain_details, contracts, duplicates),
+        "duplicates": duplicates,
+    }
+
+
+def write_lookup_index_from_files(paths=None):
+    """Rebuilds the index from the data files in paths. Returns the index."""
+    paths = paths or DataPaths()
+    index = build_lookup_index(
+        _load_json(paths.contracts, {}),
+        _load_json(paths.chain_details, {}),
+        _load_json(paths.token_details, []),
+        _load_json(paths.chain_map, {}),
+    )
+    writer.write_json_artifact(paths.lookup_index, index, build_dir=paths.build_dir)
+    print_duplicates(index)
+    print(summary(index))
+    return index
+
+
+def print_duplicates(index):
+    for duplicate in index["duplicates"]:
+        values = " and ".join(json.dumps(value) for value in duplicate["values"])
+        print(f"Duplicate {duplicate['index']} key {duplicate['key']}: {values}")
+
+
+def summary(index):
+    return (
+        f"Lookup index: {len(index['contracts'])} contract addresses, "
+        f"{sum(len(tokens) for tokens in index['tokens'].values())} tokens, "
+        f"{len(index['aliases'])} chain aliases, "
+        f"{len(index['duplicates'])} duplicates"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Writes lookupIndex.json, the reverse indexes of the data files."
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=".",
+        help="Directory of the data files (default: the current directory).",
+    )
+    parser.add_argument(
+        "--fail-on-duplicate",
+        action="store_true",
+        help="Exit with 1 if a key resolves to more than one value.",
+    )
+    args = parser.parse_args(argv)
+
+    index = write_lookup_index_from_files(DataPaths(args.data_dir))
+    if args.fail_on_duplicate and index["duplicates"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Run metrics for the data refresh scripts.
+
+Scripts time their stages with span(); every HTTP request sent by pipeline.http_client
+is recorded per host (count, status codes, bytes, latency histogram) and the caches
+count their lookups. At the end of a run write_report stores everything as JSON,
+overwriting METRICS_DIR/<name>.json and appending one line to
+METRICS_DIR/<name>.jsonl, so refresh cost can be charted over time. It can write
+the same metrics in the OpenMetrics text format as well.
+
+Spans may nest (e.g. icon resolution within the merge of chain details); each
+stage reports its own total time.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from pipeline import writer
+
+METRICS_DIR = os.environ.get(
+    "PEANUT_DATA_METRICS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache", "metrics"),
+)
+# Upper bounds of the request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "peanut_data"
+
+
+def add_arguments(parser):
+    """Adds the metrics report flags shared by the refresh scripts."""
+    parser.add_argument(
+        "--metrics-dir",
+        default=METRICS_DIR,
+        help="Directory of the JSON metrics report and its history.",
+    )
+    parser.add_argument(
+        "--openmetrics",
+        metavar="PATH",
+        help="Also write the metrics in the OpenMetrics text format to PATH.",
+    )
+
+
+class Metrics:
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.hosts = {}
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """Times the block as (one more run of) stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                record = self.stages.setdefault(
+                    stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+                )
+                record["count"] += 1
+                record["seconds"] += seconds
+                record["max_seconds"] = max(record["max_seconds"], seconds)
+
+    def _host(self, url):
+        host = urlparse(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = {
+                "requests": 0,
+                "errors": 0,
+                "status": {},
+                "bytes": 0,
+                "latency": {
+                    "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                    "sum": 0.0,
+                },
+            }
+        return self.hosts[host]
+
+    def record_request(self, url, status, seconds, size=0):
+        """
+        Records a request to url. status is None for a request that failed without
+        a response; seconds is the time until the response headers arrived.
+        """
+        with self._lock:
+            record = self._host(url)
+            record["requests"] += 1
+            if status is None:
+                record["errors"] += 1
+            else:
+                status = str(status)
+                record["status"][status] = record["status"].get(status, 0) + 1
+            record["bytes"] += size
+            latency = record["latency"]
+            latency["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            latency["sum"] += seconds
+
+    def record_bytes(self, url, size):
+        """Adds body bytes of a streamed response, read after record_request."""
+        with self._lock:
+            self._host(url)["bytes"] += size
+
+    def record_lookup(self, cache, result):
+        """Counts a lookup in cache with result "hit", "revalidated" or "miss"."""
+        with self._lock:
+            counts = self.caches.setdefault(cache, {})
+            counts[result] = counts.get(result, 0) + 1
+
+    def report(self, name):
+        with self._lock:
+            hosts = json.loads(json.dumps(self.hosts))
+            caches = json.loads(json.dumps(self.caches))
+            stages = json.loads(json.dumps(self.stages))
+        for record in hosts.values():
+            latency = record["latency"]
+            latency["buckets"] = dict(
+                zip(
+                    [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"],
+                    latency["buckets"],
+                )
+            )
+            latency["count"] = record["requests"]
+            latency["sum"] = round(latency["sum"], 4)
+        for counts in caches.values():
+            lookups = sum(counts.values())
+            served = counts.get("hit", 0) + counts.get("revalidated", 0)
+            counts["hit_rate"] = round(served / lookups, 4) if lookups else None
+        for record in stages.values():
+            record["seconds"] = round(record["seconds"], 4)
+            record["max_seconds"] = round(record["max_seconds"], 4)
+        return {
+            "name": name,
+            "started_at": self.started_at,
+            "wall_seconds": round(time.perf_counter() - self._start, 4),
+            "stages": stages,
+            "hosts": dict(sorted(hosts.items())),
+            "caches": dict(sorted(caches.items())),
+        }
+
+    def openmetrics(self, name):
+        """The report of this run in the OpenMetrics text format."""
+        report = self.report(name)
+        run = f'script="{name}"'
+        lines = [
+            f"# TYPE {PREFIX}_run_seconds gauge",
+            f"# UNIT {PREFIX}_run_seconds seconds",
+            f"{PREFIX}_run_seconds{{{run}}} {report['wall_seconds']}",
+            f"# TYPE {PREFIX}_stage_seconds counter",
+            f"# UNIT {PREFIX}_stage_seconds seconds",
+        ]
+        for stage, record in report["stages"].items():
+            lines.append(
+                f'{PREFIX}_stage_seconds_total{{{run},stage="{stage}"}} {record["seconds"]}'
+            )
+        lines.append(f"# TYPE {PREFIX}_http_requests counter")
+        for host, record in report["hosts"].items():
+            for status, count in sorted(record["status"].items()):
+                lines.append(
+                    f'{PREFIX}_http_requests_total{{{run},host="{host}",status="{status}"}} {count}'
+                )
+            if record["errors"]:
+                lines.append(
+                    f'{PREFIX}_http_requests_total{{{run},host="{host}",status="error"}} {record["errors"]}'
+                )
+        lines += [
+            f"# TYPE {PREFIX}_http_response_bytes counter",
+            f"# UNIT {PREFIX}_http_response_bytes bytes",
+        ]
+        for host, record in report["hosts"].items():
+            lines.append(
+                f'{PREFIX}_http_response_bytes_total{{{run},host="{host}"}} {record["bytes"]}'
+            )
+        lines += [
+            f"# TYPE {PREFIX}_http_request_duration_seconds histogram",
+            f"# UNIT {PREFIX}_http_request_duration_seconds seconds",
+        ]
+        for host, record in report["hosts"].items():
+            labels = f'{run},host="{host}"'
+            cumulative = 0
+            for bound, count in record["latency"]["buckets"].items():
+                cumulative += count
+                lines.append(
+                    f'{PREFIX}_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f"{PREFIX}_http_request_duration_seconds_count{{{labels}}} {record['latency']['count']}"
+            )
+            lines.append(
+                f"{PREFIX}_http_request_duration_seconds_sum{{{labels}}} {record['latency']['sum']}"
+            )
+        lines.append(f"# TYPE {PREFIX}_cache_lookups counter")
+        for cache, counts in report["caches"].items():
+            for result, count in sorted(counts.items()):
+                if result != "hit_rate":
+                    lines.append(
+                        f'{PREFIX}_cache_lookups_total{{{run},cache="{cache}",result="{result}"}} {count}'
+                    )
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        with self._lock:
+            stages = ", ".join(
+                f"{stage} {record['seconds']:.2f}s"
+                for stage, record in self.stages.items()
+            )
+        return f"Stages: {stages or 'none'}"
+
+
+def write_report(name, metrics_dir=METRICS_DIR, openmetrics_path=None, metrics=None):
+    """
+    Writes the report of the run to metrics_dir/<name>.json, appends it to
+    metrics_dir/<name>.jsonl and, if openmetrics_path is given, writes it there in
+    the OpenMetrics text format. Returns the report.
+    """
+    metrics = metrics or _default_metrics
+    report = metrics.report(name)
+    writer.write_atomic(
+        os.path.join(metrics_dir, f"{name}.json"),
+        json.dumps(report, indent="\t") + "\n",
+    )
+    with open(os.path.join(metrics_dir, f"{name}.jsonl"), "a") as f:
+        f.write(json.dumps(report, separators=(",", ":")) + "\n")
+    if openmetrics_path:
+        writer.write_atomic(openmetrics_path, metrics.openmetrics(name))
+    return report
+
+
+_default_metrics = Metrics()
+
+
+def default_metrics():
+    return _default_metrics
+
+
+def span(stage):
+    return _default_metrics.span(stage)
+
+
+def record_request(url, status, seconds, size=0):
+    _default_metrics.record_request(url, status, seconds, size)
+
+
+def record_bytes(url, size):
+    _default_metrics.record_bytes(url, size)
+
+
+def record_lookup(cache, result):
+    _default_metrics.record_lookup(cache, result)
+
+
+def summary():
+    return _default_metrics.summary()
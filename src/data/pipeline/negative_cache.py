@@ -0,0 +1,51 @@
+"""
+A persistent record of lookups known to miss (e.g. icon urls that returned 404), so
+that later runs don't probe them again until the entry expires.
+"""
+
+import json
+import os
+import threading
+import time
+
+from pipeline import http_cache, metrics, writer
+
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+
+def default_path(name):
+    """Path of the negative cache called name, next to the http cache."""
+    return os.path.join(os.path.dirname(http_cache.CACHE_DIR), f"{name}_misses.json")
+
+
+class NegativeCache:
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self._misses = json.load(f)
+        except (OSError, ValueError):
+            self._misses = {}
+
+    def __contains__(self, key):
+        missed_at = self._misses.get(key)
+        missed = missed_at is not None and time.time() - missed_at < self.ttl
+        metrics.record_lookup(self.name, "hit" if missed else "miss")
+        return missed
+
+    def add(self, key):
+        with self._lock:
+            self._misses[key] = time.time()
+
+    def save(self):
+        with self._lock:
+            now = time.time()
+            misses = {
+                key: missed_at
+                for key, missed_at in self._misses.items()
+                if now - missed_at < self.ttl
+            }
+        writer.write_atomic(self.path, json.dumps(misses, indent="\t", sort_keys=True))
@@ -0,0 +1,31 @@
+"""
+Locations of the data files a refresh reads and writes.
+
+The scripts use DataPaths("."), i.e. the working directory, as they always have;
+library callers get src/data by default or pass any other directory.
+"""
+
+import os
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class DataPaths:
+    def __init__(self, data_dir=DATA_DIR, **overrides):
+        """overrides replace single paths, e.g. DataPaths(contracts="/x.json")."""
+        self.data_dir = data_dir
+        self.contracts = os.path.join(data_dir, "contracts.json")
+        self.chain_details = os.path.join(data_dir, "chainDetails.json")
+        self.token_details = os.path.join(data_dir, "tokenDetails.json")
+        self.manual_tokens = os.path.join(data_dir, "tokenDetailsManual.json")
+        self.chain_map = os.path.join(data_dir, "chainMap.json")
+        self.abi_index = os.path.join(data_dir, "abiIndex.json")
+        self.lookup_index = os.path.join(data_dir, "lookupIndex.json")
+        self.assets_dir = os.path.join(data_dir, "assets")
+        self.assets_manifest = os.path.join(data_dir, "assetsManifest.json")
+        self.shards_dir = os.path.join(data_dir, "shards")
+        self.build_dir = os.path.join(data_dir, "build")
+        for name, path in overrides.items():
+            if not hasattr(self, name):
+                raise TypeError(f"Unknown data path {name}")
+            setattr(self, name, path)
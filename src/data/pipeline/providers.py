@@ -0,0 +1,166 @@
+"""
+Concurrent, hedged fetching of the upstream token lists.
+
+fetch_all runs every provider (a named callable) at the same time and waits for
+them until PROVIDER_DEADLINE: a provider that fails or hasn't answered by then is
+reported and left out, so a run is held up by a slow upstream for at most the
+deadline and continues with the providers that answered.
+
+Within a provider, hedged sends an upstream request and, if it hasn't answered
+within HEDGE_AFTER seconds, a second one (the same request again, or a mirror),
+and takes whichever answers first. A failed attempt is followed by the next one
+right away. Tail latency of one request then costs about HEDGE_AFTER instead of
+the full timeout, for a few duplicate requests, so only small, free requests are
+hedged: not paid api calls, nor downloads that take longer than HEDGE_AFTER
+anyway.
+
+A FatalProviderError (e.g. rejected credentials) is not a provider being down:
+hedged and fetch_all raise it as soon as it happens, failing the run.
+
+The outcome of every provider and the hedges sent are kept for summary().
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    FIRST_EXCEPTION,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from pipeline import metrics
+
+HEDGE_AFTER = float(os.environ.get("PEANUT_DATA_HEDGE_AFTER", 3))
+PROVIDER_DEADLINE = float(os.environ.get("PEANUT_DATA_PROVIDER_DEADLINE", 120))
+
+
+class ProviderError(Exception):
+    pass
+
+
+class FatalProviderError(Exception):
+    """A provider failure that retrying or leaving the provider out can't fix."""
+
+
+_lock = threading.Lock()
+stats = {"hedged": 0, "hedge_wins": 0}
+# provider name: (seconds, error or None)
+outcomes = {}
+
+
+def hedged(attempts, name, hedge_after=HEDGE_AFTER):
+    """
+    Runs attempts (callables returning a result, or None if they failed) in order,
+    starting the next one when the previous failed or hasn't answered within
+    hedge_after seconds. Returns the first result. Raises ProviderError if every
+    attempt failed.
+    """
+    remaining = list(attempts)
+    pending = set()
+    hedges = set()
+    error = "no attempt"
+    # the attempts still running when a result is in are left to finish
+    executor = ThreadPoolExecutor(max_workers=len(remaining))
+    try:
+        # every wait ends with the hedge delay passed or failed attempts only, both
+        # of which start the next attempt
+        while remaining or pending:
+            if remaining:
+                future = executor.submit(remaining.pop(0))
+                if pending:
+                    hedges.add(future)
+                    with _lock:
+                        stats["hedged"] += 1
+                pending.add(future)
+            done, pending = wait(
+                pending,
+                timeout=hedge_after if remaining else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                try:
+                    result = future.result()
+                except FatalProviderError:
+                    raise
+                except Exception as e:
+                    error = str(e) or e.__class__.__name__
+                    continue
+                if result is None:
+                    error = "no result"
+                    continue
+                if future in hedges:
+                    with _lock:
+                        stats["hedge_wins"] += 1
+                return result
+        raise ProviderError(f"{name} failed: {error}")
+    finally:
+        executor.shutdown(wait=False)
+
+
+def fetch_all(providers, deadline=PROVIDER_DEADLINE):
+    """
+    Runs providers ({name: callable}) concurrently. Returns ({name: result},
+    {name: error}); a provider that raised, returned None or was still running
+    after deadline seconds is in the errors. A FatalProviderError is raised as
+    soon as a provider raises it.
+    """
+    seconds = {}
+
+    def run(name, fetch):
+        start = time.perf_counter()
+        try:
+            with metrics.span(name):
+                return fetch()
+        finally:
+            seconds[name] = time.perf_counter() - start
+
+    executor = ThreadPoolExecutor(max_workers=len(providers))
+    futures = {
+        name: executor.submit(run, name, fetch) for name, fetch in providers.items()
+    }
+    end = time.monotonic() + deadline
+    pending = set(futures.values())
+    try:
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=max(0.0, end - time.monotonic()),
+                return_when=FIRST_EXCEPTION,
+            )
+            if not done:
+                break
+            for future in done:
+                if isinstance(future.exception(), FatalProviderError):
+                    raise future.exception()
+    finally:
+        executor.shutdown(wait=False)
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        if not future.done():
+            errors[name] = f"no answer within {deadline:g}s"
+        elif future.exception() is not None:
+            error = future.exception()
+            errors[name] = str(error) or error.__class__.__name__
+        elif future.result() is None:
+            errors[name] = "no result"
+        else:
+            results[name] = future.result()
+        with _lock:
+            outcomes[name] = (seconds.get(name, deadline), errors.get(name))
+    return results, errors
+
+
+def summary():
+    with _lock:
+        providers = ", ".join(
+            f"{name} {seconds:.2f}s" + (f" (failed: {error})" if error else "")
+            for name, (seconds, error) in outcomes.items()
+        )
+        return (
+            f"Providers: {providers or 'none'}; {stats['hedged']} hedged requests, "
+            f"{stats['hedge_wins']} answered first"
+        )
@@ -0,0 +1,198 @@
+"""
+Per-host request scheduling for the data refresh scripts.
+
+Every request to a host first takes a token from that host's token bucket, so each
+upstream is hit as fast as its budget allows and never faster. Throttled (429) and
+failed (5xx, connection error) requests are retried with jittered exponential
+backoff; a Retry-After header is honoured (up to BACKOFF_MAX) and pauses the whole
+host, since the other requests to it would be throttled as well.
+
+Budgets are (requests per second, burst) per host, see HOST_RATES. They can be
+overridden with PEANUT_DATA_RATE_LIMITS, e.g.
+PEANUT_DATA_RATE_LIMITS="api.coingecko.com=0.2:1,deep-index.moralis.io=2:4"
+"""
+
+import email.utils
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from pipeline import http_client
+
+HOST_RATES = {
+    # the public coingecko api allows about 30 calls per minute
+    "api.coingecko.com": (0.5, 5),
+    "tokens.coingecko.com": (2, 5),
+    "deep-index.moralis.io": (5, 10),
+    "raw.githubusercontent.com": (20, 40),
+}
+DEFAULT_RATE = (10, 20)
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def parse_rate_limits(value):
+    """Parses "host=rate:burst,host=rate:burst" into {host: (rate, burst)}."""
+    rates = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        host, budget = entry.split("=")
+        rate, burst = budget.split(":")
+        rates[host.strip()] = (float(rate), float(burst))
+    return rates
+
+
+HOST_RATES.update(parse_rate_limits(os.environ.get("PEANUT_DATA_RATE_LIMITS", "")))
+
+
+def retry_after_seconds(response):
+    """The Retry-After header of response in seconds, or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(
+                    self.paused_until - now, (1 - self.tokens) / self.rate, 0.001
+                )
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back every request to this host for the next seconds."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        rates=None,
+        default_rate=DEFAULT_RATE,
+        max_retries=MAX_RETRIES,
+        send=None,
+    ):
+        self.rates = HOST_RATES if rates is None else rates
+        self.default_rate = default_rate
+        self.max_retries = max_retries
+        self.send = send or http_client.request
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(
+                    *self.rates.get(host, self.default_rate)
+                )
+            return self._buckets[host]
+
+    def request(self, method, url, max_retries=None, **kwargs):
+        """
+        Sends a request within the host's budget, retrying throttled and failed
+        requests up to max_retries times (default: the scheduler's). Returns the
+        last response (which may still be an error) or raises the last connection
+        error.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        bucket = self.bucket(urlparse(url).netloc)
+        for attempt in range(max_retries + 1):
+            bucket.acquire()
+            self.count("requests")
+            try:
+                response = self.send(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt == max_retries
+                ):
+                    return response
+                retry_after = retry_after_seconds(response)
+                # a Retry-After far in the future would stall the host's requests
+                delay = (
+                    backoff_delay(attempt)
+                    if retry_after is None
+                    else min(retry_after, BACKOFF_MAX)
+                )
+                if response.status_code == 429:
+                    self.count("throttled")
+                    bucket.pause(delay)
+                print(
+                    f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s"
+                )
+                response.close()
+            self.count("retries")
+            time.sleep(delay)
+
+
+_default_scheduler = RequestScheduler()
+
+
+def default_scheduler():
+    return _default_scheduler
+
+
+def request(method, url, **kwargs):
+    """Request through the shared default scheduler."""
+    return default_scheduler().request(method, url, **kwargs)
+
+
+def summary():
+    scheduler = default_scheduler()
+    with scheduler._lock:
+        stats = dict(scheduler.stats)
+    return (
+        f"Requests: {stats['requests']} sent, {stats['retries']} retried, "
+        f"{stats['throttled']} throttled"
+    )
@@ -0,0 +1,88 @@
+"""
+Per-chain refresh state for the unattended (--incremental) mode of the data refresh
+scripts.
+
+The state file records, for every chain and every script, when its data was last
+fetched, a hash of the upstream content it was built from and, for chain details,
+when its rpcs were last checked. An incremental run only refreshes the chains whose
+upstream content changed or whose data is older than --max-age.
+
+The state lives next to the http cache; deleting it just makes the next incremental
+run refresh everything.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from pipeline import http_cache, writer
+
+STATE_PATH = os.environ.get(
+    "PEANUT_DATA_STATE_PATH",
+    os.path.join(os.path.dirname(http_cache.CACHE_DIR), "refresh_state.json"),
+)
+# Default --max-age, in hours
+DEFAULT_MAX_AGE_HOURS = 24
+
+REMOVE_POLICIES = ("ask", "remove", "keep")
+
+
+def content_hash(data):
+    """sha256 of raw bytes, or of the canonical JSON encoding of any other value."""
+    if not isinstance(data, bytes):
+        data = json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def add_arguments(parser):
+    """Adds the incremental mode flags shared by the refresh scripts."""
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Run without prompts, refreshing only chains whose upstream data changed "
+        "or is older than --max-age.",
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE_HOURS,
+        help="In incremental mode, refresh chains whose data is older than this "
+        f"many hours (default: {DEFAULT_MAX_AGE_HOURS}).",
+    )
+    parser.add_argument(
+        "--state-path",
+        default=STATE_PATH,
+        help="Path of the refresh state file.",
+    )
+
+
+class RefreshState:
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        try:
+            with open(path, "r") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    def get(self, section, chain_id):
+        """The state record of chain_id in section ("chains" or "tokens")."""
+        return self.data.get(section, {}).get(str(chain_id), {})
+
+    def update(self, section, chain_id, **fields):
+        record = self.data.setdefault(section, {}).setdefault(str(chain_id), {})
+        record.update(fields)
+
+    def is_stale(self, section, chain_id, field, max_age_hours):
+        """True if the timestamp field is missing or older than max_age_hours."""
+        timestamp = self.get(section, chain_id).get(field)
+        return timestamp is None or time.time() - timestamp > max_age_hours * 3600
+
+    def remove(self, section, chain_id):
+        self.data.get(section, {}).pop(str(chain_id), None)
+
+    def save(self):
+        writer.write_atomic(
+            self.path, json.dumps(self.data, indent="\t", sort_keys=True)
+        )
@@ -0,0 +1,105 @@
+"""
+Per-chain data shards, so that the SDK can load only the chains an app uses.
+
+For every chain, a shard bundles its chainDetails.json entry, its tokenDetails.json
+token list and its contracts.json addresses. Shards are written as compact,
+canonically ordered JSON to SHARDS_DIR under content-addressed names
+(<chainId>.<hash>.json), so a shard can be cached forever by name. manifest.json
+maps each chainId to its shard file, with the shard's sha256 and byte size; it is
+the only file that changes name-stably.
+
+Shards are rebuilt from the data files at the end of both refresh scripts, or with
+python3 -m pipeline.shards (from src/data), and are committed with the data files,
+like lookupIndex.json.
+"""
+
+import hashlib
+import json
+import os
+
+from pipeline import writer
+
+SHARDS_DIR = "shards"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# Hex digits of the content hash used in shard file names
+NAME_HASH_LENGTH = 12
+
+
+def _load_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def build_shards(chain_details, token_details, contracts):
+    """{chainId: shard} for every chain in chainDetails or contracts."""
+    tokens_by_chain = {entry["chainId"]: entry["tokens"] for entry in token_details}
+    chain_ids = sorted(set(chain_details) | set(contracts), key=int)
+    return {
+        chain_id: {
+            "chainId": chain_id,
+            "chain": chain_details.get(chain_id),
+            "tokens": tokens_by_chain.get(chain_id, []),
+            "contracts": contracts.get(chain_id, {}),
+        }
+        for chain_id in chain_ids
+    }
+
+
+def write_shards(shards, shards_dir=SHARDS_DIR):
+    """
+    Writes the shards and their manifest, and removes shard files that the new
+    manifest no longer references. Returns the manifest.
+    """
+    os.makedirs(shards_dir, exist_ok=True)
+    manifest = {"version": MANIFEST_VERSION, "shards": {}}
+    for chain_id, shard in shards.items():
+        content = json.dumps(writer.canonical(shard), separators=(",", ":")).encode(
+            "utf-8"
+        )
+        digest = hashlib.sha256(content).hexdigest()
+        file_name = f"{chain_id}.{digest[:NAME_HASH_LENGTH]}.json"
+        # atomic, and an existing file is only kept if its content matches the hash
+        writer.write_if_changed(os.path.join(shards_dir, file_name), content)
+        manifest["shards"][chain_id] = {
+            "name": (shard["chain"] or {}).get("name", ""),
+            "path": file_name,
+            "sha256": digest,
+            "bytes": len(content),
+        }
+
+    writer.write_json_artifact(
+        os.path.join(shards_dir, MANIFEST_NAME), manifest, variants=False
+    )
+
+    referenced = {entry["path"] for entry in manifest["shards"].values()}
+    for file_name in os.listdir(shards_dir):
+        if file_name != MANIFEST_NAME and file_name not in referenced:
+            os.remove(os.path.join(shards_dir, file_name))
+
+    return manifest
+
+
+def write_shards_from_files(
+    chain_details_path="chainDetails.json",
+    token_details_path="tokenDetails.json",
+    contracts_path="contracts.json",
+    shards_dir=SHARDS_DIR,
+):
+    """Rebuilds all shards from the data files."""
+    shards = build_shards(
+        _load_json(chain_details_path, {}),
+        _load_json(token_details_path, []),
+        _load_json(contracts_path, {}),
+    )
+    manifest = write_shards(shards, shards_dir)
+    total_bytes = sum(entry["bytes"] for entry in manifest["shards"].values())
+    print(f"Wrote {len(manifest['shards'])} chain shards ({total_bytes} bytes).")
+    return manifest
+
+
+if __name__ == "__main__":
+    write_shards_from_files()
@@ -0,0 +1,137 @@
+"""
+Snapshots of upstream git trees, so that a refresh reads them locally instead of
+requesting one raw file (or HEAD probe) at a time.
+
+A Snapshot maps base urls (e.g. chains.CHAINS_URL) to what is known under them:
+the files themselves, read from a tarball or a local checkout, or only their names,
+read from a GitHub tree listing. Lookups are by the url a file would have upstream,
+so callers build urls as they always have and ask the snapshot first:
+
+- read(url): the file's bytes, or None if the snapshot holds the tree and the file
+  isn't in it
+- exists(url): True or False if the tree is indexed, listed or not
+- covers(url): whether the snapshot can answer for url at all; urls it doesn't
+  cover are requested as usual
+
+Archives are read as a stream, keeping only the files under the mapped prefixes.
+"""
+
+import io
+import os
+import tarfile
+
+
+class Snapshot:
+    def __init__(self):
+        # base url: {relative path: bytes}
+        self.trees = {}
+        # base url: {relative path}
+        self.listings = {}
+
+    def _split(self, url):
+        for base_url in list(self.trees) + list(self.listings):
+            prefix = base_url.rstrip("/") + "/"
+            if url.startswith(prefix):
+                return base_url, url[len(prefix) :]
+        return None, None
+
+    def covers(self, url):
+        return self._split(url)[0] is not None
+
+    def exists(self, url):
+        base_url, path = self._split(url)
+        if base_url is None:
+            return None
+        if base_url in self.trees:
+            return path in self.trees[base_url]
+        return path in self.listings[base_url]
+
+    def read(self, url):
+        base_url, path = self._split(url)
+        if base_url not in self.trees:
+            return None
+        return self.trees[base_url].get(path)
+
+    def add_files(self, base_url, files):
+        self.trees.setdefault(base_url, {}).update(files)
+
+    def add_listing(self, base_url, paths):
+        self.listings.setdefault(base_url, set()).update(paths)
+
+    def load_archive(self, fileobj, prefixes, strip_top_dir=True):
+        """
+        Reads a .tar.gz from fileobj, as a stream. prefixes maps directories in the
+        archive ("_data/chains/") to the base url of their files. GitHub archives
+        wrap the tree in a "<repo>-<ref>/" directory, dropped with strip_top_dir.
+        """
+        with tarfile.open(fileobj=fileobj, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = member.name
+                if strip_top_dir:
+                    name = name.split("/", 1)[1] if "/" in name else name
+                for prefix, base_url in prefixes.items():
+                    if name.startswith(prefix):
+                        content = archive.extractfile(member).read()
+                        self.add_files(base_url, {name[len(prefix) :]: content})
+                        break
+
+    def load_checkout(self, directory, prefixes):
+        """Reads the files under prefixes of a local checkout in directory."""
+        for prefix, base_url in prefixes.items():
+            root = os.path.join(directory, prefix)
+            files = {}
+            for dir_path, _, file_names in os.walk(root):
+                for file_name in file_names:
+                    path = os.path.join(dir_path, file_name)
+                    with open(path, "rb") as f:
+                        files[os.path.relpath(path, root).replace(os.sep, "/")] = (
+                            f.read()
+                        )
+            self.add_files(base_url, files)
+
+    def load_listing(self, tree, prefix, base_url):
+        """
+        Adds the blobs under prefix of a GitHub tree listing (the parsed response of
+        /git/trees/<ref>?recursive=1). Returns False if the listing was truncated,
+        in which case nothing is added.
+        """
+        if tree.get("truncated"):
+            return False
+        self.add_listing(
+            base_url,
+            (
+                entry["path"][len(prefix) :]
+                for entry in tree.get("tree", [])
+                if entry.get("type") == "blob" and entry["path"].startswith(prefix)
+            ),
+        )
+        return True
+
+    def summary(self):
+        files = sum(len(files) for files in self.trees.values())
+        listed = sum(len(paths) for paths in self.listings.values())
+        return f"Snapshot: {files} files, {listed} listed names"
+
+
+class ChunkReader(io.RawIOBase):
+    """A read-only file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
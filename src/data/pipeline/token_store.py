@@ -0,0 +1,73 @@
+"""
+In-memory model of tokenDetails.json.
+
+tokenDetails.json is a list of {"chainId", "name", "tokens": [...]} entries. The
+store keeps it keyed by chainId, and each chain's tokens keyed by normalised
+(lowercase) address, so that looking up a chain and upserting, merging or
+deduplicating tokens are dict operations instead of list scans. It is turned back
+into the list format only when written out (to_list).
+
+Chains and tokens keep their insertion order; replacing a token keeps its position.
+"""
+
+
+def normalise_address(address):
+    return address.lower()
+
+
+class TokenStore:
+    def __init__(self, token_details=()):
+        # chainId -> (entry fields other than "tokens", {address: token})
+        self._chains = {}
+        for entry in token_details:
+            self.upsert_chain(entry)
+
+    def __contains__(self, chain_id):
+        return chain_id in self._chains
+
+    def __len__(self):
+        return len(self._chains)
+
+    def tokens(self, chain_id):
+        """The tokens of chain_id as a list, empty if the chain is unknown."""
+        if chain_id not in self._chains:
+            return []
+        return list(self._chains[chain_id][1].values())
+
+    def upsert_chain(self, entry):
+        """
+        Adds a {"chainId", ..., "tokens"} entry, or replaces the entry of its chain.
+        Tokens with the same normalised address are deduplicated, the last wins.
+        """
+        fields = {key: value for key, value in entry.items() if key != "tokens"}
+        tokens = {}
+        for token in entry.get("tokens", []):
+            tokens[normalise_address(token["address"])] = token
+        self._chains[entry["chainId"]] = (fields, tokens)
+
+    def merge_chain(self, entry):
+        """
+        Merges the tokens of entry into its chain, replacing tokens with the same
+        normalised address. Adds the entry if its chain is unknown.
+        """
+        if entry["chainId"] not in self._chains:
+            self.upsert_chain(entry)
+            return
+        tokens = self._chains[entry["chainId"]][1]
+        for token in entry.get("tokens", []):
+            tokens[normalise_address(token["address"])] = token
+
+    def retain(self, chain_ids):
+        """Drops every chain not in chain_ids."""
+        self._chains = {
+            chain_id: chain
+            for chain_id, chain in self._chains.items()
+            if chain_id in chain_ids
+        }
+
+    def to_list(self):
+        """The store in the tokenDetails.json list format."""
+        return [
+            {**fields, "tokens": list(tokens.values())}
+            for fields, tokens in self._chains.values()
+        ]
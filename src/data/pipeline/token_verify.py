@@ -0,0 +1,374 @@
+"""
+On-chain verification of the ERC-20 metadata in tokenDetails.json.
+
+For every token of a chain, decimals(), symbol() and name() (selectors taken from
+erc20abi.json) are called on the chain's rpcs from chainDetails.json, together
+with an eth_getCode to tell non-contracts apart. The calls of a chain go out as
+JSON-RPC batches of BATCH_SIZE, so a chain costs a handful of requests instead of
+four per token; a batch that fails moves on to the chain's next rpc.
+
+The report lists, per chain, the tokens whose listed values differ from what the
+contract returns, the addresses without code and the tokens that couldn't be
+checked (unverifiable: the rpc answered eth_getCode with an error or not at all,
+or a return value can't be decoded). A wrong decimals value or a non-contract
+breaks transfers in the SDK; symbol and name differences are often harmless
+renames and are reported for review.
+
+The batches go through the clients' request scheduler (pipeline/clients.py), so
+the rpc hosts' rate limits apply.
+
+Usage, from src/data: python3 -m pipeline.token_verify [--data-dir DIR]
+[--chain ID ...] [--report PATH]. Exits with 1 if a decimals mismatch or a
+non-contract is found.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline import keccak, metrics, writer
+from pipeline.clients import default_clients
+from pipeline.paths import DataPaths
+
+ERC20_ABI_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "erc20abi.json"
+)
+VERIFIED_GETTERS = ("decimals", "symbol", "name")
+# Calls per JSON-RPC batch, many public rpcs reject larger batches
+BATCH_SIZE = 100
+RPC_TIMEOUT = 30
+VERIFY_WORKERS = 8
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+# Infura rpcs are stored with a placeholder for the key
+INFURA_API_KEY = os.environ.get("INFURA_API_KEY")
+
+
+class RpcError(Exception):
+    pass
+
+
+def erc20_selectors(abi_path=ERC20_ABI_PATH):
+    """{getter: selector} for the VERIFIED_GETTERS in the ERC-20 abi."""
+    with open(abi_path, "r") as f:
+        abi = json.load(f)
+    return {
+        entry["name"]: keccak.selector(keccak.signature(entry))
+        for entry in abi
+        if entry.get("type") == "function"
+        and entry.get("name") in VERIFIED_GETTERS
+        and not entry.get("inputs")
+    }
+
+
+def decode_uint(result):
+    """Decodes an ABI uint. Raises ValueError if result isn't hex."""
+    data = bytes.fromhex(result[2:])
+    if len(data) < 32:
+        return None
+    return int.from_bytes(data[:32], "big")
+
+
+def decode_string(result):
+    """
+    Decodes an ABI string, or the bytes32 some older tokens return instead. Raises
+    ValueError if result isn't hex.
+    """
+    data = bytes.fromhex(result[2:])
+    if len(data) == 32:
+        return data.rstrip(b"\0").decode("utf-8", "replace")
+    if len(data) < 64:
+        return None
+    offset = int.from_bytes(data[:32], "big")
+    length = int.from_bytes(data[offset : offset + 32], "big")
+    return data[offset + 32 : offset + 32 + length].decode("utf-8", "replace")
+
+
+DECODERS = {"decimals": decode_uint, "symbol": decode_string, "name": decode_string}
+
+
+def usable_rpcs(rpcs):
+    """The rpcs that can be called, with the Infura key filled in if it's set."""
+    usable = []
+    for rpc in rpcs:
+        if "${INFURA_API_KEY}" in rpc:
+            if not INFURA_API_KEY:
+                continue
+            rpc = rpc.replace("${INFURA_API_KEY}", INFURA_API_KEY)
+        usable.append(rpc)
+    return usable
+
+
+def rpc_batch(rpc, calls, timeout=RPC_TIMEOUT, clients=None):
+    """Sends calls as one JSON-RPC batch. Returns {id: response}."""
+    clients = clients or default_clients()
+    try:
+        response = clients.scheduler.request("POST", rpc, json=calls, timeout=timeout)
+    except Exception as e:
+        raise RpcError(f"{rpc}: {e}") from e
+    if response.status_code != 200:
+        raise RpcError(f"{rpc}: HTTP {response.status_code}")
+    try:
+        answers = response.json()
+    except ValueError as e:
+        raise RpcError(f"{rpc}: invalid JSON") from e
+    if not isinstance(answers, list):
+        raise RpcError(f"{rpc}: batch requests not supported")
+    return {answer.get("id"): answer for answer in answers}
+
+
+def call_batches(rpcs, calls, batch_size=BATCH_SIZE, clients=None):
+    """
+    Sends calls in batches of batch_size, each to the first rpc that answers it.
+    Returns ({id: response}, rpc used last).
+    """
+    answers = {}
+    rpcs = list(rpcs)
+    for start in range(0, len(calls), batch_size):
+        batch = calls[start : start + batch_size]
+        while True:
+            if not rpcs:
+                raise RpcError("no rpc answered")
+            try:
+                answers.update(rpc_batch(rpcs[0], batch, clients=clients))
+                break
+            except RpcError as e:
+                print(f"Error verifying tokens, trying the next rpc: {e}")
+                rpcs.pop(0)
+    return answers, rpcs[0] if rpcs else None
+
+
+def token_calls(tokens, selectors):
+    """The calls verifying tokens; the id of call k of token i is i * 4 + k."""
+    calls = []
+    for i, token in enumerate(tokens):
+        calls.append(
+            {
+                "jsonrpc": "2.0",
+                "id": i * 4,
+                "method": "eth_getCode",
+                "params": [token["address"], "latest"],
+            }
+        )
+        for k, getter in enumerate(VERIFIED_GETTERS, start=1):
+            calls.append(
+                {
+                    "jsonrpc": "2.0",
+                    "id": i * 4 + k,
+                    "method": "eth_call",
+                    "params": [
+                        {"to": token["address"], "data": selectors[getter]},
+                        "latest",
+                    ],
+                }
+            )
+    return calls
+
+
+def decode_token(answers, i):
+    """
+    {getter: on-chain value} of token i, None for a getter without a result.
+    Raises ValueError if a result can't be decoded.
+    """
+    values = {}
+    for k, getter in enumerate(VERIFIED_GETTERS, start=1):
+        result = answers.get(i * 4 + k, {}).get("result")
+        try:
+            values[getter] = DECODERS[getter](result) if result else None
+        except ValueError as e:
+            raise ValueError(f"{getter} returned {result!r}: {e}") from e
+    return values
+
+
+def verify_chain(
+    chain_id, rpcs, tokens, selectors, batch_size=BATCH_SIZE, clients=None
+):
+    """Verifies the ERC-20 tokens of a chain. Returns the chain's report."""
+    tokens = [token for token in tokens if token["address"].lower() != ZERO_ADDRESS]
+    report = {
+        "chainId": chain_id,
+        "rpc": None,
+        "checked": 0,
+        "mismatches": [],
+        "non_contracts": [],
+        "unverifiable": [],
+        "error": None,
+    }
+    if not tokens:
+        return report
+    try:
+        answers, report["rpc"] = call_batches(
+            usable_rpcs(rpcs), token_calls(tokens, selectors), batch_size, clients
+        )
+    except RpcError as e:
+        report["error"] = str(e)
+        return report
+
+    for i, token in enumerate(tokens):
+        code_answer = answers.get(i * 4, {})
+        code = code_answer.get("result")
+        if code is None:
+            # the rpc answered the call with an error, or left it out of the batch
+            error = code_answer.get("error") or "no answer in the batch"
+            report["unverifiable"].append(
+                {
+                    "address": token["address"],
+                    "symbol": token.get("symbol"),
+                    "error": f"eth_getCode failed: {json.dumps(error)}",
+                }
+            )
+            continue
+        if code in ("0x", "0x0"):
+            report["checked"] += 1
+            report["non_contracts"].append(
+                {"address": token["address"], "symbol": token.get("symbol")}
+            )
+            continue
+        try:
+            values = decode_token(answers, i)
+        except ValueError as e:
+            report["unverifiable"].append(
+                {
+                    "address": token["address"],
+                    "symbol": token.get("symbol"),
+                    "error": str(e),
+                }
+            )
+            continue
+        report["checked"] += 1
+        for getter, onchain in values.items():
+            listed = token.get(getter)
+            if getter == "decimals" and listed is not None:
+                listed = int(listed)
+            if onchain != listed:
+                report["mismatches"].append(
+                    {
+                        "address": token["address"],
+                        "symbol": token.get("symbol"),
+                        "field": getter,
+                        "listed": listed,
+                        "onchain": onchain,
+                    }
+                )
+    return report
+
+
+def verify_tokens(
+    chain_details,
+    token_details,
+    chain_ids=None,
+    workers=VERIFY_WORKERS,
+    batch_size=BATCH_SIZE,
+    abi_path=ERC20_ABI_PATH,
+    clients=None,
+):
+    """
+    Verifies the tokens of every chain in token_details (or of chain_ids), chains
+    concurrently. Returns {chainId: report} in token_details order.
+    """
+    selectors = erc20_selectors(abi_path)
+    entries = [
+        entry
+        for entry in token_details
+        if entry["chainId"] in chain_details
+        and (chain_ids is None or entry["chainId"] in chain_ids)
+    ]
+    with metrics.span("verify"):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            reports = executor.map(
+                lambda entry: verify_chain(
+                    entry["chainId"],
+                    chain_details[entry["chainId"]].get("rpc", []),
+                    entry["tokens"],
+                    selectors,
+                    batch_size,
+                    clients,
+                ),
+                entries,
+            )
+            return {report["chainId"]: report for report in reports}
+
+
+def has_errors(report):
+    """True if a chain has a decimals mismatch or a non-contract."""
+    return any(
+        chain["non_contracts"]
+        or any(mismatch["field"] == "decimals" for mismatch in chain["mismatches"])
+        for chain in report.values()
+    )
+
+
+def print_report(report):
+    for chain_id, chain in report.items():
+        if chain["error"]:
+            print(f"Chain {chain_id}: could not verify tokens ({chain['error']})")
+        for token in chain["non_contracts"]:
+            print(
+                f"Chain {chain_id}: {token['symbol']} at {token['address']} is not a contract"
+            )
+        for mismatch in chain["mismatches"]:
+            print(
+                f"Chain {chain_id}: {mismatch['symbol']} at {mismatch['address']} has "
+                f"{mismatch['field']} {mismatch['listed']!r}, the contract returns "
+                f"{mismatch['onchain']!r}"
+            )
+        for token in chain["unverifiable"]:
+            print(
+                f"Chain {chain_id}: {token['symbol']} at {token['address']} could not "
+                f"be verified ({token['error']})"
+            )
+    print(summary(report))
+
+
+def summary(report):
+    chains = report.values()
+    return (
+        f"Token verification: {sum(chain['checked'] for chain in chains)} tokens "
+        f"checked on {len(report)} chains, "
+        f"{sum(len(chain['mismatches']) for chain in chains)} mismatches, "
+        f"{sum(len(chain['non_contracts']) for chain in chains)} non-contracts, "
+        f"{sum(len(chain['unverifiable']) for chain in chains)} unverifiable, "
+        f"{sum(1 for chain in chains if chain['error'])} chains unreachable"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Checks the ERC-20 metadata in tokenDetails.json against the chains."
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=".",
+        help="Directory of chainDetails.json and tokenDetails.json (default: the "
+        "current directory).",
+    )
+    parser.add_argument(
+        "--chain", action="append", help="Only verify this chain id (repeatable)."
+    )
+    parser.add_argument("--report", help="Write the JSON report to this path.")
+    parser.add_argument("--workers", type=int, default=VERIFY_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    paths = DataPaths(args.data_dir)
+
+    with open(paths.chain_details, "r") as f:
+        chain_details = json.load(f)
+    with open(paths.token_details, "r") as f:
+        token_details = json.load(f)
+
+    report = verify_tokens(
+        chain_details,
+        token_details,
+        chain_ids=args.chain,
+        workers=args.workers,
+        batch_size=args.batch_size,
+    )
+    print_report(report)
+    if args.report:
+        writer.write_atomic(args.report, json.dumps(report, indent="\t") + "\n")
+    sys.exit(1 if has_errors(report) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+"""
+Token details refresh: picks each chain's tokens from the moralis top tokens
+matched against the coingecko token list, falling back to the chain's coingecko
+platform list and then to the uniswap token list, as used by fillTokenDetails.py
+(see its docstring for the rules).
+
+The upstream lists are fetched once into TokenSources and shared by every chain.
+Their providers (the moralis top list joined with coingecko, the coingecko asset
+platforms and the uniswap list) are queried concurrently, the small requests
+hedged, and a provider that is down or too slow is left out of the run rather
+than failing it (see pipeline/providers.py). A rejected moralis api key fails
+the run.
+Everything takes an optional pipeline.clients.Clients and
+pipeline.paths.DataPaths, so the refresh can be embedded:
+
+    sources = await asyncio.to_thread(tokens.TokenSources.load)
+    entry = await tokens.refresh_tokens("10", sources=sources, paths=DataPaths(my_dir))
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+from pipeline import lookup_index, metrics, providers, shards, writer
+from pipeline.clients import default_clients
+from pipeline.json_stream import iter_json_array
+from pipeline.paths import DataPaths
+from pipeline.refresh_state import content_hash
+from pipeline.token_store import TokenStore
+
+# Constants, upstream urls can be overridden with PEANUT_DATA_<NAME> variables
+ASSET_PLATFORMS_URL = os.environ.get(
+    "PEANUT_DATA_ASSET_PLATFORMS_URL",
+    "https://api.coingecko.com/api/v3/asset_platforms",
+)
+TOP_TOKENS_URL = os.environ.get(
+    "PEANUT_DATA_TOP_TOKENS_URL",
+    "https://api.coingecko.com/api/v3/coins/list?include_platform=true",
+)
+TOKENS_URL_TEMPLATE = os.environ.get(
+    "PEANUT_DATA_TOKENS_URL_TEMPLATE", "https://tokens.coingecko.com/{}/all.json"
+)
+UNISWAP_URL = os.environ.get(
+    "PEANUT_DATA_UNISWAP_URL", "https://gateway.ipfs.io/ipns/tokens.uniswap.org"
+)
+# Hedges of UNISWAP_URL, comma separated
+UNISWAP_MIRROR_URLS = [
+    url
+    for url in os.environ.get(
+        "PEANUT_DATA_UNISWAP_MIRROR_URLS", "https://tokens.uniswap.org"
+    ).split(",")
+    if url
+]
+TOP_LIST_MORALIS_URL = os.environ.get(
+    "PEANUT_DATA_TOP_LIST_MORALIS_URL",
+    "https://deep-index.moralis.io/api/v2.2/market-data/erc20s/top-tokens",
+)
+
+# How long fetched lists are served from the http cache, in seconds
+TOP_TOKENS_TTL = 6 * 60 * 60
+TOKEN_LIST_TTL = 24 * 60 * 60
+
+# Tokens kept from a platform's full token list
+PLATFORM_TOKENS_LIMIT = 200
+# Chains whose tokens are built at the same time; requests to each host are still
+# paced by pipeline.rate_limit
+TOKEN_WORKERS = 8
+TOKEN_FIELDS = ["address", "decimals", "name", "symbol", "logoURI"]
+
+
+def fetch_tokens_for_platform(platform_id, clients=None):
+    """
+    Returns only the first 200 tokens. Not an issue because this method is only
+    used for chains that have 0 tokens from the top 100 by market cap.
+
+    The token list is parsed as it is downloaded, and the download stops once the
+    first 200 tokens are in.
+    """
+    clients = clients or default_clients()
+    url = TOKENS_URL_TEMPLATE.format(platform_id)
+    with clients.cache.stream(url, ttl=TOKEN_LIST_TTL) as response:
+        if response.status_code != 200:
+            print(
+                f"Error fetching tokens for platform {platform_id}. HTTP Status Code: {response.status_code}"
+            )
+            return []
+
+        try:
+            tokens = list(
+                itertools.islice(
+                    iter_json_array(response.iter_content(), ("tokens",)),
+                    PLATFORM_TOKENS_LIMIT,
+                )
+            )
+        except ValueError:
+            print(
+                f"Warning: Expected a list of tokens for platform {platform_id} but received a different data structure."
+            )
+            return []
+
+    # Check for expected fields in the first token as a sample
+    expected_fields = ["address", "decimals", "name", "symbol", "logoURI"]
+    if tokens and not all(field in tokens[0] for field in expected_fields):
+        print(
+            f"Warning: Some expected fields are missing in the tokens data for platform {platform_id}."
+        )
+
+    return tokens
+
+
+def moralis_fetch_top_marketcap_list(clients=None, api_key=None):
+    """The moralis top tokens, api_key defaults to MORALIS_API_KEY from the env."""
+    clients = clients or default_clients()
+    response = clients.cache.get(
+        TOP_LIST_MORALIS_URL,
+        ttl=TOP_TOKENS_TTL,
+        headers={"x-api-key": api_key or os.environ.get("MORALIS_API_KEY")},
+    )
+    if response.status_code == 200:
+        return response.json()
+    elif response.status_code == 401:
+        print(
+            "ERROR: Failed to fetch top tokens by marketcap with status 401. Is your moralis api key correct?"
+        )
+        # full error
+        print(f"Moralis API response: {response.json()}")
+        raise providers.FatalProviderError(
+            "Failed to fetch top tokens by marketcap with status 401. Is your moralis api key correct?"
+        )
+    else:
+        print("Failed to fetch top tokens by marketcap.")
+
+
+def fetch_coingecko_id_to_chain_id_mapping(clients=None):
+    """{chain id: coingecko platform id}, or None if the platforms can't be fetched."""
+    clients = clients or default_clients()
+    response = clients.cache.get(ASSET_PLATFORMS_URL, ttl=TOKEN_LIST_TTL)
+    if response.status_code != 200:
+        print(
+            f"Error fetching asset platforms. HTTP Status Code: {response.status_code}"
+        )
+        return None
+
+    platforms = response.json()
+    mapping = {}
+    for platform in platforms:
+        chain_id = platform.get("chain_identifier")
+        if chain_id:
+            mapping[chain_id] = platform["id"]
+
+    return mapping
+
+
+def fetch_full_coingecko_index(wanted_addresses=None, clients=None):
+    """
+    Stream the full coingecko token list into a contract index (see
+    build_contract_index), one token at a time, without loading the whole list.
+    Returns None if the list can't be fetched.
+    """
+    clients = clients or default_clients()
+    with clients.cache.stream(TOP_TOKENS_URL, ttl=TOKEN_LIST_TTL) as response:
+        if response.status_code != 200:
+            print("Failed to fetch list of all tokens.")
+            return None
+        return build_contract_index(
+            iter_json_array(response.iter_content()), wanted_addresses
+        )
+
+
+def fetch_uniswap_tokens(url=UNISWAP_URL, clients=None):
+    """
+    The tokens of the uniswap token list at url by chain id (as a string), with
+    the token fields only. Returns None if the list can't be fetched.
+    """
+    clients = clients or default_clients()
+    response = clients.cache.get(url, ttl=TOKEN_LIST_TTL)
+    if response.status_code != 200:
+        print(
+            f"Error fetching the uniswap token list from {url}. HTTP Status Code: {response.status_code}"
+        )
+        return None
+    try:
+        token_list = response.json()
+    except ValueError:
+        print(f"Warning: {url} is not a token list.")
+        return None
+
+    tokens_by_chain = {}
+    for token in token_list.get("tokens", []):
+        tokens_by_chain.setdefault(str(token["chainId"]), []).append(
+            {field: token[field] for field in TOKEN_FIELDS if field in token}
+        )
+    return tokens_by_chain
+
+
+def format_token_fields(moralis_token, coingecko_id):
+    return {
+        "address": moralis_token["platforms"][coingecko_id],
+        "decimals": int(moralis_token["token_decimals"]),
+        "name": moralis_token["token_name"],
+        "symbol": moralis_token["token_symbol"],
+        "logoURI": moralis_token["token_logo"],
+    }
+
+
+def build_contract_index(full_list, wanted_addresses=None):
+    """
+    Index the full coingecko token list by (contract address, symbol), both
+    lowercased, so that a top token can be matched with a single lookup.
+    Tokens sharing the same key keep their order from the full list.
+
+    full_list can be any iterable, e.g. a stream of tokens. If wanted_addresses (a
+    set of lowercase addresses) is given, only tokens deployed at one of these
+    addresses are kept, so the index stays small however long the list is.
+    """
+    index = {}
+    for full_list_token in full_list:
+        symbol = full_list_token["symbol"].lower()
+        addresses = {
+            address.lower()
+            for address in full_list_token["platforms"].values()
+            if address
+        }
+        if wanted_addresses is not None:
+            addresses &= wanted_addresses
+        for address in addresses:
+            index.setdefault((address, symbol), []).append(full_list_token)
+    return index
+
+
+def get_top_tokens_with_contracts(top_tokens, contract_index):
+    """
+    Look up each moralis top token in the index of the full coingecko token list
+    (see build_contract_index). Populate 'platforms' field in the resulting list
+    with contract addresses for different networks.
+    """
+
+    top_tokens_by_chain = []
+    for top_token in top_tokens:
+        if top_token["contract_address"] == "":
+            continue
+        key = (
+            top_token["contract_address"].lower(),
+            top_token["token_symbol"].lower(),
+        )
+        for full_list_token in contract_index.get(key, []):
+            token_info = top_token.copy()
+            token_info["platforms"] = full_list_token["platforms"]
+            top_tokens_by_chain.append(token_info)
+
+    return top_tokens_by_chain
+
+
+def fill_missing_fields(tokens, fallback_tokens):
+    """
+    tokens with the fields they lack (or that are null) taken from the fallback
+    token at the same address. Fields tokens have always take precedence.
+    """
+    fallback_by_address = {
+        token["address"].lower(): token for token in fallback_tokens or []
+    }
+    filled = []
+    for token in tokens:
+        fallback = fallback_by_address.get(str(token.get("address", "")).lower())
+        if fallback:
+            token = {
+                **token,
+                **{
+                    key: value
+                    for key, value in fallback.items()
+                    if token.get(key) is None
+                },
+            }
+        filled.append(token)
+    return filled
+
+
+def complete_token_fields(tokens):
+    """The tokens that have every token field, without their chainId."""
+    return [
+        {key: value for key, value in token.items() if key not in ["chainId"]}
+        for token in tokens
+        if all(key in token for key in TOKEN_FIELDS)
+    ]
+
+
+def build_chain_tokens(
+    chain_id, details, coingecko_id, tokens, clients=None, fallback_tokens=None
+):
+    """
+    Builds the tokenDetails entry of a chain from its tokens in the top list,
+    falling back to the platform's full token list if there are none, and to
+    fallback_tokens (the chain's uniswap list tokens) if that is empty too. Fields
+    missing from the chosen tokens are filled from fallback_tokens. Returns (entry,
+    tokens as fetched, fetch time). Safe to run for several chains at once.
+    """
+    # If nothing is found from top 100 tokens by market cap, fill it
+    # using fetch_tokens_for_platform
+    if coingecko_id and len(tokens) == 0:
+        with metrics.span("platform_lists"):
+            tokens = fetch_tokens_for_platform(coingecko_id, clients)
+    if len(tokens) == 0 and fallback_tokens:
+        tokens = fallback_tokens
+    fetched_at = time.time()
+
+    # Filter out tokens with missing fields
+    complete_tokens = complete_token_fields(
+        fill_missing_fields(tokens, fallback_tokens)
+    )
+
+    # Remove native token if already present so it won't get duplicated
+    complete_tokens = list(
+        filter(
+            lambda token: token["symbol"] != details["nativeCurrency"]["symbol"],
+            complete_tokens,
+        )
+    )
+
+    # Add native token first in the list
+    logoURI = details.get("icon", {}).get("url", "")
+    if logoURI.startswith("ipfs://"):
+        logoURI = "https://ipfs.io/" + logoURI[len("ipfs://") :]
+    native_token = {
+        "address": "0x0000000000000000000000000000000000000000",
+        "name": details["nativeCurrency"]["name"],
+        "symbol": details["nativeCurrency"]["symbol"],
+        "decimals": details["nativeCurrency"]["decimals"],
+        "logoURI": logoURI,
+    }
+    complete_tokens.insert(0, native_token)
+
+    entry = {
+        "chainId": chain_id,
+        "name": details.get("name", ""),
+        "tokens": complete_tokens,
+    }
+    return entry, tokens, fetched_at
+
+
+def tokens_need_refresh(chain_id, top_list_tokens, state, max_age):
+    """
+    In incremental mode, a chain's tokens are refetched if they are older than
+    max_age hours, or if its tokens from the top list changed since the last
+    refresh. Chains that fall back to fetch_tokens_for_platform are only refetched
+    by age, since that list is what's expensive to download.
+    """
+    if state.is_stale("tokens", chain_id, "fetched_at", max_age):
+        return True
+    return bool(top_list_tokens) and content_hash(top_list_tokens) != state.get(
+        "tokens", chain_id
+    ).get("content_hash")
+
+
+def load_top_tokens_by_chain(clients=None, api_key=None):
+    """
+    The moralis top tokens with their coingecko platforms (see
+    get_top_tokens_with_contracts). Raises providers.ProviderError if either list
+    can't be fetched, and providers.FatalProviderError if moralis rejects the api
+    key.
+
+    Neither request is hedged: the moralis call is paid for, and the full
+    coingecko list takes longer to download than a hedge would wait.
+    """
+    # Fetch top tokens from moralis
+    with metrics.span("top_tokens"):
+        top_tokens = moralis_fetch_top_marketcap_list(clients, api_key)
+    if top_tokens is None:
+        raise providers.ProviderError("moralis top tokens failed")
+    print(f"Top tokens fetched: {len(top_tokens)}")
+
+    # Index the full token list supported by coingecko, keeping only the top tokens
+    wanted_addresses = {token["contract_address"].lower() for token in top_tokens}
+    with metrics.span("coingecko_index"):
+        contract_index = fetch_full_coingecko_index(wanted_addresses, clients)
+    if contract_index is None:
+        raise providers.ProviderError("coingecko token list failed")
+
+    # add deployed contract addresses for different networks to top_tokens list
+    with metrics.span("token_join"):
+        return get_top_tokens_with_contracts(top_tokens, contract_index)
+
+
+class TokenSources:
+    """The upstream token lists, joined once for all chains."""
+
+    # The providers without which the top tokens of a chain are incomplete
+    TOP_LIST_PROVIDERS = {"top_list", "asset_platforms"}
+
+    def __init__(
+        self,
+        top_tokens_by_chain,
+        chain_id_to_coingecko_id,
+        uniswap_tokens=None,
+        failed=(),
+    ):
+        self.top_tokens_by_chain = top_tokens_by_chain
+        self.chain_id_to_coingecko_id = chain_id_to_coingecko_id
+        self.uniswap_tokens = uniswap_tokens or {}
+        # names of the providers that failed
+        self.failed = set(failed)
+
+    @property
+    def complete(self):
+        """Whether the top tokens of every chain could be fetched."""
+        return not self.failed & self.TOP_LIST_PROVIDERS
+
+    @classmethod
+    def load(cls, clients=None, api_key=None, deadline=providers.PROVIDER_DEADLINE):
+        """
+        Queries the providers concurrently. A provider that fails is left out, with
+        a warning; raises if none of them answered.
+        """
+        results, errors = providers.fetch_all(
+            {
+                "top_list": lambda: load_top_tokens_by_chain(clients, api_key),
+                # Fetch the mapping from chainId to CoinGecko ID
+                "asset_platforms": lambda: providers.hedged(
+                    [functools.partial(fetch_coingecko_id_to_chain_id_mapping, clients)]
+                    * 2,
+                    "coingecko asset platforms",
+                ),
+                "uniswap": lambda: providers.hedged(
+                    [
+                        functools.partial(fetch_uniswap_tokens, url, clients)
+                        for url in [UNISWAP_URL] + UNISWAP_MIRROR_URLS
+                    ],
+                    "uniswap token list",
+                ),
+            },
+            deadline,
+        )
+        for name, error in errors.items():
+            print(f"Warning: token provider {name} is unavailable ({error}).")
+        if not results:
+            raise Exception("Token sources fetch failed, please try again.")
+        return cls(
+            results.get("top_list", []),
+            results.get("asset_platforms", {}),
+            results.get("uniswap"),
+            errors,
+        )
+
+    def coingecko_id(self, chain_id):
+        return self.chain_id_to_coingecko_id.get(int(chain_id))
+
+    def fallback_tokens(self, chain_id):
+        """The chain's tokens in the uniswap list."""
+        return self.uniswap_tokens.get(str(chain_id), [])
+
+    def top_list_tokens(self, coingecko_id):
+        """The top tokens deployed on the coingecko platform, formatted."""
+        return [
+            format_token_fields(top_token, coingecko_id)
+            for top_token in self.top_tokens_by_chain
+            if coingecko_id in top_token["platforms"]
+        ]
+
+
+def load_token_store(paths=None):
+    paths = paths or DataPaths()
+    try:
+        with open(paths.token_details, "r") as f:
+            return TokenStore(json.load(f))
+    except FileNotFoundError:
+        return TokenStore()
+
+
+def load_manual_tokens(paths=None):
+    paths = paths or DataPaths()
+    try:
+        with open(paths.manual_tokens, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def write_token_details(token_details, paths=None):
+    """
+    Writes tokenDetails.json and its build variants, then the shards and the lookup
+    index.
+    """
+    paths = paths or DataPaths()
+    report = writer.write_json_artifact(
+        paths.token_details, token_details, build_dir=paths.build_dir
+    )
+    shards.write_shards_from_files(
+        paths.chain_details, paths.token_details, paths.contracts, paths.shards_dir
+    )
+    lookup_index.write_lookup_index_from_files(paths)
+    return report
+
+
+_save_lock = threading.Lock()
+
+
+def save_chain_tokens(entries, paths=None):
+    """
+    Stores the tokenDetails entries (keyed by chainId) in tokenDetails.json, with
+    their manual tokens merged in, keeping the other chains.
+    """
+    with _save_lock:
+        token_store = load_token_store(paths)
+        for entry in entries.values():
+            token_store.upsert_chain(entry)
+        for manual_entry in load_manual_tokens(paths):
+            if manual_entry["chainId"] in entries:
+                token_store.merge_chain(manual_entry)
+        return write_token_details(token_store.to_list(), paths)
+
+
+async def refresh_tokens(chain_id, paths=None, clients=None, sources=None, save=True):
+    """
+    Refreshes the tokens of one chain of chainDetails.json. sources are the
+    TokenSources to pick from, fetched if not given (pass them when refreshing
+    several chains). Saves the entry to tokenDetails.json unless save is False, and
+    returns it.
+    """
+    chain_id = str(chain_id)
+    paths = paths or DataPaths()
+    with open(paths.chain_details, "r") as f:
+        details = json.load(f)[chain_id]
+    if sources is None:
+        sources = await asyncio.to_thread(TokenSources.load, clients)
+    coingecko_id = sources.coingecko_id(chain_id)
+    entry, _, _ = await asyncio.to_thread(
+        build_chain_tokens,
+        chain_id,
+        details,
+        coingecko_id,
+        sources.top_list_tokens(coingecko_id) if coingecko_id else [],
+        clients,
+        sources.fallback_tokens(chain_id),
+    )
+    if save:
+        await asyncio.to_thread(save_chain_tokens, {chain_id: entry}, paths)
+    return entry
@@ -0,0 +1,142 @@
+"""
+Output stage for the data files written by the refresh scripts.
+
+write_json_artifact writes a data file deterministically: dict keys in canonical
+order (chain ids numerically, other keys alphabetically; list order is kept, since
+it is meaningful), the file is only rewritten if its content changed, and every
+write is atomic (write to a temporary file, then rename).
+
+Alongside the tab-indented source file, production variants are written to
+BUILD_DIR: a minified <name>.min.json and its gzip and brotli precompressed copies.
+The .br copy needs the brotli package from requirements.txt; an environment
+without it skips the .br copy.
+
+Each call returns size report rows comparing every artifact with the previous run;
+print_size_report formats them.
+
+write_atomic and atomic_file are the atomic writers of every file the pipeline (and
+playground/preprompt.py) writes.
+"""
+
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUILD_DIR = "build"
+# mkstemp creates files readable by the owner only
+FILE_MODE = 0o644
+
+
+def _key_order(key):
+    return (0, int(key), "") if key.isdigit() else (1, 0, key)
+
+
+def canonical(data):
+    """data with every dict's keys in canonical order, recursively."""
+    if isinstance(data, dict):
+        return {key: canonical(data[key]) for key in sorted(data, key=_key_order)}
+    if isinstance(data, list):
+        return [canonical(item) for item in data]
+    return data
+
+
+@contextlib.contextmanager
+def atomic_file(path, mode="wb"):
+    """
+    Opens a temporary file next to path for writing, and renames it over path when
+    the block exits without an exception (the temporary file is removed
+    otherwise), so path never holds a partial write.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    encoding = None if "b" in mode else "utf-8"
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_atomic(path, content):
+    """Atomically writes content (bytes, or str written as UTF-8) to path."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    with atomic_file(path) as f:
+        f.write(content)
+
+
+def write_if_changed(path, content):
+    """
+    Atomically writes content to path unless the file already holds exactly that
+    content. Returns (previous size or None, new size, written).
+    """
+    previous_size = None
+    try:
+        with open(path, "rb") as f:
+            previous = f.read()
+        previous_size = len(previous)
+        if hashlib.sha256(previous).digest() == hashlib.sha256(content).digest():
+            return previous_size, len(content), False
+    except FileNotFoundError:
+        pass
+
+    write_atomic(path, content)
+    return previous_size, len(content), True
+
+
+def _row(path, sizes):
+    previous_size, size, written = sizes
+    return {"path": path, "previous": previous_size, "bytes": size, "written": written}
+
+
+def write_json_artifact(path, data, variants=True, build_dir=BUILD_DIR):
+    """
+    Writes data as canonical, tab-indented JSON to path, plus (with variants) the
+    minified and precompressed copies in build_dir. Returns the size report rows.
+    """
+    data = canonical(data)
+    pretty = (json.dumps(data, indent="\t") + "\n").encode("utf-8")
+    report = [_row(path, write_if_changed(path, pretty))]
+    if not variants:
+        return report
+
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    min_path = os.path.join(build_dir, f"{base_name}.min.json")
+    minified = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    compressed = [(min_path, minified)]
+    # mtime=0 keeps the gzip output identical for identical input
+    compressed.append(
+        (min_path + ".gz", gzip.compress(minified, compresslevel=9, mtime=0))
+    )
+    if brotli is not None:
+        compressed.append((min_path + ".br", brotli.compress(minified)))
+
+    for variant_path, content in compressed:
+        report.append(_row(variant_path, write_if_changed(variant_path, content)))
+    return report
+
+
+def print_size_report(report):
+    print(f"{'artifact':<40} {'previous':>10} {'bytes':>10} {'change':>9}")
+    for row in report:
+        previous = row["previous"]
+        if previous is None:
+            change = "new"
+        elif not row["written"]:
+            change = "unchanged"
+        else:
+            change = f"{row['bytes'] - previous:+d}"
+        previous = "-" if previous is None else previous
+        print(f"{row['path']:<40} {previous:>10} {row['bytes']:>10} {change:>9}")
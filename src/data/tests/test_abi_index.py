@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import fillAbiIndex
+from pipeline import abi_index, keccak
+from pipeline.paths import DataPaths
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+APPROVAL_TOPIC = "0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925"
+
+
+@pytest.mark.parametrize("digest", [keccak.keccak256, keccak._keccak256_python])
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (b"", "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"),
+        (
+            b"hello world",
+            "47173285a8d7341e5e972fc677286384f802f8ef42a5ec5f03bbfa254cb01fad",
+        ),
+        # one byte short of, and exactly, a full block of the sponge's rate
+        (
+            b"a" * 135,
+            "34367dc248bbd832f4e3e69dfaac2f92638bd0bbd18f2912ba4ef454919cf446",
+        ),
+        (
+            b"a" * 136,
+            "a6c4d403279fe3e0af03729caada8374b5ca54d8065329a3ebcaeb4b60aa386e",
+        ),
+    ],
+)
+def test_keccak256_vectors(digest, data, expected):
+    assert digest(data).hex() == expected
+
+
+def test_selectors_and_topics_of_signatures():
+    assert keccak.selector("transfer(address,uint256)") == "0xa9059cbb"
+    assert keccak.topic("Transfer(address,address,uint256)") == TRANSFER_TOPIC
+
+
+def test_signature_spells_out_tuples():
+    entry = {
+        "name": "deposit",
+        "inputs": [
+            {
+                "type": "tuple[]",
+                "components": [{"type": "address"}, {"type": "uint256"}],
+            },
+            {"type": "bytes32"},
+        ],
+    }
+
+    assert keccak.signature(entry) == "deposit((address,uint256)[],bytes32)"
+
+
+@pytest.fixture(scope="module")
+def index():
+    return abi_index.build_abi_index(DATA_DIR)
+
+
+def test_indexes_erc20_transfer(index):
+    (decoding,) = abi_index.lookup(index, "0xA9059CBB")
+
+    assert decoding["signature"] == "transfer(address,uint256)"
+    assert "erc20" in decoding["contracts"]
+
+
+def test_erc20_and_erc721_events_collide(index):
+    # same signature, but ERC-721 indexes the token id too
+    for topic in (TRANSFER_TOPIC, APPROVAL_TOPIC):
+        decodings = abi_index.lookup(index, topic)
+        assert len(decodings) == 2
+        assert len({d["signature"] for d in decodings}) == 1
+        assert [d["contracts"] for d in decodings] == [["erc20"], ["erc721"]]
+        assert topic in index["collisions"]
+    transfer_fragments = [
+        d["fragment"] for d in abi_index.lookup(index, TRANSFER_TOPIC)
+    ]
+    assert transfer_fragments[1].endswith("uint256 indexed tokenId)")
+
+
+def test_main_exits_with_1_on_collisions(tmp_path):
+    for name in ("erc20abi.json", "erc721abi.json"):
+        shutil.copy(os.path.join(DATA_DIR, name), tmp_path)
+
+    with pytest.raises(SystemExit) as exit_info:
+        fillAbiIndex.main(
+            fillAbiIndex.parse_args(
+                ["--data-dir", str(tmp_path), "--fail-on-collision"]
+            )
+        )
+
+    assert exit_info.value.code == 1
+    with open(DataPaths(str(tmp_path)).abi_index) as f:
+        assert TRANSFER_TOPIC in json.load(f)["collisions"]
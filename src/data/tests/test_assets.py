@@ -0,0 +1,173 @@
+import struct
+
+import pytest
+
+from pipeline import assets
+from pipeline.assets import AssetError, TransientAssetError
+from pipeline.clients import Clients
+from pipeline.http_cache import HttpCache
+from pipeline.negative_cache import NegativeCache
+from pipeline.paths import DataPaths
+from pipeline.rate_limit import RequestScheduler
+
+
+def png(width, height):
+    return (
+        b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR"
+        + struct.pack(">II", width, height)
+        + b"\x08\x06\0\0\0"
+    )
+
+
+PNG = png(32, 32)
+GIF = b"GIF89a" + struct.pack("<HH", 16, 16) + b"\0" * 8
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24"></svg>'
+
+
+class Response:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def clients(tmp_path, routes):
+    """Clients answering each url with routes[url]: (status code, content)."""
+    scheduler = RequestScheduler(
+        rates={},
+        default_rate=(1000, 1000),
+        max_retries=0,
+        send=lambda method, url, **_: Response(*routes[url]),
+    )
+    return Clients(
+        cache=HttpCache(cache_dir=str(tmp_path / "http"), scheduler=scheduler),
+        scheduler=scheduler,
+    )
+
+
+@pytest.mark.parametrize(
+    "content, image_format",
+    [
+        (PNG, "png"),
+        (b"\xff\xd8\xff\xe0", "jpg"),
+        (GIF, "gif"),
+        (b"RIFF\0\0\0\0WEBPVP8 ", "webp"),
+        (b"\0\0\1\0\1\0", "ico"),
+        (SVG, "svg"),
+        (b'\xef\xbb\xbf<?xml version="1.0"?>\n' + SVG, "svg"),
+        (b"<html><body>not found</body></html>", None),
+        (b"<?xml version='1.0'?><feed/>", None),
+    ],
+)
+def test_sniffs_the_format_from_the_content(content, image_format):
+    assert assets.sniff_format(content) == image_format
+
+
+def test_normalize_reads_the_dimensions():
+    assert assets.normalize(PNG) == (PNG, "png", (32, 32), False)
+    assert assets.normalize(SVG) == (SVG, "svg", (24, 24), False)
+
+
+@pytest.mark.parametrize(
+    "markup",
+    [
+        b"<script>alert(1)</script>",
+        b'<a href="javascript:alert(1)"></a>',
+        b'<rect onload="alert(1)"/>',
+        b"<foreignObject><p>html</p></foreignObject>",
+    ],
+)
+def test_rejects_svgs_with_active_content(markup):
+    svg = SVG.replace(b"></svg>", b">" + markup + b"</svg>")
+    with pytest.raises(AssetError, match="active content"):
+        assets.normalize(svg)
+
+
+def test_rejects_content_that_is_not_an_image():
+    with pytest.raises(AssetError, match="not an image"):
+        assets.normalize(b"<html></html>")
+
+
+def test_oversized_raster_is_kept_as_is_without_pillow(monkeypatch):
+    monkeypatch.setattr(assets, "Image", None)
+    large = png(assets.MAX_DIMENSION + 1, 16)
+
+    assert assets.normalize(large) == (
+        large,
+        "png",
+        (assets.MAX_DIMENSION + 1, 16),
+        True,
+    )
+
+
+def test_download_over_the_size_limit_fails(tmp_path):
+    url = "https://host/huge.png"
+    c = clients(tmp_path, {url: (200, PNG + b"\0" * assets.MAX_ASSET_BYTES)})
+
+    with pytest.raises(AssetError, match="larger than") as error:
+        assets.fetch(url, c)
+    assert not isinstance(error.value, TransientAssetError)
+
+
+@pytest.mark.parametrize(
+    "status_code, transient", [(404, False), (410, False), (503, True), (429, True)]
+)
+def test_only_gone_urls_are_definitive_failures(tmp_path, status_code, transient):
+    url = "https://host/logo.png"
+    c = clients(tmp_path, {url: (status_code, b"")})
+
+    with pytest.raises(AssetError) as error:
+        assets.fetch(url, c)
+    assert isinstance(error.value, TransientAssetError) == transient
+
+
+def test_update_caches_only_definitive_misses(tmp_path):
+    paths = DataPaths(str(tmp_path))
+    routes = {
+        "https://host/chain.png": (200, PNG),
+        "https://host/same.png": (200, PNG),
+        "https://host/gone.png": (404, b""),
+        "https://host/down.png": (503, b""),
+        "https://host/page.png": (200, b"<html></html>"),
+    }
+    chain_details = {"1": {"icon": {"url": "https://host/chain.png"}}}
+    token_details = [
+        {
+            "chainId": "1",
+            "tokens": [
+                {"logoURI": url} for url in list(routes)[1:] + ["data:,<svg></svg>"]
+            ],
+        }
+    ]
+    misses = NegativeCache(str(tmp_path / "asset-misses.json"), ttl=assets.RETRY_TTL)
+
+    manifest, stats = assets.update_assets(
+        chain_details,
+        token_details,
+        paths,
+        clients(tmp_path, routes),
+        workers=2,
+        misses=misses,
+    )
+
+    # the same logo behind two urls is stored once
+    name = assets.file_name(PNG, "png")
+    assert manifest["urls"]["https://host/chain.png"] == "assets/" + name
+    assert manifest["urls"]["https://host/same.png"] == "assets/" + name
+    assert (stats["downloaded"], stats["failed"], stats["files"]) == (3, 3, 2)
+    assert "https://host/gone.png" in misses
+    assert "https://host/page.png" in misses
+    assert "https://host/down.png" not in misses
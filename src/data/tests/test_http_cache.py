@@ -0,0 +1,52 @@
+import threading
+
+from pipeline.http_cache import HttpCache
+from pipeline.rate_limit import RequestScheduler
+
+
+class Response:
+    def __init__(self, url, status_code, content=b""):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+def cache(tmp_path, status_code):
+    scheduler = RequestScheduler(
+        rates={},
+        default_rate=(1e6, 1e6),
+        send=lambda method, url, **_: Response(url, status_code, b"body"),
+    )
+    return HttpCache(cache_dir=str(tmp_path), scheduler=scheduler)
+
+
+def test_serves_a_fresh_copy_from_the_cache(tmp_path):
+    c = cache(tmp_path, 200)
+
+    assert c.get("http://host/a").content == b"body"
+    response = c.get("http://host/a")
+
+    assert response.content == b"body" and response.from_cache
+    assert c.stats == {"hits": 1, "revalidated": 0, "misses": 1, "bytes_fetched": 4}
+
+
+def test_stats_are_counted_across_threads(tmp_path):
+    # a 410 isn't cached, so every get is a miss that fetches the body
+    c = cache(tmp_path, 410)
+
+    def get_urls():
+        for _ in range(200):
+            c.get("http://host/a")
+
+    threads = [threading.Thread(target=get_urls) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert c.stats["misses"] == 8 * 200
+    assert c.stats["bytes_fetched"] == 8 * 200 * len(b"body")
@@ -0,0 +1,69 @@
+import itertools
+import json
+
+import pytest
+
+from pipeline.json_stream import iter_json_array
+
+
+def chunked(text, size):
+    data = text.encode("utf-8")
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+DOCUMENT = {
+    "name": "list",
+    "meta": {"tokens": ["not", "this"], "n": [1, 2.5e3]},
+    "tokens": [
+        {"address": "0x1", "decimals": 18, "name": "Ünïcode", "price": 12345.678},
+        {"address": "0x2", "decimals": 6, "tags": [], "nested": {"a": [1, {}]}},
+        -17,
+        "a string with ] and , inside",
+    ],
+}
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 4096])
+def test_items_match_json_load_for_any_chunk_size(size):
+    chunks = chunked(json.dumps(DOCUMENT), size)
+    assert list(iter_json_array(chunks, ("tokens",))) == DOCUMENT["tokens"]
+
+
+@pytest.mark.parametrize("size", [1, 5, 4096])
+def test_root_array(size):
+    items = [1, 22, 333, {"x": [4444]}, 55555]
+    assert list(iter_json_array(chunked(json.dumps(items), size))) == items
+
+
+def test_numbers_split_across_chunks_are_not_truncated():
+    assert list(iter_json_array([b"[12", b"34, 5", b".5e", b"1]"])) == [1234, 55.0]
+
+
+def test_empty_array():
+    assert list(iter_json_array([b'{"tokens": [ ]}'], ("tokens",))) == []
+
+
+def test_stops_reading_when_the_consumer_stops():
+    read = []
+
+    def chunks():
+        for chunk in chunked(json.dumps(list(range(1000))), 10):
+            read.append(chunk)
+            yield chunk
+
+    assert list(itertools.islice(iter_json_array(chunks()), 3)) == [0, 1, 2]
+    assert len(read) == 1
+
+
+@pytest.mark.parametrize(
+    "document, path",
+    [
+        ('{"other": []}', ("tokens",)),
+        ('{"tokens": {}}', ("tokens",)),
+        ("[1, 2 3]", ()),
+        ("[1, 2] x", ()),
+    ],
+)
+def test_malformed_documents_raise_value_error(document, path):
+    with pytest.raises(ValueError):
+        list(iter_json_array([document.encode("utf-8")], path))
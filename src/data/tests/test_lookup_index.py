@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+from pipeline import lookup_index
+from pipeline.lookup_index import build_lookup_index
+from pipeline.paths import DataPaths
+
+V4 = "0x" + "ab" * 20
+V42 = "0x" + "22" * 20
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+
+CONTRACTS = {
+    "1": {"name": "Ethereum", "mainnet": "true", "v4": V4, "v4.2": V42},
+    "10": {"name": "Optimism", "v4": "0x" + V4[2:].upper()},
+}
+CHAIN_DETAILS = {"1": {"shortName": "eth"}, "10": {"shortName": "oeth"}}
+TOKEN_DETAILS = [
+    {
+        "chainId": "1",
+        "tokens": [{"address": USDC, "decimals": 6, "symbol": "USDC", "name": "USD"}],
+    }
+]
+CHAIN_MAP = {"mainnet": "1", "op": 10}
+
+
+def duplicates(index, name):
+    return [d for d in index["duplicates"] if d["index"] == name]
+
+
+def test_indexes_without_duplicates():
+    index = build_lookup_index(CONTRACTS, CHAIN_DETAILS, TOKEN_DETAILS, CHAIN_MAP)
+
+    # the same address on two chains is not a duplicate
+    assert index["contracts"][V4] == {"1": "v4", "10": "v4"}
+    assert index["contracts"][V42] == {"1": "v4.2"}
+    assert "true" not in index["contracts"]
+    assert index["tokens"]["1"][USDC.lower()]["decimals"] == 6
+    assert index["aliases"] == {
+        "mainnet": "1",
+        "op": "10",
+        "eth": "1",
+        "oeth": "10",
+        "ethereum": "1",
+        "optimism": "10",
+    }
+    assert index["duplicates"] == []
+
+
+def test_contract_under_two_versions_of_a_chain():
+    contracts = {"1": {"v4": V4, "Bv4": "0x" + V4[2:].upper()}}
+    index = build_lookup_index(contracts, {}, [], {})
+
+    # the first version key is indexed
+    assert index["contracts"][V4] == {"1": "v4"}
+    assert duplicates(index, "contracts") == [
+        {"index": "contracts", "key": f"1:{V4}", "values": ["v4", "Bv4"]}
+    ]
+
+
+def first_match(token_details, chain_id, address):
+    """The token the SDK resolves: the first one with the address on the chain."""
+    chain = next(entry for entry in token_details if entry["chainId"] == chain_id)
+    return next(
+        token for token in chain["tokens"] if token["address"].lower() == address
+    )
+
+
+def test_token_listed_twice_on_a_chain():
+    usdc = {"address": USDC, "decimals": 6, "symbol": "USDC"}
+    usdc_e = {"address": USDC.lower(), "decimals": 6, "symbol": "USDC.e"}
+    token_details = [{"chainId": "1", "tokens": [usdc, usdc_e, dict(usdc)]}]
+    index = build_lookup_index({}, {}, token_details, {})
+
+    # an index lookup agrees with a first-match scan; the differing repeat is
+    # reported, the identical one isn't
+    indexed = index["tokens"]["1"][USDC.lower()]
+    scanned = first_match(token_details, "1", USDC.lower())
+    assert indexed == {key: scanned[key] for key in indexed}
+    assert indexed["symbol"] == "USDC"
+    assert duplicates(index, "tokens") == [
+        {
+            "index": "tokens",
+            "key": f"1:{USDC.lower()}",
+            "values": [
+                {"decimals": 6, "symbol": "USDC"},
+                {"decimals": 6, "symbol": "USDC.e"},
+            ],
+        }
+    ]
+
+
+def test_committed_token_details_agree_with_a_first_match_scan():
+    paths = DataPaths(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(paths.token_details) as f:
+        token_details = json.load(f)
+    index = build_lookup_index({}, {}, token_details, {})
+
+    for entry in token_details:
+        for token in entry["tokens"]:
+            address = token["address"].lower()
+            scanned = first_match(token_details, entry["chainId"], address)
+            assert index["tokens"][entry["chainId"]][address] == {
+                key: scanned[key] for key in lookup_index.TOKEN_FIELDS if key in scanned
+            }
+
+
+def test_alias_of_two_chains_is_case_insensitive():
+    chain_details = {"1": {"shortName": "ETH"}, "5": {"shortName": "gor"}}
+    index = build_lookup_index({}, chain_details, [], {"eth": "5", "Gor": 5})
+
+    # chainMap.json comes first and wins
+    assert index["aliases"] == {"eth": "5", "gor": "5"}
+    assert duplicates(index, "aliases") == [
+        {"index": "aliases", "key": "eth", "values": ["5", "1"]}
+    ]
+
+
+@pytest.mark.parametrize("fail_on_duplicate", [False, True])
+def test_main_exits_with_1_on_duplicates(tmp_path, fail_on_duplicate):
+    paths = DataPaths(str(tmp_path))
+    with open(paths.contracts, "w") as f:
+        json.dump({"1": {"v4": V4, "v4.2": V4}}, f)
+    argv = ["--data-dir", str(tmp_path)]
+    if fail_on_duplicate:
+        with pytest.raises(SystemExit) as exit_info:
+            lookup_index.main(argv + ["--fail-on-duplicate"])
+        assert exit_info.value.code == 1
+    else:
+        lookup_index.main(argv)
+
+    with open(paths.lookup_index) as f:
+        assert len(json.load(f)["duplicates"]) == 1
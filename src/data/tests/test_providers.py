@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import providers
+from pipeline.providers import FatalProviderError, ProviderError
+
+# long enough that a test waiting on it would be noticed
+STUCK_SECONDS = 5
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    stats = {"hedged": 0, "hedge_wins": 0}
+    monkeypatch.setattr(providers, "stats", stats)
+    monkeypatch.setattr(providers, "outcomes", {})
+    return stats
+
+
+@pytest.fixture
+def release():
+    """An event the stuck attempts wait on, set when the test is over."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def stuck(release, result="late"):
+    def attempt():
+        release.wait(STUCK_SECONDS)
+        return result
+
+    return attempt
+
+
+def fail(message):
+    def attempt():
+        raise RuntimeError(message)
+
+    return attempt
+
+
+def fatal():
+    raise FatalProviderError("api key rejected")
+
+
+def test_first_answer_wins_without_waiting_for_the_loser(stats, release):
+    started = []
+
+    def never_started():
+        started.append(True)
+        return "third"
+
+    start = time.monotonic()
+    result = providers.hedged(
+        [stuck(release), lambda: "hedge", never_started], "list", hedge_after=0.01
+    )
+
+    assert result == "hedge"
+    assert time.monotonic() - start < STUCK_SECONDS / 2
+    # the attempts after the winner are never sent
+    assert started == []
+    assert stats == {"hedged": 1, "hedge_wins": 1}
+
+
+def test_failed_attempt_starts_the_next_one_at_once(stats):
+    start = time.monotonic()
+    result = providers.hedged(
+        [fail("down"), lambda: None, lambda: "mirror"], "list", hedge_after=60
+    )
+
+    assert result == "mirror"
+    assert time.monotonic() - start < 1
+
+
+def test_fatal_error_is_raised_without_waiting_for_the_hedges(release):
+    start = time.monotonic()
+    with pytest.raises(FatalProviderError):
+        providers.hedged([stuck(release), fatal], "list", hedge_after=0.01)
+
+    assert time.monotonic() - start < STUCK_SECONDS / 2
+
+
+def test_every_attempt_failing_raises():
+    with pytest.raises(ProviderError, match="list failed: mirror down"):
+        providers.hedged([fail("down"), fail("mirror down")], "list", hedge_after=60)
+
+
+def test_fetch_all_leaves_out_failed_and_late_providers(release):
+    results, errors = providers.fetch_all(
+        {
+            "ok": lambda: [1],
+            "empty": lambda: None,
+            "down": fail("HTTP 503"),
+            "slow": stuck(release),
+        },
+        deadline=0.2,
+    )
+
+    assert results == {"ok": [1]}
+    assert errors == {
+        "empty": "no result",
+        "down": "HTTP 503",
+        "slow": "no answer within 0.2s",
+    }
+    assert set(providers.outcomes) == {"ok", "empty", "down", "slow"}
+
+
+def test_fetch_all_raises_a_fatal_error_at_once(release):
+    start = time.monotonic()
+    with pytest.raises(FatalProviderError):
+        providers.fetch_all(
+            {"slow": stuck(release), "paid": fatal}, deadline=STUCK_SECONDS * 2
+        )
+
+    assert time.monotonic() - start < STUCK_SECONDS / 2
@@ -0,0 +1,61 @@
+import threading
+
+from pipeline import rate_limit
+from pipeline.rate_limit import RequestScheduler
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+def scheduler(responses):
+    responses = iter(responses)
+    return RequestScheduler(
+        rates={}, default_rate=(1000, 1000), send=lambda *_, **__: next(responses)
+    )
+
+
+def test_retry_after_is_clamped_to_backoff_max(monkeypatch):
+    sleeps = []
+    pauses = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    monkeypatch.setattr(
+        rate_limit.TokenBucket, "pause", lambda self, seconds: pauses.append(seconds)
+    )
+    throttled = Response(429, {"Retry-After": "86400"})
+    s = scheduler([throttled, Response(200)])
+
+    assert s.request("GET", "http://host/a").status_code == 200
+    assert sleeps == pauses == [rate_limit.BACKOFF_MAX]
+    assert s.stats == {"requests": 2, "retries": 1, "throttled": 1}
+
+
+def test_max_retries_can_be_overridden_per_request(monkeypatch):
+    monkeypatch.setattr(rate_limit.time, "sleep", lambda seconds: None)
+    s = scheduler([Response(503), Response(200)])
+
+    assert s.request("GET", "http://host/a", max_retries=0).status_code == 503
+    assert s.stats == {"requests": 1, "retries": 0, "throttled": 0}
+
+
+def test_stats_are_counted_across_threads():
+    s = RequestScheduler(
+        rates={}, default_rate=(1e6, 1e6), send=lambda *_, **__: Response(200)
+    )
+
+    def send_requests():
+        for _ in range(500):
+            s.request("GET", "http://host/a")
+
+    threads = [threading.Thread(target=send_requests) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert s.stats["requests"] == 8 * 500
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+
+from pipeline import shards
+
+CHAIN_DETAILS = {"1": {"name": "Ethereum"}, "10": {"name": "Optimism"}}
+TOKEN_DETAILS = [{"chainId": "1", "tokens": [{"address": "0x01", "symbol": "USDC"}]}]
+CONTRACTS = {"1": {"v4": "0xab"}, "137": {"v4": "0xcd"}}
+
+
+def read(shards_dir, file_name):
+    with open(os.path.join(shards_dir, file_name), "rb") as f:
+        return f.read()
+
+
+def test_builds_a_shard_for_every_chain():
+    built = shards.build_shards(CHAIN_DETAILS, TOKEN_DETAILS, CONTRACTS)
+
+    assert list(built) == ["1", "10", "137"]
+    assert built["1"] == {
+        "chainId": "1",
+        "chain": {"name": "Ethereum"},
+        "tokens": [{"address": "0x01", "symbol": "USDC"}],
+        "contracts": {"v4": "0xab"},
+    }
+    assert built["137"]["chain"] is None and built["137"]["tokens"] == []
+
+
+def test_shards_are_content_addressed_and_listed_in_the_manifest(tmp_path):
+    shards_dir = str(tmp_path)
+    built = shards.build_shards(CHAIN_DETAILS, TOKEN_DETAILS, CONTRACTS)
+    manifest = shards.write_shards(built, shards_dir)
+
+    with open(os.path.join(shards_dir, shards.MANIFEST_NAME)) as f:
+        assert json.load(f) == manifest
+    assert manifest["version"] == shards.MANIFEST_VERSION
+    for chain_id, entry in manifest["shards"].items():
+        content = read(shards_dir, entry["path"])
+        digest = hashlib.sha256(content).hexdigest()
+        assert entry["path"] == f"{chain_id}.{digest[:shards.NAME_HASH_LENGTH]}.json"
+        assert entry["sha256"] == digest
+        assert entry["bytes"] == len(content)
+        assert json.loads(content) == built[chain_id]
+    assert manifest["shards"]["10"]["name"] == "Optimism"
+    assert manifest["shards"]["137"]["name"] == ""
+
+
+def test_unchanged_chains_keep_their_file_name(tmp_path):
+    shards_dir = str(tmp_path)
+    first = shards.write_shards(
+        shards.build_shards(CHAIN_DETAILS, TOKEN_DETAILS, CONTRACTS), shards_dir
+    )
+    # key order doesn't change the content, so it doesn't change the name either
+    reordered = {"10": CHAIN_DETAILS["10"], "1": CHAIN_DETAILS["1"]}
+    second = shards.write_shards(
+        shards.build_shards(reordered, TOKEN_DETAILS, CONTRACTS), shards_dir
+    )
+
+    assert second == first
+
+
+def test_stale_shard_files_are_removed(tmp_path):
+    shards_dir = str(tmp_path)
+    first = shards.write_shards(
+        shards.build_shards(CHAIN_DETAILS, TOKEN_DETAILS, CONTRACTS), shards_dir
+    )
+    contracts = {"1": {"v4": "0xef"}}
+    second = shards.write_shards(
+        shards.build_shards(CHAIN_DETAILS, TOKEN_DETAILS, contracts), shards_dir
+    )
+
+    # chain 1 changed and 137 is gone; 10 is unchanged and keeps its file
+    assert second["shards"]["1"]["path"] != first["shards"]["1"]["path"]
+    assert "137" not in second["shards"]
+    assert second["shards"]["10"] == first["shards"]["10"]
+    assert sorted(os.listdir(shards_dir)) == sorted(
+        [shards.MANIFEST_NAME] + [entry["path"] for entry in second["shards"].values()]
+    )
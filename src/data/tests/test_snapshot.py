@@ -0,0 +1,151 @@
+import io
+import tarfile
+
+import pytest
+
+from pipeline import chains
+from pipeline.clients import Clients
+from pipeline.rate_limit import RequestScheduler
+from pipeline.snapshot import ChunkReader, Snapshot
+
+CHAINS_URL = "https://chainid.network/chains"
+ICONS_URL = "https://chainid.network/icons"
+PREFIXES = {"_data/chains/": CHAINS_URL, "_data/icons/": ICONS_URL}
+
+FILES = {
+    "chains-master/_data/chains/eip155-1.json": b'{"chainId": 1}',
+    "chains-master/_data/chains/eip155-10.json": b'{"chainId": 10}',
+    "chains-master/_data/icons/ethereum.json": b"[]",
+    "chains-master/README.md": b"# chains",
+}
+
+
+def archive(files):
+    """A .tar.gz of files, with an entry for each file's directory too."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for directory in sorted({path.rsplit("/", 1)[0] for path in files}):
+            info = tarfile.TarInfo(directory)
+            info.type = tarfile.DIRTYPE
+            tar.addfile(info)
+        for path, content in files.items():
+            info = tarfile.TarInfo(path)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def stream(content, chunk_size=7):
+    """content as a non-seekable file object, fed in small chunks."""
+    chunks = (content[i : i + chunk_size] for i in range(0, len(content), chunk_size))
+    return io.BufferedReader(ChunkReader(chunks))
+
+
+def test_loads_the_prefixed_files_of_a_streamed_archive():
+    snapshot = Snapshot()
+    snapshot.load_archive(stream(archive(FILES)), PREFIXES)
+
+    assert snapshot.trees == {
+        CHAINS_URL: {
+            "eip155-1.json": b'{"chainId": 1}',
+            "eip155-10.json": b'{"chainId": 10}',
+        },
+        ICONS_URL: {"ethereum.json": b"[]"},
+    }
+    assert snapshot.read(f"{CHAINS_URL}/eip155-10.json") == b'{"chainId": 10}'
+    # a file missing from a covered tree is a definitive miss
+    assert snapshot.covers(f"{CHAINS_URL}/eip155-5.json")
+    assert snapshot.read(f"{CHAINS_URL}/eip155-5.json") is None
+    assert snapshot.exists(f"{CHAINS_URL}/eip155-5.json") is False
+    # urls outside the snapshot are left to the http stack
+    assert not snapshot.covers("https://example.com/chains/eip155-1.json")
+    assert snapshot.exists("https://example.com/chains/eip155-1.json") is None
+
+
+def test_archive_without_a_top_directory():
+    files = {"_data/chains/eip155-1.json": b"{}"}
+    snapshot = Snapshot()
+    snapshot.load_archive(stream(archive(files)), PREFIXES, strip_top_dir=False)
+
+    assert snapshot.trees == {CHAINS_URL: {"eip155-1.json": b"{}"}}
+
+
+def tree(paths, truncated=False):
+    return {
+        "tree": [{"path": path, "type": kind} for path, kind in paths],
+        "truncated": truncated,
+    }
+
+
+def test_listing_adds_the_blob_names_under_the_prefix():
+    icons_url = "https://raw.githubusercontent.com/icons/master/svg/color"
+    snapshot = Snapshot()
+    listed = snapshot.load_listing(
+        tree(
+            [
+                ("svg/color", "tree"),
+                ("svg/color/eth.svg", "blob"),
+                ("svg/color/matic.svg", "blob"),
+                ("svg/black/eth.svg", "blob"),
+            ]
+        ),
+        "svg/color/",
+        icons_url,
+    )
+
+    assert listed
+    assert snapshot.listings == {icons_url: {"eth.svg", "matic.svg"}}
+    assert snapshot.exists(f"{icons_url}/eth.svg") is True
+    assert snapshot.exists(f"{icons_url}/btc.svg") is False
+    # only names are listed, the content is still requested
+    assert snapshot.read(f"{icons_url}/eth.svg") is None
+
+
+def test_truncated_listing_adds_nothing():
+    snapshot = Snapshot()
+
+    assert not snapshot.load_listing(
+        tree([("svg/color/eth.svg", "blob")], truncated=True), "svg/color/", "url"
+    )
+    assert snapshot.listings == {}
+
+
+class Response:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class TreeCache:
+    """An http cache answering only the crypto icons tree listing."""
+
+    def __init__(self, status_code, listing):
+        self.response = Response(status_code, listing)
+
+    def get(self, url, ttl=None, headers=None):
+        assert url == chains.CRYPTO_ICONS_TREE_URL
+        return self.response
+
+
+@pytest.mark.parametrize("status_code", [200, 403])
+def test_load_snapshot_from_an_archive_file(tmp_path, capsys, status_code):
+    path = tmp_path / "chains.tar.gz"
+    path.write_bytes(archive(FILES))
+    listing = tree([(chains.CRYPTO_ICONS_TREE_PREFIX + "eth.svg", "blob")])
+    clients = Clients(
+        cache=TreeCache(status_code, listing),
+        scheduler=RequestScheduler(rates={}, default_rate=(1000, 1000)),
+    )
+
+    snapshot = chains.load_snapshot(str(path), clients)
+
+    assert snapshot.read(f"{chains.CHAINS_URL}/eip155-1.json") == b'{"chainId": 1}'
+    if status_code == 200:
+        assert snapshot.exists(f"{chains.CRYPTO_ICONS_URL}/eth.svg") is True
+    else:
+        # the icons are probed one by one instead
+        assert not snapshot.covers(f"{chains.CRYPTO_ICONS_URL}/eth.svg")
+        assert "Could not list the crypto icons" in capsys.readouterr().out
@@ -0,0 +1,73 @@
+from pipeline.tokens import build_contract_index, get_top_tokens_with_contracts
+
+
+def coin(coin_id, symbol, platforms):
+    return {"id": coin_id, "symbol": symbol, "name": coin_id, "platforms": platforms}
+
+
+def top_token(address, symbol):
+    return {
+        "contract_address": address,
+        "token_symbol": symbol,
+        "token_name": symbol,
+        "token_decimals": "18",
+        "token_logo": "",
+    }
+
+
+def naive_join(top_tokens, full_list):
+    """The join as it was written before the index: a scan per top token."""
+    joined = []
+    for token in top_tokens:
+        if token["contract_address"] == "":
+            continue
+        for full_list_token in full_list:
+            if full_list_token["symbol"].lower() == token[
+                "token_symbol"
+            ].lower() and token["contract_address"].lower() in (
+                address.lower() for address in full_list_token["platforms"].values()
+            ):
+                joined.append({**token, "platforms": full_list_token["platforms"]})
+    return joined
+
+
+FULL_LIST = [
+    coin("usdc", "usdc", {"ethereum": "0xAAAA", "base": "0xBBBB"}),
+    coin("usdc-bridged", "USDC", {"ethereum": "0xaaaa", "polygon-pos": "0xCCCC"}),
+    coin("weth", "weth", {"ethereum": "0xDDDD", "optimistic-ethereum": ""}),
+    coin("other", "oth", {"ethereum": "0xEEEE"}),
+]
+
+
+def test_index_is_keyed_by_lowercase_address_and_symbol():
+    index = build_contract_index(FULL_LIST)
+    assert [t["id"] for t in index[("0xaaaa", "usdc")]] == ["usdc", "usdc-bridged"]
+    assert ("0xbbbb", "usdc") in index
+    # empty addresses are not indexed
+    assert not any(address == "" for address, _ in index)
+
+
+def test_index_keeps_only_wanted_addresses():
+    index = build_contract_index(FULL_LIST, {"0xaaaa"})
+    assert set(index) == {("0xaaaa", "usdc")}
+
+
+def test_join_matches_a_scan_of_the_full_list():
+    top_tokens = [
+        top_token("0xAaAa", "USDC"),
+        top_token("0xdddd", "WETH"),
+        top_token("0xeeee", "WRONG"),
+        top_token("", "ETH"),
+    ]
+    assert get_top_tokens_with_contracts(
+        top_tokens, build_contract_index(FULL_LIST)
+    ) == naive_join(top_tokens, FULL_LIST)
+
+
+def test_join_copies_the_platforms_without_changing_the_top_tokens():
+    top_tokens = [top_token("0xdddd", "weth")]
+    (joined,) = get_top_tokens_with_contracts(
+        top_tokens, build_contract_index(FULL_LIST)
+    )
+    assert joined["platforms"] == FULL_LIST[2]["platforms"]
+    assert "platforms" not in top_tokens[0]
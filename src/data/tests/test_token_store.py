@@ -0,0 +1,67 @@
+from pipeline.token_store import TokenStore
+
+
+def token(address, symbol):
+    return {"address": address, "symbol": symbol}
+
+
+USDC = token("0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48", "USDC")
+DAI = token("0x6B175474E89094C44Da98b954EedeAC495271d0F", "DAI")
+WETH = token("0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2", "WETH")
+
+
+def entry(chain_id, tokens, name="Chain"):
+    return {"chainId": chain_id, "name": name, "tokens": tokens}
+
+
+def test_round_trips_the_list_format():
+    token_details = [entry("1", [USDC, DAI], "Ethereum"), entry("10", [WETH])]
+    store = TokenStore(token_details)
+
+    assert store.to_list() == token_details
+    assert "1" in store and "137" not in store
+    assert len(store) == 2
+
+
+def test_tokens_of_an_unknown_chain_are_empty():
+    assert TokenStore().tokens("1") == []
+
+
+def test_upsert_deduplicates_addresses_case_insensitively_last_wins():
+    renamed = token(USDC["address"].lower(), "USDC.e")
+    store = TokenStore([entry("1", [USDC, DAI, renamed])])
+
+    # the duplicate replaces the first token in its position
+    assert store.tokens("1") == [renamed, DAI]
+
+
+def test_upsert_replaces_the_whole_chain():
+    store = TokenStore([entry("1", [USDC, DAI], "Ethereum")])
+    store.upsert_chain(entry("1", [WETH], "Mainnet"))
+
+    assert store.to_list() == [entry("1", [WETH], "Mainnet")]
+
+
+def test_merge_replaces_and_appends_tokens():
+    store = TokenStore([entry("1", [USDC, DAI], "Ethereum")])
+    manual_usdc = token("0x" + USDC["address"][2:].upper(), "USDC")
+    manual_usdc["logoURI"] = "https://example.com/usdc.png"
+    store.merge_chain({"chainId": "1", "tokens": [manual_usdc, WETH]})
+
+    # the existing entry keeps its fields, the manual token keeps the position
+    assert store.to_list() == [entry("1", [manual_usdc, DAI, WETH], "Ethereum")]
+
+
+def test_merge_adds_an_unknown_chain():
+    store = TokenStore([entry("1", [USDC])])
+    store.merge_chain(entry("10", [WETH]))
+
+    assert [chain["chainId"] for chain in store.to_list()] == ["1", "10"]
+    assert store.tokens("10") == [WETH]
+
+
+def test_retain_drops_other_chains_and_keeps_order():
+    store = TokenStore([entry("1", [USDC]), entry("10", [WETH]), entry("137", [DAI])])
+    store.retain({"137": {}, "1": {}})
+
+    assert [chain["chainId"] for chain in store.to_list()] == ["1", "137"]
@@ -0,0 +1,131 @@
+import pytest
+
+from benchmarks.fixtures import RPC_SCHEME, Fixtures
+from benchmarks.mock_upstream import MockUpstream
+from pipeline import token_verify
+from pipeline.clients import Clients
+from pipeline.http_cache import HttpCache
+from pipeline.rate_limit import RequestScheduler
+
+USDC = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+DAI = "0x6b175474e89094c44da98b954eedeac495271d0f"
+OLD = "0x9f8f72aa9304c8b593d555f12ef6589cc3a579a2"
+BROKEN = "0x1111111111111111111111111111111111111111"
+NO_CODE = "0x2222222222222222222222222222222222222222"
+ERRORED = "0x3333333333333333333333333333333333333333"
+
+# what the stub node's contracts return
+ONCHAIN = {
+    USDC: {"decimals": 6, "symbol": "USDC", "name": "USD Coin"},
+    DAI: {"decimals": 18, "symbol": "DAI", "name": "Dai Stablecoin"},
+    OLD: {"decimals": 18, "symbol": "MKR", "name": "Maker"},
+    BROKEN: {"decimals": 18, "symbol": "BRK", "name": "Broken"},
+}
+
+
+class StubNode(MockUpstream):
+    """Answers OLD's symbol as a bytes32, BROKEN's name with odd-length hex and
+    ERRORED's eth_getCode with an rpc error."""
+
+    def rpc_result(self, chain_id, role, call):
+        if call["method"] == "eth_getCode" and call["params"][0] == ERRORED:
+            raise LookupError(call["method"])
+        if call["method"] == "eth_call":
+            to, data = call["params"][0]["to"], call["params"][0]["data"]
+            if to == OLD and data == "0x95d89b41":
+                return "0x" + b"MKR".ljust(32, b"\0").hex()
+            if to == BROKEN and data == "0x06fdde03":
+                return "0x123"
+        return super().rpc_result(chain_id, role, call)
+
+
+@pytest.fixture
+def node():
+    with StubNode(Fixtures({}, {}, {"1": ONCHAIN}), latency=0, jitter=0) as node:
+        yield node
+
+
+@pytest.fixture
+def clients(tmp_path):
+    # the dead rpc is given up on at once instead of retried with backoff
+    scheduler = RequestScheduler(rates={}, default_rate=(1000, 1000), max_retries=0)
+    return Clients(
+        cache=HttpCache(cache_dir=str(tmp_path), scheduler=scheduler),
+        scheduler=scheduler,
+    )
+
+
+def token(address, decimals, symbol, name):
+    return {"address": address, "decimals": decimals, "symbol": symbol, "name": name}
+
+
+def test_decodes_uints_strings_and_bytes32():
+    assert token_verify.decode_uint("0x" + (18).to_bytes(32, "big").hex()) == 18
+    assert token_verify.decode_uint("0x12") is None
+    bytes32 = "0x" + b"MKR".ljust(32, b"\0").hex()
+    assert token_verify.decode_string(bytes32) == "MKR"
+    encoded = (32).to_bytes(32, "big") + (3).to_bytes(32, "big")
+    assert token_verify.decode_string("0x" + (encoded + b"DAI").hex()) == "DAI"
+
+
+@pytest.mark.parametrize("result", ["0x123", "0xzz"])
+def test_decoding_invalid_hex_raises_value_error(result):
+    with pytest.raises(ValueError):
+        token_verify.decode_uint(result)
+    with pytest.raises(ValueError):
+        token_verify.decode_string(result)
+
+
+def test_reports_mismatches_non_contracts_and_unverifiable_tokens(node, clients):
+    rpcs = [
+        node.rpc_url(f"{RPC_SCHEME}0/1/dead"),
+        node.rpc_url(f"{RPC_SCHEME}1/1/live"),
+    ]
+    tokens = [
+        token(USDC, 18, "USDC", "USD Coin"),
+        token(DAI, "18", "DAI", "Dai"),
+        token(OLD, 18, "MKR", "Maker"),
+        token(BROKEN, 18, "BRK", "Broken"),
+        token(NO_CODE, 18, "NONE", "None"),
+        token(ERRORED, 18, "ERR", "Errored"),
+        token(token_verify.ZERO_ADDRESS, 18, "ETH", "Ether"),
+    ]
+
+    report = token_verify.verify_tokens(
+        {"1": {"rpc": rpcs}},
+        [{"chainId": "1", "tokens": tokens}],
+        batch_size=4,
+        clients=clients,
+    )["1"]
+
+    assert report["rpc"] == rpcs[1]
+    assert report["error"] is None
+    assert report["checked"] == 4
+    assert [
+        (m["address"], m["field"], m["listed"], m["onchain"])
+        for m in report["mismatches"]
+    ] == [
+        (USDC, "decimals", 18, 6),
+        (DAI, "name", "Dai", "Dai Stablecoin"),
+    ]
+    assert report["non_contracts"] == [{"address": NO_CODE, "symbol": "NONE"}]
+    assert [t["address"] for t in report["unverifiable"]] == [BROKEN, ERRORED]
+    assert "name returned '0x123'" in report["unverifiable"][0]["error"]
+    assert "eth_getCode failed" in report["unverifiable"][1]["error"]
+    assert "Method not found" in report["unverifiable"][1]["error"]
+    assert token_verify.has_errors({"1": report})
+
+
+def test_token_left_out_of_the_batch_answer_is_unverifiable(monkeypatch, clients):
+    # an rpc answering only part of a batch still leaves the token in the report
+    monkeypatch.setattr(token_verify, "rpc_batch", lambda *_, **__: {})
+    report = token_verify.verify_tokens(
+        {"1": {"rpc": ["https://rpc.example"]}},
+        [{"chainId": "1", "tokens": [token(USDC, 6, "USDC", "USD Coin")]}],
+        batch_size=4,
+        clients=clients,
+    )["1"]
+
+    assert report["checked"] == 0
+    assert [t["address"] for t in report["unverifiable"]] == [USDC]
+    assert "no answer in the batch" in report["unverifiable"][0]["error"]
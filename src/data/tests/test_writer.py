@@ -0,0 +1,39 @@
+import os
+import stat
+
+import pytest
+
+from pipeline import writer
+
+
+def test_write_atomic_creates_world_readable_files(tmp_path):
+    path = tmp_path / "data" / "file.json"
+    writer.write_atomic(str(path), "ünïcode")
+
+    assert path.read_text(encoding="utf-8") == "ünïcode"
+    assert stat.S_IMODE(os.stat(path).st_mode) == writer.FILE_MODE
+
+
+def test_atomic_file_keeps_the_old_file_on_error(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("old")
+
+    with pytest.raises(RuntimeError):
+        with writer.atomic_file(str(path), "w") as f:
+            f.write("partial")
+            raise RuntimeError
+
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["file.txt"]
+
+
+def test_write_json_artifact_skips_unchanged_files(tmp_path):
+    path = str(tmp_path / "data.json")
+    build_dir = str(tmp_path / "build")
+
+    first = writer.write_json_artifact(path, {"10": 1, "2": 2}, build_dir=build_dir)
+    second = writer.write_json_artifact(path, {"2": 2, "10": 1}, build_dir=build_dir)
+
+    assert all(row["written"] for row in first)
+    assert not any(row["written"] for row in second)
+    assert stat.S_IMODE(os.stat(path).st_mode) == writer.FILE_MODE